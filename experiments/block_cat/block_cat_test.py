@@ -0,0 +1,55 @@
+""" Purpose: Check the design in block_cat.h5 against its rules:
+        -Each trial follows the study-list template A B C D D D E F G D D D H I J, i.e. the
+         block category fills positions 4-6 and 10-12 and the other 9 positions have
+         distinct categories different from the block category
+        -No category repeats between consecutive trials
+        -Specific word that is cued does not get repeated, it is ok if category is repeated across cues
+
+    All rules are checked at once over the full design (see validate_design.py), and any
+    violations are printed as a table. A human-readable trial summary is written for the
+    subjects in `report_subjects` and for every subject with a violation.
+"""
+import time
+
+from block_cat import BLOCK_LAYOUT
+from helpers import load_data
+from validate_design import validate_design, write_trial_summary
+
+design_path = "experiments/block_cat/block_cat.h5"
+stimulus_pool_path = "experiments/block_cat/assets/cuefr_pool.txt"
+stimulus_labels_path = "experiments/block_cat/assets/cuefr_labels.txt"
+category_pool_path = "experiments/block_cat/assets/cuefr_category_pool.txt"
+summary_path = "experiments/block_cat/trial_summary.txt"
+
+# subjects to list in trial_summary.txt; subjects with violations are always included
+report_subjects: list[int] = [0]
+
+data = load_data(design_path)
+
+# Load stimulus text pool, the label (category) of each word, and the category labels
+with open(stimulus_pool_path) as f:
+    stimulus_pool = [line.strip() for line in f]
+with open(stimulus_labels_path) as f:
+    aggregated_stimulus_labels = [line.strip() for line in f]
+with open(category_pool_path) as f:
+    labels = [line.strip() for line in f]
+
+start = time.perf_counter()
+violations = validate_design(data, aggregated_stimulus_labels, labels, BLOCK_LAYOUT)
+elapsed_ms = (time.perf_counter() - start) * 1000
+
+trial_count = len(data["subject"])
+print(f"Checked {trial_count} trials in {elapsed_ms:.1f} ms")
+if violations.empty:
+    print("No violations found")
+else:
+    print(violations.groupby("rule").size().to_string())
+    print(violations.to_string(index=False))
+
+write_trial_summary(
+    summary_path,
+    data,
+    stimulus_pool,
+    aggregated_stimulus_labels,
+    sorted(set(report_subjects) | set(violations["subject"].tolist())),
+)
@@ -0,0 +1,109 @@
+"""Analytic capacity planning for category stimulus pools.
+
+Sizes a design from pool sizes alone, before any study list is generated: how many trials
+each subject can get, how hard each category's pool is drawn on, and how often items are
+expected to recur across subjects.
+"""
+
+import numpy as np
+import pandas as pd
+from helpers import schedule_is_feasible
+
+
+def max_feasible_trials(capacities: np.ndarray, set_size: int) -> int | None:
+    """Find the most trials a subject can get with consecutive trials category-disjoint.
+
+    Args:
+        capacities: Number of trials each category can be used in.
+        set_size: Number of distinct categories each trial needs.
+
+    Returns:
+        The maximum feasible trial count, or None if unlimited.
+    """
+    capacities = np.asarray(capacities)
+    if not np.isfinite(capacities).all():
+        # unlimited pools: only the number of categories matters
+        category_count = len(capacities)
+        if category_count >= 2 * set_size:
+            return None
+        return 1 if category_count >= set_size else 0
+
+    # every trial uses up `set_size` capacity, which bounds the search
+    low, high = 0, int(capacities.sum()) // set_size
+    while low < high:
+        trials = (low + high + 1) // 2
+        if schedule_is_feasible(trials, set_size, capacities.astype(np.int64)):
+            low = trials
+        else:
+            high = trials - 1
+    return low
+
+
+def plan_capacity(
+    labels: list[str],
+    pool_sizes: list[int],
+    layout: np.ndarray,
+    trial_count: int,
+    subject_count: int,
+    cues_per_subject: int,
+    depleting: bool = True,
+) -> tuple[dict[str, float | int | None], pd.DataFrame]:
+    """Report how a design spec loads the stimulus pools, without generating it.
+
+    Expectations assume categories are scheduled uniformly at random, as
+    `schedule_categories` does when capacities are not binding.
+
+    Args:
+        labels: Category labels, in pool order.
+        pool_sizes: Number of stimuli in each category pool.
+        layout: Compiled study-list layout (see `compile_layout`).
+        trial_count: Number of trials per subject.
+        subject_count: Number of subjects.
+        cues_per_subject: Number of cued recall events per subject.
+        depleting: Whether drawn stimuli are removed from a subject's pools for later trials.
+
+    Returns:
+        A tuple containing:
+        - Summary with 'max_trials' (None if unlimited), 'feasible', 'list_length',
+          'categories_per_trial', and the largest 'draw_pressure' and 'expected_reuse'.
+        - One row per category with its pool size, capacity (trials it can be used in), and
+          per-subject 'expected_draws', 'draw_pressure' (fraction of the pool drawn),
+          'cue_pressure' (cued items per pool item), and 'expected_reuse' (expected
+          presentations of each item across all subjects).
+    """
+    pool_sizes = np.asarray(pool_sizes, dtype=np.int64)
+    list_length = len(layout)
+    set_size = int(layout.max()) + 1
+    slot_size = int(np.bincount(layout).max())
+
+    if depleting:
+        capacities = (pool_sizes // slot_size).astype(float)
+    else:
+        capacities = np.where(pool_sizes >= slot_size, np.inf, 0.0)
+    max_trials = max_feasible_trials(capacities, set_size)
+
+    # each trial spreads list_length draws over the categories, uniformly in expectation
+    category_count = len(pool_sizes)
+    expected_draws = np.full(category_count, trial_count * list_length / category_count)
+    expected_cues = np.full(category_count, cues_per_subject / category_count)
+    pressure = pd.DataFrame(
+        {
+            "category": labels,
+            "pool_size": pool_sizes,
+            "capacity": capacities,
+            "expected_draws": expected_draws,
+            "draw_pressure": expected_draws / pool_sizes,
+            "cue_pressure": expected_cues / pool_sizes,
+            "expected_reuse": subject_count * expected_draws / pool_sizes,
+        }
+    )
+
+    summary = {
+        "max_trials": max_trials,
+        "feasible": max_trials is None or max_trials >= trial_count,
+        "list_length": list_length,
+        "categories_per_trial": set_size,
+        "draw_pressure": float(pressure["draw_pressure"].max()),
+        "expected_reuse": float(pressure["expected_reuse"].max()),
+    }
+    return summary, pressure
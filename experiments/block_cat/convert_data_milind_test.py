@@ -0,0 +1,38 @@
+""" Purpose: Check that build_embam_arrays keeps the design subject of every trial:
+        -A `subjectId` past the int16 range (as in designs of 32768 or more subjects) is
+         stored exactly instead of overflowing
+        -Trials recorded without a `subjectId` are marked -1
+
+    Run with pytest, or as a script from the repository root.
+"""
+import numpy as np
+
+from convert_data_milind import build_embam_arrays
+
+word_pool = ["APPLE", "PEAR", "TRUCK", "BOAT"]
+cat_pool = ["FRUIT", "VEHICLE"]
+
+
+def participant(subject_id: int | None) -> list[dict]:
+    """Record one study list of two words and their free recall."""
+    study = {
+        "trial_type": "item-presentation",
+        "word_list": ["APPLE", "TRUCK"],
+        "category_list": ["FRUIT", "VEHICLE"],
+    }
+    if subject_id is not None:
+        study["subjectId"] = subject_id
+    return [study, {"recall_words": ["TRUCK", "APPLE"]}]
+
+
+def test_large_design_subject():
+    participants_data = [participant(40000), participant(7), participant(None)]
+    data = build_embam_arrays(participants_data, word_pool, cat_pool, threshold=1)
+    assert data["design_subject"].ravel().tolist() == [40000, 7, -1]
+    assert np.iinfo(data["design_subject"].dtype).max >= 40000
+    assert data["recalls"][0].tolist() == [2, 1]
+
+
+if __name__ == "__main__":
+    test_large_design_subject()
+    print("ok")
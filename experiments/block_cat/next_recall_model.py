@@ -0,0 +1,299 @@
+"""Logistic model of which item is recalled next, fit directly on EMBAM arrays.
+
+This replaces the `block_test.csv` export and `block_cued_next_recall_logistic_regression.r`.
+Each transition between consecutive correct recalls contributes one row per candidate: every
+studied position not yet recalled. A candidate is 'Chosen' if it was recalled next, and is
+described by its distance from the just-recalled item ('AbsLag'), whether it shares that
+item's category ('SameCat') and its distance from the end of the list ('DistFromEnd'). The
+table keeps the column names of `block_test.csv`, so it can still be handed to R.
+
+The design matrix is stored in a fixed-width sparse layout: every row has one slot per
+model term holding a (column, value) pair. Subject fixed effects then cost one slot rather
+than a column per subject, and the IRLS fit forms X'WX and X'z with bincounts over slot
+pairs, so it scales to pooled data without a dense matrix or any dependency beyond NumPy.
+
+Run as a script to fit the block-cued first-transition model of the R script:
+
+    python experiments/block_cat/next_recall_model.py
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+from helpers import load_data
+from recall_analysis import valid_recalls
+
+PREDICTORS = ("AbsLag", "SameCat", "DistFromEnd")
+
+
+def cue_trial_types(category_cues: np.ndarray, pres_categoryids: np.ndarray) -> np.ndarray:
+    """Label trials by how many studied items share the first category cue.
+
+    Args:
+        category_cues: Category ID cued at each recall event, one row per trial.
+        pres_categoryids: Category ID of each studied item, one row per trial.
+
+    Returns:
+        'control' (no studied item in the cued category), 'isolate' (one) or 'block' (more)
+        for each trial.
+    """
+    matches = (pres_categoryids == category_cues[:, :1]).sum(axis=1)
+    return np.array(["control", "isolate", "block"])[np.minimum(matches, 2)]
+
+
+def block_success_groups(
+    target_success: np.ndarray, trial_types: np.ndarray, recalls: np.ndarray
+) -> np.ndarray:
+    """Group successfully cued block trials by where their first recall was studied.
+
+    Args:
+        target_success: Whether each recall event recalled the cued category.
+        trial_types: Trial labels from `cue_trial_types`.
+        recalls: Recalled serial positions, one row per trial.
+
+    Returns:
+        1 if the first correct recall was studied at positions 4-6, 2 if at 10-12, and 0 for
+        other trials and trials that are not successfully cued blocks.
+    """
+    recalls = np.asarray(recalls)
+    has_recall = (recalls > 0).any(axis=1)
+    first = np.where(has_recall, recalls[np.arange(len(recalls)), (recalls > 0).argmax(axis=1)], 0)
+    successful_block = target_success[:, 0].astype(bool) & (trial_types == "block")
+    groups = np.select([(first >= 4) & (first <= 6), (first >= 10) & (first <= 12)], [1, 2], 0)
+    return np.where(successful_block, groups, 0)
+
+
+def transition_table(
+    data: dict[str, np.ndarray],
+    trial_mask: np.ndarray | None = None,
+    first_only: bool = False,
+) -> pd.DataFrame:
+    """List every candidate of every recall transition, vectorized over all trials.
+
+    Intrusions and repeats are dropped first, so a transition links each correct recall to
+    the next correct recall of the same trial.
+
+    Args:
+        data: EMBAM data with 'subject', 'block', 'listLength', 'recalls',
+            'rec_categoryids' and 'pres_categoryids'.
+        trial_mask: Trials to include; all trials by default.
+        first_only: Only use the transition out of each trial's first correct recall.
+
+    Returns:
+        One row per (transition, candidate) with 'Subject', 'Trial', 'Output' (1-indexed
+        transition number), 'JustPos', 'CandPos', 'Chosen', 'AbsLag', 'SameCat' and
+        'DistFromEnd'.
+    """
+    recalls = np.asarray(data["recalls"], dtype=np.int64)
+    categories = np.asarray(data["pres_categoryids"], dtype=np.int64)
+    list_length = categories.shape[1]
+    trial_count = len(recalls)
+    if trial_mask is None:
+        trial_mask = np.ones(trial_count, dtype=bool)
+
+    # move each trial's correct, non-repeated recalls to the front, keeping their order
+    valid = valid_recalls(recalls, list_length)
+    order = np.argsort(~valid, axis=1, kind="stable")
+    compact = np.where(
+        np.take_along_axis(valid, order, axis=1), np.take_along_axis(recalls, order, axis=1), 0
+    )
+    compact_categories = np.take_along_axis(
+        np.asarray(data["rec_categoryids"], dtype=np.int64), order, axis=1
+    )
+    valid_count = valid.sum(axis=1)
+
+    # output index at which each position was recalled (beyond the last output if never)
+    rows = np.arange(trial_count)[:, np.newaxis]
+    recalled_at = np.full((trial_count, list_length + 1), recalls.shape[1])
+    outputs = np.broadcast_to(np.arange(recalls.shape[1]), recalls.shape)
+    recalled_at[rows, compact] = np.where(compact > 0, outputs, recalls.shape[1])
+
+    last_output = 1 if first_only else recalls.shape[1] - 1
+    trials, steps = np.nonzero(
+        (np.arange(last_output) < valid_count[:, np.newaxis] - 1) & trial_mask[:, np.newaxis]
+    )
+    positions = np.arange(1, list_length + 1)
+    available = recalled_at[trials, 1:] > steps[:, np.newaxis]
+    transition, candidate = np.nonzero(available)
+    trial, step, cand_pos = trials[transition], steps[transition], positions[candidate]
+    just_pos = compact[trial, step]
+
+    return pd.DataFrame(
+        {
+            "Subject": data["subject"][trial, 0],
+            "Trial": data["block"][trial, 0],
+            "Output": step + 1,
+            "JustPos": just_pos,
+            "CandPos": cand_pos,
+            "Chosen": cand_pos == compact[trial, step + 1],
+            "AbsLag": np.abs(cand_pos - just_pos),
+            "SameCat": categories[trial, cand_pos - 1] == compact_categories[trial, step],
+            "DistFromEnd": data["listLength"][trial, 0] + 1 - cand_pos,
+        }
+    )
+
+
+def design_matrix(
+    table: pd.DataFrame,
+    predictors: tuple[str, ...] = PREDICTORS,
+    subject_effects: bool = False,
+) -> dict[str, object]:
+    """Build the sparse design matrix of an intercept, the predictors and subject effects.
+
+    Args:
+        table: Candidate rows from `transition_table`.
+        predictors: Columns of `table` to use as covariates.
+        subject_effects: Add a fixed effect per subject, coded against the first subject.
+
+    Returns:
+        Dictionary with 'columns' (term names), 'indices' and 'values' (one (row, slot)
+        array each, giving the column and value held in every slot) and 'shape'.
+    """
+    row_count = len(table)
+    columns = ["(Intercept)", *predictors]
+    indices = [np.zeros(row_count, dtype=np.int64)]
+    values = [np.ones(row_count)]
+    for column, predictor in enumerate(predictors, start=1):
+        indices.append(np.full(row_count, column))
+        values.append(table[predictor].to_numpy(dtype=np.float64))
+
+    if subject_effects:
+        subjects, codes = np.unique(table["Subject"].to_numpy(), return_inverse=True)
+        # the reference subject's slot points at the intercept with a zero value
+        indices.append(np.where(codes > 0, len(columns) + codes - 1, 0))
+        values.append((codes > 0).astype(np.float64))
+        columns.extend(f"Subject{subject}" for subject in subjects[1:])
+
+    return {
+        "columns": columns,
+        "indices": np.stack(indices, axis=1),
+        "values": np.stack(values, axis=1),
+        "shape": (row_count, len(columns)),
+    }
+
+
+def _multiply(design: dict[str, object], coefficients: np.ndarray) -> np.ndarray:
+    """Compute X @ coefficients."""
+    return (design["values"] * coefficients[design["indices"]]).sum(axis=1)
+
+
+def _cross_products(
+    design: dict[str, object], weights: np.ndarray, response: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Compute X'WX and X'r by summing over pairs of slots."""
+    column_count = design["shape"][1]
+    indices, values = design["indices"], design["values"]
+    slots = indices.shape[1]
+    hessian = np.zeros(column_count * column_count)
+    gradient = np.zeros(column_count)
+    for first in range(slots):
+        weighted = weights * values[:, first]
+        gradient += np.bincount(
+            indices[:, first], weights=values[:, first] * response, minlength=column_count
+        )
+        for second in range(slots):
+            hessian += np.bincount(
+                indices[:, first] * column_count + indices[:, second],
+                weights=weighted * values[:, second],
+                minlength=column_count * column_count,
+            )
+    return hessian.reshape(column_count, column_count), gradient
+
+
+def _deviance(outcome: np.ndarray, probability: np.ndarray) -> float:
+    """Binomial deviance of 0/1 outcomes."""
+    with np.errstate(divide="ignore"):
+        likelihood = np.where(outcome, probability, 1 - probability)
+    return float(-2 * np.log(np.maximum(likelihood, np.finfo(float).tiny)).sum())
+
+
+def fit_logistic(
+    design: dict[str, object],
+    outcome: np.ndarray,
+    max_iterations: int = 25,
+    tolerance: float = 1e-8,
+) -> tuple[pd.DataFrame, dict[str, float]]:
+    """Fit a logistic regression by iteratively reweighted least squares.
+
+    Args:
+        design: Sparse design matrix from `design_matrix`.
+        outcome: 0/1 outcome of each row.
+        max_iterations: Newton steps to take at most.
+        tolerance: Stop once the relative change in deviance falls below this.
+
+    Returns:
+        A tuple containing:
+        - One row per term with its 'estimate', 'std_error', Wald 'z' and 'p_value', and
+          the 'vif' of each predictor (computed, like R's `car::vif`, from the correlation
+          of the predictor coefficients' covariance; missing for other terms).
+        - Fit statistics: 'deviance', 'null_deviance', 'aic', 'observations',
+          'iterations' and 'converged'.
+    """
+    outcome = np.asarray(outcome, dtype=np.float64)
+    coefficients = np.zeros(design["shape"][1])
+    deviance = np.inf
+    converged = False
+    for iteration in range(1, max_iterations + 1):
+        probability = 1 / (1 + np.exp(-_multiply(design, coefficients)))
+        hessian, gradient = _cross_products(
+            design, probability * (1 - probability), outcome - probability
+        )
+        coefficients = coefficients + np.linalg.solve(hessian, gradient)
+        probability = 1 / (1 + np.exp(-_multiply(design, coefficients)))
+        previous, deviance = deviance, _deviance(outcome, probability)
+        if abs(previous - deviance) <= tolerance * (abs(deviance) + 0.1):
+            converged = True
+            break
+
+    hessian, _ = _cross_products(design, probability * (1 - probability), outcome)
+    covariance = np.linalg.inv(hessian)
+    std_error = np.sqrt(np.diag(covariance))
+    z = coefficients / std_error
+    table = pd.DataFrame(
+        {
+            "term": design["columns"],
+            "estimate": coefficients,
+            "std_error": std_error,
+            "z": z,
+            "p_value": [math.erfc(abs(value) / math.sqrt(2)) for value in z],
+        }
+    )
+
+    predictors = [
+        column
+        for column, name in enumerate(design["columns"])
+        if name != "(Intercept)" and not name.startswith("Subject")
+    ]
+    table["vif"] = np.nan
+    if len(predictors) > 1:
+        block = covariance[np.ix_(predictors, predictors)]
+        scale = np.sqrt(np.diag(block))
+        table.loc[predictors, "vif"] = np.diag(np.linalg.inv(block / np.outer(scale, scale)))
+
+    mean = outcome.mean()
+    summary = {
+        "deviance": deviance,
+        "null_deviance": _deviance(outcome, np.full(len(outcome), mean)),
+        "aic": deviance + 2 * len(coefficients),
+        "observations": len(outcome),
+        "iterations": iteration,
+        "converged": converged,
+    }
+    return table, summary
+
+
+if __name__ == "__main__":
+    embam_data_path = "experiments/block_cat/2025_04_10_block_cat.h5"
+    data = load_data(embam_data_path)
+
+    # the transition out of the first recall of successfully cued block trials
+    trial_types = cue_trial_types(data["category_cues"], data["pres_categoryids"])
+    groups = block_success_groups(data["target_success"], trial_types, data["recalls"])
+    table = transition_table(data, trial_mask=groups > 0, first_only=True)
+
+    coefficients, summary = fit_logistic(design_matrix(table), table["Chosen"])
+    print("--- Logistic Regression Results ---")
+    print(coefficients.to_string(index=False))
+    for key, value in summary.items():
+        print(f"{key}: {value}")
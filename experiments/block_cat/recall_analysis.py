@@ -0,0 +1,377 @@
+"""Free recall analyses computed directly on EMBAM arrays.
+
+These mirror psifr's `spc`, `pnr` (first output), `lag_crp`, `category_crp`, `distance_crp`
+and `lag_rank`/`distance_rank`, but work on the 'recalls', 'rec_itemids' and
+'pres_categoryids' matrices without building a long table. Work is done on
+whole arrays at once, stepping only over output positions, and results are summed per
+group with bincounts. Groups are the distinct values of trial-level fields (the first
+column of each), e.g. `by=("subject", "condition")`.
+
+Recalls are 1-indexed serial positions; 0 is padding and negative values are intrusions.
+As in psifr, a transition counts only when both recalls are correct and neither repeats an
+earlier recall, and a lag is possible only if the item at that position has not been
+recalled yet.
+
+Semantic measures take a similarity matrix indexed by item ID, such as
+`was_store.pool_similarity`; pairs with a NaN similarity are left out.
+"""
+
+from typing import Callable, Iterator
+
+import numpy as np
+import pandas as pd
+
+
+def group_trials(
+    data: dict[str, np.ndarray], by: tuple[str, ...]
+) -> tuple[np.ndarray, pd.DataFrame]:
+    """Number the groups formed by trial-level fields.
+
+    Args:
+        data: Data in EMBAM format.
+        by: Fields to group by; the first column of each is used.
+
+    Returns:
+        A tuple containing the group code of each trial and the field values of each group.
+    """
+    trial_count = len(data["recalls"])
+    if not by:
+        return np.zeros(trial_count, dtype=np.int64), pd.DataFrame(index=[0])
+    keys = np.stack([np.asarray(data[field])[:, 0] for field in by], axis=1)
+    group_keys, codes = np.unique(keys, axis=0, return_inverse=True)
+    return codes.ravel(), pd.DataFrame(group_keys, columns=by)
+
+
+def _group_sums(codes: np.ndarray, values: np.ndarray, group_count: int) -> np.ndarray:
+    """Sum (trial, column) values into (group, column) totals."""
+    columns = values.shape[1]
+    flat = (codes[:, np.newaxis] * columns + np.arange(columns)).ravel()
+    return np.bincount(flat, weights=values.ravel(), minlength=group_count * columns).reshape(
+        group_count, columns
+    )
+
+
+def _long_table(
+    group_keys: pd.DataFrame, key: str, key_values: np.ndarray, **columns: np.ndarray
+) -> pd.DataFrame:
+    """Lay out (group, key) tables as one row per group and key value."""
+    group_count, width = len(group_keys), len(key_values)
+    table = group_keys.loc[np.repeat(group_keys.index, width)].reset_index(drop=True)
+    table[key] = np.tile(key_values, group_count)
+    for name, values in columns.items():
+        table[name] = np.asarray(values).ravel()
+    return table
+
+
+def valid_recalls(recalls: np.ndarray, list_length: int) -> np.ndarray:
+    """Mark correct recalls that do not repeat an earlier recall of the same trial."""
+    recalls = np.asarray(recalls, dtype=np.int64)
+    correct = (recalls > 0) & (recalls <= list_length)
+    positions = np.where(correct, recalls, 0)
+    # a recall is a repeat if the same position appears earlier in the row
+    earlier = (positions[:, :, np.newaxis] == positions[:, np.newaxis, :]) & np.tri(
+        recalls.shape[1], k=-1, dtype=bool
+    )
+    return correct & ~earlier.any(axis=2)
+
+
+def spc(data: dict[str, np.ndarray], by: tuple[str, ...] = ("subject",)) -> pd.DataFrame:
+    """Compute the serial position curve: the probability each position is recalled.
+
+    Args:
+        data: Data in EMBAM format with 'recalls' and 'pres_itemids'.
+        by: Trial-level fields to group by.
+
+    Returns:
+        One row per group and 'input' position with the 'recall' probability.
+    """
+    recalls = np.asarray(data["recalls"], dtype=np.int64)
+    list_length = data["pres_itemids"].shape[1]
+    codes, group_keys = group_trials(data, by)
+
+    valid = valid_recalls(recalls, list_length)
+    recalled = np.zeros((len(recalls), list_length + 1), dtype=bool)
+    recalled[np.arange(len(recalls))[:, np.newaxis], np.where(valid, recalls, 0)] = True
+    totals = _group_sums(codes, recalled[:, 1:], len(group_keys))
+    trials = np.bincount(codes, minlength=len(group_keys))[:, np.newaxis]
+    return _long_table(
+        group_keys, "input", np.arange(1, list_length + 1), recall=totals / trials
+    )
+
+
+def pfr(data: dict[str, np.ndarray], by: tuple[str, ...] = ("subject",)) -> pd.DataFrame:
+    """Compute the probability of first recall at each serial position.
+
+    The first correct recall of each trial counts as its first output, so trials opening
+    with an intrusion still contribute.
+
+    Args:
+        data: Data in EMBAM format with 'recalls' and 'pres_itemids'.
+        by: Trial-level fields to group by.
+
+    Returns:
+        One row per group and 'input' position with the 'prob' of recalling it first.
+    """
+    recalls = np.asarray(data["recalls"], dtype=np.int64)
+    list_length = data["pres_itemids"].shape[1]
+    codes, group_keys = group_trials(data, by)
+
+    valid = valid_recalls(recalls, list_length)
+    has_recall = valid.any(axis=1)
+    first = recalls[np.arange(len(recalls)), valid.argmax(axis=1)]
+    first_recalls = np.zeros((len(recalls), list_length + 1))
+    first_recalls[np.flatnonzero(has_recall), first[has_recall]] = 1
+    totals = _group_sums(codes, first_recalls[:, 1:], len(group_keys))
+    trials = np.bincount(codes, minlength=len(group_keys))[:, np.newaxis]
+    return _long_table(group_keys, "input", np.arange(1, list_length + 1), prob=totals / trials)
+
+
+def _transitions(
+    recalls: np.ndarray, list_length: int
+) -> Iterator[tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """Yield, per output step, the trials with a valid transition and what was available.
+
+    Yields:
+        Tuples of (output index, trial rows, previous position, next position, availability
+        mask over positions 1..list_length), all restricted to trials with a valid
+        transition out of that output.
+    """
+    valid = valid_recalls(recalls, list_length)
+    trial_count = len(recalls)
+    rows = np.arange(trial_count)
+    recalled = np.zeros((trial_count, list_length + 1), dtype=bool)
+    for output in range(recalls.shape[1] - 1):
+        current = np.where(valid[:, output], recalls[:, output], 0)
+        recalled[rows, current] = True
+        step = np.flatnonzero(valid[:, output] & valid[:, output + 1])
+        available = ~recalled[step, 1:]
+        yield output, step, recalls[step, output], recalls[step, output + 1], available
+
+
+def lag_crp(data: dict[str, np.ndarray], by: tuple[str, ...] = ("subject",)) -> pd.DataFrame:
+    """Compute the lag conditional response probability with availability masking.
+
+    Args:
+        data: Data in EMBAM format with 'recalls' and 'pres_itemids'.
+        by: Trial-level fields to group by.
+
+    Returns:
+        One row per group and 'lag' with the transition 'prob' and the 'actual' and
+        'possible' transition counts it is computed from.
+    """
+    recalls = np.asarray(data["recalls"], dtype=np.int64)
+    list_length = data["pres_itemids"].shape[1]
+    codes, group_keys = group_trials(data, by)
+    lag_count = 2 * list_length - 1
+    positions = np.arange(1, list_length + 1)
+
+    actual = np.zeros(len(group_keys) * lag_count)
+    possible = np.zeros(len(group_keys) * lag_count)
+    for _, step, previous, following, available in _transitions(recalls, list_length):
+        base = codes[step] * lag_count + list_length - 1
+        actual += np.bincount(base + following - previous, minlength=len(actual))
+        lags = base[:, np.newaxis] + positions - previous[:, np.newaxis]
+        possible += np.bincount(lags[available], minlength=len(possible))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        prob = actual / possible
+    return _long_table(
+        group_keys,
+        "lag",
+        np.arange(-(list_length - 1), list_length),
+        prob=prob,
+        actual=actual,
+        possible=possible,
+    )
+
+
+def category_crp(data: dict[str, np.ndarray], by: tuple[str, ...] = ("subject",)) -> pd.DataFrame:
+    """Compute the probability of a same-category transition when one is available.
+
+    Args:
+        data: Data in EMBAM format with 'recalls', 'pres_itemids' and 'pres_categoryids'.
+        by: Trial-level fields to group by.
+
+    Returns:
+        One row per group with the same-category transition 'prob' and the 'actual'
+        same-category transitions and 'possible' transitions where a not-yet-recalled item
+        shared the category of the last recall.
+    """
+    recalls = np.asarray(data["recalls"], dtype=np.int64)
+    categories = np.asarray(data["pres_categoryids"], dtype=np.int64)
+    list_length = data["pres_itemids"].shape[1]
+    codes, group_keys = group_trials(data, by)
+
+    actual = np.zeros(len(group_keys))
+    possible = np.zeros(len(group_keys))
+    for _, step, previous, following, available in _transitions(recalls, list_length):
+        trial_categories = categories[step]
+        previous_category = trial_categories[np.arange(len(step)), previous - 1]
+        same = trial_categories == previous_category[:, np.newaxis]
+        could = (same & available).any(axis=1)
+        did = trial_categories[np.arange(len(step)), following - 1] == previous_category
+        possible += np.bincount(codes[step], weights=could, minlength=len(group_keys))
+        actual += np.bincount(codes[step], weights=did & could, minlength=len(group_keys))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        prob = actual / possible
+    table = group_keys.copy()
+    table["prob"], table["actual"], table["possible"] = prob, actual, possible
+    return table
+
+
+def semantic_crp(
+    data: dict[str, np.ndarray],
+    similarity: np.ndarray,
+    edges: np.ndarray,
+    by: tuple[str, ...] = ("subject",),
+) -> pd.DataFrame:
+    """Compute the conditional response probability by similarity to the last recall.
+
+    Args:
+        data: Data in EMBAM format with 'recalls', 'rec_itemids' and 'pres_itemids'.
+        similarity: Similarity of each pair of item IDs.
+        edges: Increasing edges of the similarity bins; similarities outside them are left
+            out.
+        by: Trial-level fields to group by.
+
+    Returns:
+        One row per group and similarity 'bin' (0-indexed) with the bin's 'center', the
+        transition 'prob' and the 'actual' and 'possible' transition counts.
+    """
+    recalls = np.asarray(data["recalls"], dtype=np.int64)
+    items = np.asarray(data["pres_itemids"], dtype=np.int64)
+    rec_items = np.asarray(data["rec_itemids"], dtype=np.int64)
+    list_length = items.shape[1]
+    codes, group_keys = group_trials(data, by)
+    edges = np.asarray(edges, dtype=np.float64)
+    bin_count = len(edges) - 1
+
+    def bins(values: np.ndarray) -> np.ndarray:
+        """Bin similarities, with -1 for NaN and values outside the edges."""
+        index = np.searchsorted(edges, values, side="right") - 1
+        index[values == edges[-1]] = bin_count - 1
+        return np.where(np.isnan(values) | (index < 0) | (index >= bin_count), -1, index)
+
+    actual = np.zeros(len(group_keys) * bin_count)
+    possible = np.zeros(len(group_keys) * bin_count)
+    for output, step, _, _, available in _transitions(recalls, list_length):
+        previous_items = rec_items[step, output]
+        chosen = bins(similarity[previous_items, rec_items[step, output + 1]])
+        candidates = bins(similarity[previous_items[:, np.newaxis], items[step]])
+        # transitions to an item without a similarity cannot be placed in any bin
+        scored = chosen >= 0
+        base = codes[step][scored] * bin_count
+        actual += np.bincount(base + chosen[scored], minlength=len(actual))
+        counted = available[scored] & (candidates[scored] >= 0)
+        candidate_bins = base[:, np.newaxis] + candidates[scored]
+        possible += np.bincount(candidate_bins[counted], minlength=len(possible))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        prob = actual / possible
+    return _long_table(
+        group_keys,
+        "bin",
+        np.arange(bin_count),
+        center=np.tile((edges[:-1] + edges[1:]) / 2, len(group_keys)),
+        prob=prob,
+        actual=actual,
+        possible=possible,
+    )
+
+
+def _percentile_ranks(
+    chosen: np.ndarray, candidates: np.ndarray, available: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Rank each chosen score among the available candidate scores, higher being closer.
+
+    Ties count half, so the score is 1 when the chosen candidate was the closest available,
+    0 when it was the farthest, and 0.5 on average under random choice.
+
+    Returns:
+        A tuple containing the percentile rank of each transition and whether it could be
+        ranked (a score for the chosen item and at least one other candidate).
+    """
+    chosen = chosen[:, np.newaxis]
+    counted = available & ~np.isnan(candidates)
+    below = (counted & (candidates < chosen)).sum(axis=1)
+    ties = (counted & (candidates == chosen)).sum(axis=1)
+    others = counted.sum(axis=1) - 1
+    rankable = ~np.isnan(chosen[:, 0]) & (ties >= 1) & (others >= 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ranks = (below + 0.5 * (ties - 1)) / others
+    return np.where(rankable, ranks, np.nan), rankable
+
+
+def _trial_mean_ranks(
+    data: dict[str, np.ndarray],
+    score: Callable[..., tuple[np.ndarray, np.ndarray]],
+) -> np.ndarray:
+    """Average the percentile ranks of each trial's transitions.
+
+    `score(output, trial rows, previous position, next position)` returns the score of each
+    chosen transition and of every candidate position.
+    """
+    recalls = np.asarray(data["recalls"], dtype=np.int64)
+    list_length = data["pres_itemids"].shape[1]
+    totals = np.zeros(len(recalls))
+    counts = np.zeros(len(recalls))
+    for output, step, previous, following, available in _transitions(recalls, list_length):
+        chosen, candidates = score(output, step, previous, following)
+        ranks, rankable = _percentile_ranks(chosen, candidates, available)
+        totals += np.bincount(step[rankable], weights=ranks[rankable], minlength=len(recalls))
+        counts += np.bincount(step[rankable], minlength=len(recalls))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return totals / counts
+
+
+def temporal_factor(data: dict[str, np.ndarray]) -> np.ndarray:
+    """Compute the temporal factor score of each trial.
+
+    Each transition is scored by the percentile rank of its absolute lag among the lags
+    still available, with shorter lags ranking higher, and the scores are averaged.
+
+    Args:
+        data: Data in EMBAM format with 'recalls' and 'pres_itemids'.
+
+    Returns:
+        The score of each trial, NaN for trials without a rankable transition.
+    """
+    positions = np.arange(1, data["pres_itemids"].shape[1] + 1)
+
+    def score(
+        output: int, step: np.ndarray, previous: np.ndarray, following: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # negate distances so that closer lags score higher
+        candidates = -np.abs(positions - previous[:, np.newaxis]).astype(np.float64)
+        return -np.abs(following - previous).astype(np.float64), candidates
+
+    return _trial_mean_ranks(data, score)
+
+
+def semantic_factor(data: dict[str, np.ndarray], similarity: np.ndarray) -> np.ndarray:
+    """Compute the semantic factor score of each trial.
+
+    Each transition is scored by the percentile rank of the similarity between successive
+    recalls among the similarities of the items still available, and the scores are
+    averaged.
+
+    Args:
+        data: Data in EMBAM format with 'recalls', 'rec_itemids' and 'pres_itemids'.
+        similarity: Similarity of each pair of item IDs.
+
+    Returns:
+        The score of each trial, NaN for trials without a rankable transition.
+    """
+    items = np.asarray(data["pres_itemids"], dtype=np.int64)
+    rec_items = np.asarray(data["rec_itemids"], dtype=np.int64)
+
+    def score(
+        output: int, step: np.ndarray, previous: np.ndarray, following: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        previous_items = rec_items[step, output]
+        chosen = similarity[previous_items, rec_items[step, output + 1]]
+        candidates = similarity[previous_items[:, np.newaxis], items[step]]
+        return chosen.astype(np.float64), candidates.astype(np.float64)
+
+    return _trial_mean_ranks(data, score)
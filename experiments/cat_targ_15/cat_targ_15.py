@@ -15,12 +15,41 @@
 # ---
 
 # %%
-import copy
 import itertools
 import random
+from typing import Iterator
 
 import numpy as np
-from helpers import load_data, load_stimulus_pool, save_data
+from capacity_planner import plan_capacity
+from design_metrics import design_metrics, write_metrics_report
+from helpers import (
+    compile_layout,
+    counterbalance_orders,
+    design_is_cached,
+    design_provenance,
+    draw_least_exposed,
+    embam_dtype,
+    fill_layout,
+    item_neighbors,
+    load_data,
+    load_stimulus_pool,
+    schedule_categories,
+    similarity_neighbors,
+    stream_data,
+)
+from was_store import align_similarity, file_digest, load_was_matrix
+
+# Study-list layout: every position gets its own category.
+LIST_LAYOUT = compile_layout("ABCDE FGHIJ KLMNO")
+
+# Recall events of each trial (2 per trial; 1-indexed cued position, 0 for none). Every
+# subject gets each of these once, in a counterbalanced order.
+RECALL_CUE_TYPES = np.array(
+    # control
+    [[0, 0]] * 5
+    # isolate
+    + [[2, 0], [5, 0], [8, 0], [11, 0], [14, 0]] * 2
+)
 
 # %%
 def aggregate_stimulus_pools(
@@ -56,27 +85,40 @@ def aggregate_stimulus_pools(
         stimulus_labels.extend([label] * len(pool))
     return stimulus_pool, stimulus_labels
 
-def generate_recall_cue_indices() -> list[list[int]]:
+
+# %%
+def index_stimulus_pool(aggregated_stimulus_pool: list[str]) -> dict[str, int]:
+    """Map each stimulus to its 1-indexed ID in the aggregated pool.
+
+    Args:
+        aggregated_stimulus_pool: The aggregated stimulus pool.
+
+    Returns:
+        Dictionary from stimulus to ID; a repeated stimulus keeps the ID of its first occurrence.
     """
-    Generate recall-event indices for each trial (2 events per trial) under the new design.
+    stimulus_ids: dict[str, int] = {}
+    for index, stimulus in enumerate(aggregated_stimulus_pool):
+        stimulus_ids.setdefault(stimulus, index + 1)
+    return stimulus_ids
+
+def generate_recall_cue_indices(subject_count: int) -> np.ndarray:
+    """Order each subject's trial types from one precomputed counterbalancing table.
+
+    Orders come from a Williams design over the trials in `RECALL_CUE_TYPES`, so across each
+    cycle of subjects every trial type appears equally often at every serial position and
+    after every other type.
+
     Args:
-        trial_count: Total number of trials.
+        subject_count: Number of subjects.
 
     Returns:
-        A list (length = trial_count) of lists (each of length 2):
+        Array of shape (subject_count, trial_count, 2) of recall-event indices:
           - For control trials => [0, 0]
           - For isolate-target => [some position in {2, 5, 8, 11, 14}, 0]
     """
-
-    # let's directly define trial types by retrieval cues
-    trial_types = (
-        # control
-        [[0, 0]] * 5
-        # isolate
-        + [[2,0], [5,0], [8,0], [11,0], [14,0]] * 2
-    )
-    random.shuffle(trial_types)
-    return trial_types
+    order_table = counterbalance_orders(len(RECALL_CUE_TYPES))
+    subject_orders = order_table[np.arange(subject_count) % len(order_table)]
+    return RECALL_CUE_TYPES[subject_orders]
 
 # %%
 def retrieve_cue_target_items(
@@ -92,7 +134,8 @@ def retrieve_cue_target_items(
         An array containing the stimulus IDs corresponding to the category cues.
     """
     num_trials, cue_count = cat_cue_indices.shape
-    category_targets = np.zeros_like(cat_cue_indices)  # shape: (trial_count, 2)
+    # shape: (trial_count, 2)
+    category_targets = np.zeros(cat_cue_indices.shape, dtype=pres_itemids.dtype)
 
     for i, j in itertools.product(range(num_trials), range(cue_count)):
         index = cat_cue_indices[i, j]
@@ -102,31 +145,17 @@ def retrieve_cue_target_items(
 
     return category_targets
 
-# %%
-def validate_stimulus_pool_size(
-    labels: list[str], stimulus_pools: list[list[str]], trial_count: int
-) -> None:
-    """Ensure that each stimulus pool has enough items to handle the number of trials.
-
-    Args:
-        labels: The list of category labels.
-        stimulus_pools: The list of stimulus pools corresponding to each label.
-        trial_count: The total number of trials each subject will participate in.
-
-    Raises:
-        AssertionError: If a category does not have enough stimuli to support the required number of trials.
-    """
-    for label_index, _ in enumerate(labels):
-        assert len(stimulus_pools[label_index]) >= (trial_count / 2), (
-            f"Not enough stimuli in pool for label: {labels[label_index]}"
-        )
-
 # %%
 def sample_stimuli_for_trial(
     labels: list[str],
-    subject_stimulus_pools: list[list[str]],
-    last_trial_label_indices: np.ndarray,
+    category_item_ids: list[np.ndarray],
+    drawn: np.ndarray,
+    slot_categories: np.ndarray,
+    cued_positions: np.ndarray,
+    presentation_counts: np.ndarray,
+    cue_counts: np.ndarray,
     aggregated_stimulus_pool: list[str],
+    neighbors: tuple[np.ndarray, np.ndarray] | None = None,
 ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
     Samples stimuli for a trial with a fixed study-list structure:
@@ -138,19 +167,29 @@ def sample_stimuli_for_trial(
       - There is no block-structure, all words are of unique categories.
     
     The function:
-      1. Selects 15 distinct categories from `labels` (preferring those not used in the previous trial)
-        to serve as the category label for each list-item.
-      2. Fills a 15-element trial template:
+      1. Takes the 15 distinct categories scheduled for the trial (none used in the previous
+        trial) to serve as the category label for each list-item.
+      2. Fills the 15-element trial from the compiled `LIST_LAYOUT` in one assignment:
          - All indices get a unique category.
-      3. For each position, a stimulus is drawn (and removed) from the corresponding
-         subject_stimulus_pools. The aggregated_stimulus_pool is used to determine the
-         1-indexed stimulus ID.
+      3. For each position, the stimulus of its category presented least often across subjects
+         so far (at cued positions, the one least often used as a cue target) is drawn and
+         marked as studied for the rest of the subject's trials.
+         With a similarity `neighbors` index, stimuli too similar to one already in the trial
+         are only drawn when every remaining stimulus of the category is, preferring those
+         with the fewest such neighbors.
     
     Args:
         labels: List of all category labels.
-        subject_stimulus_pools: List of stimulus pools for each label (order matches `labels`).
-        last_trial_label_indices: 1D array of label indices used in the previous trial.
-        aggregated_stimulus_pool: Aggregated list of all stimuli (used for lookup of stimulus IDs).
+        category_item_ids: IDs of the stimuli in each category pool (order matches `labels`).
+        drawn: Boolean mask of stimulus IDs the subject has already studied; updated in place.
+        slot_categories: Distinct label indices scheduled for this trial (see
+            `schedule_categories`), one per slot of `LIST_LAYOUT`, in random order.
+        cued_positions: Boolean mask of study positions that will be cue targets.
+        presentation_counts: Presentations of each stimulus ID across subjects so far.
+        cue_counts: Cue-target uses of each stimulus ID across subjects so far.
+        aggregated_stimulus_pool: Aggregated list of all stimuli.
+        neighbors: Index from `similarity_neighbors` of the stimuli too similar to appear in
+            a trial together, or None to ignore similarity.
         
     Returns:
         A tuple of three numpy arrays:
@@ -158,54 +197,33 @@ def sample_stimuli_for_trial(
           - stimulus_strings: (15,) array of the stimulus strings.
           - trial_label_indices: (15,) array of the label indices assigned to each study position.
     """
-    TOTAL_POSITIONS = 15
-    # Fixed positions (0-indexed)
-    positions = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]
-
-    # We need 10 distinct categories => 1 for block, 9 for non-block
-    num_needed = 15
-    all_label_indices = np.arange(len(labels))
-
-    # Prefer categories not used in the previous trial
-    preferred = [idx for idx in all_label_indices if idx not in last_trial_label_indices]
-    if len(preferred) >= num_needed:
-        candidate_pool = preferred
-    else:
-        candidate_pool = list(all_label_indices)
-
-    chosen = random.sample(candidate_pool, num_needed)
-    categories = [cat for cat in chosen]
-    # Shuffle the 9 non-block categories.
-    random.shuffle(categories)
-
-    # Build trial label indices according to the fixed template.
-    trial_label_indices = [None] * TOTAL_POSITIONS
-    for pos, cat in zip(positions, categories):
-        trial_label_indices[pos] = cat
-
-    # Now, for each position, pop a stimulus from the corresponding subject's pool.
-    stimulus_ids = np.zeros(TOTAL_POSITIONS, dtype=int)
-    stimulus_strings = np.empty(TOTAL_POSITIONS, dtype=object)
-    trial_subject_stimulus_pools = copy.deepcopy(subject_stimulus_pools)
+    trial_label_indices = fill_layout(slot_categories, LIST_LAYOUT)
 
+    # Now, for each position, draw (and remove) the least-exposed stimulus of its category.
+    trial_stimulus_ids = np.zeros(len(LIST_LAYOUT), dtype=int)
+    stimulus_strings = np.empty(len(LIST_LAYOUT), dtype=object)
+    # how many stimuli already in the trial each stimulus is too similar to
+    conflicts = np.zeros(len(drawn), dtype=np.int64)
     for pos, cat_idx in enumerate(trial_label_indices):
-        pool = subject_stimulus_pools[cat_idx]
-        if len(pool) == 0:
+        candidate_ids = category_item_ids[cat_idx]
+        candidate_ids = candidate_ids[~drawn[candidate_ids]]
+        if len(candidate_ids) == 0:
             raise ValueError(f"Stimulus pool for label {labels[cat_idx]} is empty.")
 
-        stim = pool.pop(random.randrange(len(pool)))  # remove random stimulus
-
-        try:
-            stim_id = aggregated_stimulus_pool.index(stim) + 1
-        except ValueError as e:
-            raise ValueError(f"Stimulus {stim} not found in aggregated pool.") from e
-        stimulus_ids[pos] = stim_id
-        stimulus_strings[pos] = stim
+        exposures = (cue_counts, presentation_counts) if cued_positions[pos] else (presentation_counts,)
+        if neighbors is not None:
+            exposures = (conflicts, *exposures)
+        stim_id = candidate_ids[draw_least_exposed(candidate_ids, *exposures)]
+        drawn[stim_id] = True
+        if neighbors is not None:
+            conflicts[item_neighbors(neighbors, stim_id)] += 1
+        trial_stimulus_ids[pos] = stim_id
+        stimulus_strings[pos] = aggregated_stimulus_pool[stim_id - 1]
 
     return (
-        stimulus_ids,
+        trial_stimulus_ids,
         stimulus_strings,
-        np.array(trial_label_indices)
+        trial_label_indices
     )
 # %%
 def assign_cue_stimuli(
@@ -239,72 +257,204 @@ def assign_cue_stimuli(
 
 # %%
 
+def construct_subject_lists(
+    labels: list[str],
+    stimulus_pools: list[list[str]],
+    trial_count: int,
+    aggregated_stimulus_pool: list[str],
+    recall_index_arrays: np.ndarray,
+    presentation_counts: np.ndarray,
+    cue_counts: np.ndarray,
+    neighbors: tuple[np.ndarray, np.ndarray] | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Construct one subject's study lists according to design of cued / free recall experiment.
+
+    Args:
+        labels: Category labels for each stimulus in the stimulus pool.
+        stimulus_pools: The stimulus pools corresponding to each label; not modified.
+        trial_count: The number of trials per subject.
+        aggregated_stimulus_pool: The aggregated stimulus pool.
+        recall_index_arrays: Recall-event indices of each trial of the subject (see
+            `generate_recall_cue_indices`).
+        presentation_counts: Presentations of each stimulus ID across subjects so far; updated
+            in place.
+        cue_counts: Cue-target uses of each stimulus ID across subjects so far; updated in place.
+        neighbors: Similarity index passed to `sample_stimuli_for_trial`, or None.
+
+    Returns:
+        A tuple containing, with one row per trial of the subject:
+        - An array of stimulus IDs for each presentation (1-indexed into the aggregated pool).
+        - An array of stimulus IDs for the category cues.
+        - An array of serial position indices for the category cues.
+    """
+    list_length = 15
+    # Now we only want 2 recall events (e.g., [cue, -1]) or [-1, -1]
+    total_recalls = 2  
+
+    item_dtype = embam_dtype("pres_itemids", max_value=len(aggregated_stimulus_pool))
+    pres_itemids = np.zeros((trial_count, list_length), dtype=item_dtype)
+    category_cues = np.zeros((trial_count, total_recalls), dtype=item_dtype)
+    cat_cue_indices = np.zeros(
+        (trial_count, total_recalls),
+        dtype=embam_dtype("category_cue_indices", max_value=list_length),
+    )
+
+    stimulus_ids = index_stimulus_pool(aggregated_stimulus_pool)
+    category_item_ids = [np.array([stimulus_ids[stim] for stim in pool]) for pool in stimulus_pools]
+    drawn = np.zeros(len(aggregated_stimulus_pool) + 1, dtype=bool)
+
+    # Each slot draws its stimuli without replacement, so a category can fill as many trials as
+    # its pool has room for
+    slot_size = np.bincount(LIST_LAYOUT).max()
+    category_schedule = schedule_categories(
+        trial_count,
+        LIST_LAYOUT.max() + 1,
+        [len(pool) // slot_size for pool in stimulus_pools],
+    )
+
+    for t in range(trial_count):
+        trial_cue_array = recall_index_arrays[t]
+        cued_positions = np.zeros(len(LIST_LAYOUT), dtype=bool)
+        cued_positions[[index - 1 for index in trial_cue_array if index != 0]] = True
+
+        trial_stim_ids, trial_stim_strs, trial_label_indices = sample_stimuli_for_trial(
+            labels,
+            category_item_ids,
+            drawn,
+            category_schedule[t],
+            cued_positions,
+            presentation_counts,
+            cue_counts,
+            aggregated_stimulus_pool,
+            neighbors,
+        )
+
+        # add trial to study lists
+        pres_itemids[t, :] = trial_stim_ids
+
+        # Assign the single category cue (if any)
+        trial_category_cues, trial_cat_cue_indices = assign_cue_stimuli(
+            t, trial_cue_array, pres_itemids, total_recalls
+        )
+        category_cues[t, :] = trial_category_cues
+        cat_cue_indices[t, :] = trial_cat_cue_indices
+
+        # Record exposures so later draws favor under-used stimuli
+        presentation_counts[trial_stim_ids] += 1
+        cue_counts[trial_category_cues[trial_category_cues > 0]] += 1
+
+    return pres_itemids, category_cues, cat_cue_indices
+
+# %%
+
 def construct_study_lists(
     labels: list[str],
     stimulus_pools: list[list[str]],
     trial_count: int,
     subject_count: int,
     aggregated_stimulus_pool: list[str],
-) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    neighbors: tuple[np.ndarray, np.ndarray] | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     """Construct study lists according to design of cued / free recall experiment.
 
+    Stimulus exposure is balanced across subjects as in `generate_subject_blocks`.
+
     Args:
         labels: Category labels for each stimulus in the stimulus pool.
         stimulus_pools: The stimulus pools corresponding to each label.
         trial_count: The number of trials per subject.
         subject_count: The number of subjects.
-        list_length: The number of presentations per trial.
         aggregated_stimulus_pool: The aggregated stimulus pool.
+        neighbors: Similarity index passed to `sample_stimuli_for_trial`, or None.
 
     Returns:
         A tuple containing:
-        - An array of stimulus IDs for each presentation (1-indexed).
-        - An array of stimulus strings for each presentation (1-indexed).
+        - An array of stimulus IDs for each presentation (1-indexed into the aggregated pool).
         - An array of stimulus IDs for the category cues.
         - An array of serial position indices for the category cues.
         - An array of stimulus IDs for the category cue targets.
     """
-    list_length = 15
-    # Now we only want 2 recall events (e.g., [cue, -1]) or [-1, -1]
-    total_recalls = 2  
+    # Exposure counters shared across subjects, indexed by stimulus ID
+    presentation_counts = np.zeros(len(aggregated_stimulus_pool) + 1, dtype=np.int64)
+    cue_counts = np.zeros(len(aggregated_stimulus_pool) + 1, dtype=np.int64)
+    recall_index_arrays = generate_recall_cue_indices(subject_count)
+
+    subject_lists = [
+        construct_subject_lists(
+            labels,
+            stimulus_pools,
+            trial_count,
+            aggregated_stimulus_pool,
+            recall_index_arrays[s],
+            presentation_counts,
+            cue_counts,
+            neighbors,
+        )
+        for s in range(subject_count)
+    ]
+    pres_itemids, category_cues, cat_cue_indices = (
+        np.concatenate(arrays) for arrays in zip(*subject_lists)
+    )
 
-    # Allocate arrays to store all subjects x trials
-    pres_itemids = np.zeros((trial_count * subject_count, list_length), dtype=int)
-    pres_itemstrs = np.zeros((trial_count * subject_count, list_length), dtype=object)
-    category_cues = np.zeros((trial_count * subject_count, total_recalls), dtype=int)
-    cat_cue_indices = np.zeros((trial_count * subject_count, total_recalls), dtype=int)
+    cat_cue_itemids = retrieve_cue_target_items(cat_cue_indices, pres_itemids)
+    return pres_itemids, category_cues, cat_cue_indices, cat_cue_itemids
 
-    for s in range(subject_count):
-        subject_stimulus_pools = copy.deepcopy(stimulus_pools)
-        last_trial_label_indices = np.array([])
+# %%
 
-        # Generate the new 2-element recall arrays
-        recall_index_arrays = generate_recall_cue_indices()
-        validate_stimulus_pool_size(labels, subject_stimulus_pools, trial_count)
+def generate_subject_blocks(
+    labels: list[str],
+    stimulus_pools: list[list[str]],
+    trial_count: int,
+    subject_count: int,
+    aggregated_stimulus_pool: list[str],
+    neighbors: tuple[np.ndarray, np.ndarray] | None = None,
+) -> Iterator[dict[str, np.ndarray]]:
+    """Yield the design one subject at a time in EMBAM format, for use with `stream_data`.
 
-        for t in range(trial_count):
-            trial_stim_ids, trial_stim_strs, last_trial_label_indices = sample_stimuli_for_trial(
-                labels,
-                subject_stimulus_pools,
-                last_trial_label_indices,
-                aggregated_stimulus_pool,
-            )
+    Presentation and cue-target counts carry over from subject to subject, so each subject's
+    draws favor the stimuli earlier subjects saw least.
 
-            # add trial to study lists
-            trial_index = s * trial_count + t
-            pres_itemids[trial_index, :] = trial_stim_ids
-            pres_itemstrs[trial_index, :] = trial_stim_strs
+    Args:
+        labels: Category labels for each stimulus in the stimulus pool.
+        stimulus_pools: The stimulus pools corresponding to each label.
+        trial_count: The number of trials per subject.
+        subject_count: The number of subjects.
+        aggregated_stimulus_pool: The aggregated stimulus pool.
+        neighbors: Similarity index passed to `sample_stimuli_for_trial`, or None.
 
-            # Assign the single category cue (if any)
-            trial_cue_array = recall_index_arrays[t]
-            trial_category_cues, trial_cat_cue_indices = assign_cue_stimuli(
-                trial_index, trial_cue_array, pres_itemids, total_recalls
-            )
-            category_cues[trial_index, :] = trial_category_cues
-            cat_cue_indices[trial_index, :] = trial_cat_cue_indices
+    Yields:
+        EMBAM dictionary holding the `trial_count` rows of one subject.
+    """
+    subject_dtype = embam_dtype("subject", max_value=subject_count)
 
-    cat_cue_itemids = retrieve_cue_target_items(cat_cue_indices, pres_itemids)
-    return pres_itemids, pres_itemstrs, category_cues, cat_cue_indices, cat_cue_itemids
+    # Exposure counters shared across subjects, indexed by stimulus ID
+    presentation_counts = np.zeros(len(aggregated_stimulus_pool) + 1, dtype=np.int64)
+    cue_counts = np.zeros(len(aggregated_stimulus_pool) + 1, dtype=np.int64)
+    recall_index_arrays = generate_recall_cue_indices(subject_count)
+
+    for s in range(subject_count):
+        pres_itemids, category_cues, cat_cue_indices = construct_subject_lists(
+            labels,
+            stimulus_pools,
+            trial_count,
+            aggregated_stimulus_pool,
+            recall_index_arrays[s],
+            presentation_counts,
+            cue_counts,
+            neighbors,
+        )
+        list_length = pres_itemids.shape[1]
+        yield {
+            "subject": np.full((trial_count, 1), s, dtype=subject_dtype),
+            "listLength": np.full((trial_count, 1), list_length, dtype=embam_dtype("listLength")),
+            "pres_itemnos": np.tile(
+                np.arange(1, list_length + 1, dtype=embam_dtype("pres_itemnos")), (trial_count, 1)
+            ),
+            "pres_itemids": pres_itemids,
+            "category_cues": category_cues,
+            "category_cue_indices": cat_cue_indices,
+            "category_cue_itemids": retrieve_cue_target_items(cat_cue_indices, pres_itemids),
+        }
 
 # %%
 if __name__ == "__main__":
@@ -327,12 +477,31 @@ if __name__ == "__main__":
     total_recalls = 2
     # 40% of trials are "control" => [-1, -1].
 
+    # Seeds both random and np.random, so the design is reproducible from its provenance
+    seed = 0
+    # Report pool capacity and stop before generating
+    plan_only = False
+    # Cap on the WAS similarity between items of different categories in one list; None
+    # ignores similarity. The PEERS WAS matrix does not ship with `wasnorm_wordpool.txt`,
+    # so set `was_matrix_path` to it before setting a cap.
+    similarity_cap = None
+    was_wordpool_path = "experiments/cat_targ_15/assets/wasnorm_wordpool.txt"
+    was_matrix_path = None
+
     target_data_path = "experiments/cat_targ_15/cat_targ_15.h5"
     target_stimulus_pool_path = "experiments/cat_targ_15/assets/cuefr_pool.txt"
     target_stimulus_labels_path = "experiments/cat_targ_15/assets/cuefr_labels.txt"
     target_category_pool_path = "experiments/cat_targ_15/assets/cuefr_category_pool.txt"
+    target_metrics_path = "experiments/cat_targ_15/cat_targ_15_metrics.json"
+    target_metrics_html_path = "experiments/cat_targ_15/cat_targ_15_metrics.html"
     source_pools_path = "experiments/cat_targ_15/assets/asymfr"
 
+    if similarity_cap is not None and was_matrix_path is None:
+        raise ValueError(
+            "similarity_cap needs a WAS matrix: set was_matrix_path to the matrix ordered by "
+            f"{was_wordpool_path}, or set similarity_cap to None."
+        )
+
     # construct stimulus pool across specified category labels
     labels = [
         "birds",
@@ -379,51 +548,89 @@ if __name__ == "__main__":
         stimulus_pools, labels
     )
 
-    (
-        pres_itemids,
-        pres_itemstrs,
-        category_cues,
-        category_cue_indices,
-        category_cue_itemids,
-    ) = construct_study_lists(
+    # size the design against the pools once, before sampling any subject
+    capacity, pool_pressure = plan_capacity(
         labels,
-        stimulus_pools,
+        [len(pool) for pool in stimulus_pools],
+        LIST_LAYOUT,
         trial_count,
         subject_count,
-        aggregated_stimulus_pool,
+        int((RECALL_CUE_TYPES > 0).sum()),
+        depleting=True,
     )
+    print(capacity)
+    if plan_only:
+        print(pool_pressure.to_string(index=False))
+        raise SystemExit(0)
+    if not capacity["feasible"]:
+        raise ValueError(
+            f"Pools support at most {capacity['max_trials']} trials per subject, not {trial_count}"
+        )
 
-    # Construct final data dict
-    result: dict[str, np.ndarray] = {
-        "subject": np.repeat(np.arange(subject_count), trial_count)[:, np.newaxis],
-        "listLength": np.repeat(list_length, subject_count * trial_count)[:, np.newaxis],
-        "pres_itemnos": np.tile(
-            np.arange(1, list_length + 1), (subject_count * trial_count, 1)
-        ),
-        "pres_itemids": pres_itemids,
-        # Now each trial has 2 recall events
-        "category_cues": category_cues,
-        "category_cue_indices": category_cue_indices,
-        "category_cue_itemids": category_cue_itemids,
+    design_parameters = {
+        "subject_count": subject_count,
+        "trial_count": trial_count,
+        "list_length": list_length,
+        "total_recalls": total_recalls,
+        "labels": labels,
     }
 
-    # Save results
-    save_data(result, target_data_path)
+    # Index the cross-category item pairs that may not share a list
+    neighbors = None
+    if similarity_cap is not None:
+        similarity = align_similarity(
+            load_was_matrix(was_wordpool_path, was_matrix_path),
+            load_stimulus_pool(was_wordpool_path),
+            aggregated_stimulus_pool,
+        )
+        neighbors = similarity_neighbors(
+            similarity, similarity_cap, np.array([""] + aggregated_stimulus_labels)
+        )
+        design_parameters["similarity_cap"] = similarity_cap
+        design_parameters["was_matrix"] = file_digest(was_matrix_path)
+
+    # key the design on its inputs; skip regeneration if the file already matches
+    provenance = design_provenance(design_parameters, stimulus_pools, seed, __file__)
+    if design_is_cached(target_data_path, provenance):
+        print(f"{target_data_path} is up to date (design {provenance['design_hash'][:12]})")
+    else:
+        random.seed(seed)
+        np.random.seed(seed)
 
-    # Basic sanity checks
-    loaded_result = load_data(target_data_path)
-    assert loaded_result["subject"].shape == (subject_count * trial_count, 1)
-    assert loaded_result["listLength"].shape == (subject_count * trial_count, 1)
-    assert loaded_result["pres_itemnos"].shape == (subject_count * trial_count, list_length)
-    assert loaded_result["pres_itemids"].shape == (subject_count * trial_count, list_length)
-    # Only 2 columns for cues:
-    assert loaded_result["category_cues"].shape == (subject_count * trial_count, 2)
-    assert loaded_result["category_cue_indices"].shape == (subject_count * trial_count, 2)
-    assert loaded_result["category_cue_itemids"].shape == (subject_count * trial_count, 2)
+        # Generate and save results one subject at a time
+        stream_data(
+            generate_subject_blocks(
+                labels,
+                stimulus_pools,
+                trial_count,
+                subject_count,
+                aggregated_stimulus_pool,
+                neighbors,
+            ),
+            target_data_path,
+            {
+                "items": aggregated_stimulus_pool,
+                "item_labels": aggregated_stimulus_labels,
+                "categories": labels,
+            },
+            dtypes={"subject": embam_dtype("subject", max_value=subject_count)},
+            attrs=provenance,
+        )
 
-    assert np.min(loaded_result["pres_itemids"]) == 1
-    assert np.max(loaded_result["pres_itemids"]) > list_length
-    assert np.min(loaded_result["pres_itemnos"]) == 1
+        # Basic sanity checks
+        loaded_result = load_data(target_data_path)
+        assert loaded_result["subject"].shape == (subject_count * trial_count, 1)
+        assert loaded_result["listLength"].shape == (subject_count * trial_count, 1)
+        assert loaded_result["pres_itemnos"].shape == (subject_count * trial_count, list_length)
+        assert loaded_result["pres_itemids"].shape == (subject_count * trial_count, list_length)
+        # Only 2 columns for cues:
+        assert loaded_result["category_cues"].shape == (subject_count * trial_count, 2)
+        assert loaded_result["category_cue_indices"].shape == (subject_count * trial_count, 2)
+        assert loaded_result["category_cue_itemids"].shape == (subject_count * trial_count, 2)
+
+        assert np.min(loaded_result["pres_itemids"]) == 1
+        assert np.max(loaded_result["pres_itemids"]) > list_length
+        assert np.min(loaded_result["pres_itemnos"]) == 1
 
     # Save stimulus pools and labels
     with open(target_stimulus_pool_path, "w") as f:
@@ -432,3 +639,12 @@ if __name__ == "__main__":
         f.write("\n".join(aggregated_stimulus_labels))
     with open(target_category_pool_path, "w") as f:
         f.write("\n".join(labels))
+
+    # Summarize how balanced the saved design is
+    metrics_summary, metrics_tables = design_metrics(
+        load_data(target_data_path), aggregated_stimulus_labels, labels
+    )
+    print(metrics_summary)
+    write_metrics_report(
+        target_metrics_path, metrics_summary, metrics_tables, target_metrics_html_path
+    )
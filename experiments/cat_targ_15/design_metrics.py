@@ -0,0 +1,219 @@
+"""Balance metrics for generated designs, computed from the saved EMBAM arrays.
+
+Every table comes from one pass of bincounts over whole arrays, so a design with thousands of
+subjects is summarized in well under a second. `write_metrics_report` stores the result as
+compact JSON (for diffing designs) and a browsable HTML page.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+from validate_design import item_category_ids, subject_trial_numbers
+
+
+def _counts(keys: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    """Count (row, column) index pairs into a dense table of the given shape."""
+    flat = np.ravel_multi_index(keys, shape)
+    return np.bincount(flat, minlength=shape[0] * shape[1]).reshape(shape)
+
+
+def _relative_spread(counts: np.ndarray, axis: int = 0) -> np.ndarray:
+    """Divide the range of counts along an axis by their mean, leaving 0 where all are 0."""
+    counts = np.asarray(counts, dtype=np.float64)
+    mean = counts.mean(axis=axis)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(mean > 0, np.ptp(counts, axis=axis) / mean, 0.0)
+
+
+def design_metrics(
+    data: dict[str, np.ndarray], item_labels: list[str], labels: list[str]
+) -> tuple[dict[str, float | int], dict[str, pd.DataFrame]]:
+    """Measure how evenly a design spreads positions, categories, items and trial types.
+
+    Args:
+        data: EMBAM design with 'subject', 'pres_itemids' and 'category_cue_indices'.
+        item_labels: Category label of each item in the aggregated pool.
+        labels: The category labels.
+
+    Returns:
+        A tuple containing:
+        - Summary counts and the largest imbalance in each table, both as a raw count and,
+          in the '*_relative_*' and 'item_cue_target_ratio' entries, relative to the mean
+          count it is measured against. Raw spreads grow with the number of trials and cues;
+          relative ones compare designs of different sizes.
+        - Tables keyed by name:
+          - 'cue_position': cued serial position (0 for none) by recall event.
+          - 'category_position': presentations of each category at each serial position.
+          - 'item_exposure': number of items presented (and cue-targeted) 0, 1, 2, ... times.
+          - 'trial_type_order': trials of each type (distinct cue-index row) at each trial
+            number.
+          - 'trial_type_transition': how often each type follows each other type.
+          - 'consecutive_overlap': consecutive trial pairs sharing 0, 1, 2, ... categories.
+    """
+    subject = data["subject"].ravel()
+    pres_itemids = data["pres_itemids"].astype(np.int64)
+    cue_indices = data["category_cue_indices"].astype(np.int64)
+    categories = item_category_ids(pres_itemids, item_labels, labels)
+    trial_numbers = subject_trial_numbers(subject)
+    same_subject = subject[1:] == subject[:-1]
+    trial_count, list_length = pres_itemids.shape
+    category_count = len(labels)
+
+    # cued serial position by recall event
+    events = np.broadcast_to(np.arange(cue_indices.shape[1]), cue_indices.shape)
+    cue_position = _counts(
+        (events.ravel(), cue_indices.ravel()), (cue_indices.shape[1], list_length + 1)
+    )
+
+    # category by serial position, skipping padding
+    presented = pres_itemids > 0
+    positions = np.broadcast_to(np.arange(list_length), pres_itemids.shape)
+    category_position = _counts(
+        (categories[presented] - 1, positions[presented]), (category_count, list_length)
+    )
+
+    # how often each pool item was presented and cue-targeted
+    presentations = np.bincount(pres_itemids[presented], minlength=len(item_labels) + 1)[1:]
+    cue_rows, cue_slots = np.nonzero(cue_indices > 0)
+    cue_targets = pres_itemids[cue_rows, cue_indices[cue_rows, cue_slots] - 1]
+    cue_uses = np.bincount(cue_targets, minlength=len(item_labels) + 1)[1:]
+    exposure_bins = max(presentations.max(), cue_uses.max()) + 1
+    item_exposure = np.stack(
+        [
+            np.bincount(presentations, minlength=exposure_bins),
+            np.bincount(cue_uses, minlength=exposure_bins),
+        ],
+        axis=1,
+    )
+
+    # spread of presentations among the items of each category
+    item_categories = item_category_ids(np.arange(1, len(item_labels) + 1), item_labels, labels)
+    most = np.zeros(category_count + 1, dtype=np.int64)
+    least = np.full(category_count + 1, presentations.max(), dtype=np.int64)
+    np.maximum.at(most, item_categories, presentations)
+    np.minimum.at(least, item_categories, presentations)
+    pool_counts = np.bincount(item_categories, minlength=category_count + 1)
+    in_pool = pool_counts > 0
+    category_means = (
+        np.bincount(item_categories, weights=presentations, minlength=category_count + 1)
+        / np.maximum(pool_counts, 1)
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        category_spreads = np.where(category_means > 0, (most - least) / category_means, 0.0)
+
+    # trial types are the distinct rows of cue indices
+    type_rows, trial_types = np.unique(cue_indices, axis=0, return_inverse=True)
+    trial_types = trial_types.ravel()
+    type_count = len(type_rows)
+    trial_type_order = _counts(
+        (trial_numbers - 1, trial_types), (trial_numbers.max(), type_count)
+    )
+    trial_type_transition = _counts(
+        (trial_types[:-1][same_subject], trial_types[1:][same_subject]), (type_count, type_count)
+    )
+
+    # categories shared by consecutive trials of a subject
+    present = np.zeros((trial_count, category_count + 1), dtype=bool)
+    present[np.arange(trial_count)[:, np.newaxis], categories] = True
+    present[:, 0] = False
+    overlap = (present[:-1] & present[1:]).sum(axis=1)[same_subject]
+    consecutive_overlap = np.bincount(overlap, minlength=1)
+
+    # cue counts at each serial position that is ever cued
+    cued_totals = cue_position[:, 1:].sum(axis=0)
+    cued_totals = cued_totals[cued_totals > 0]
+
+    type_names = [" ".join(map(str, row)) for row in type_rows]
+    tables = {
+        "cue_position": pd.DataFrame(
+            cue_position,
+            index=pd.Index(np.arange(1, cue_indices.shape[1] + 1), name="recall_event"),
+            columns=pd.Index(np.arange(list_length + 1), name="cued_position"),
+        ),
+        "category_position": pd.DataFrame(
+            category_position,
+            index=pd.Index(labels, name="category"),
+            columns=pd.Index(np.arange(1, list_length + 1), name="position"),
+        ),
+        "item_exposure": pd.DataFrame(
+            item_exposure,
+            index=pd.Index(np.arange(exposure_bins), name="times"),
+            columns=["presented", "cue_target"],
+        ),
+        "trial_type_order": pd.DataFrame(
+            trial_type_order,
+            index=pd.Index(np.arange(1, trial_numbers.max() + 1), name="trial"),
+            columns=pd.Index(type_names, name="cue_indices"),
+        ),
+        "trial_type_transition": pd.DataFrame(
+            trial_type_transition,
+            index=pd.Index(type_names, name="previous"),
+            columns=pd.Index(type_names, name="next"),
+        ),
+        "consecutive_overlap": pd.DataFrame(
+            {"trial_pairs": consecutive_overlap},
+            index=pd.Index(np.arange(len(consecutive_overlap)), name="shared_categories"),
+        ),
+    }
+
+    summary = {
+        "subjects": len(np.unique(subject)),
+        "trials": trial_count,
+        "list_length": list_length,
+        "trial_types": type_count,
+        "items_presented": int((presentations > 0).sum()),
+        "pool_size": len(item_labels),
+        "max_item_presentations": int(presentations.max()),
+        "max_item_cue_targets": int(cue_uses.max()),
+        "max_category_exposure_spread": int((most - least)[in_pool].max()),
+        "cue_position_spread": int(np.ptp(cued_totals)) if len(cued_totals) else 0,
+        "category_position_spread": int(np.ptp(category_position, axis=1).max()),
+        "trial_type_position_spread": int(np.ptp(trial_type_order, axis=0).max()),
+        "category_exposure_relative_spread": float(category_spreads[in_pool].max(initial=0.0)),
+        "cue_position_relative_spread": (
+            float(_relative_spread(cued_totals)) if len(cued_totals) else 0.0
+        ),
+        "trial_type_position_relative_spread": float(
+            _relative_spread(trial_type_order, axis=0).max(initial=0.0)
+        ),
+        "item_cue_target_ratio": (
+            float(cue_uses.max() / cue_uses.mean()) if cue_uses.any() else 0.0
+        ),
+        "max_consecutive_overlap": int(overlap.max(initial=0)),
+        "mean_consecutive_overlap": float(overlap.mean()) if len(overlap) else 0.0,
+    }
+    return summary, tables
+
+
+def write_metrics_report(
+    json_path: str,
+    summary: dict[str, float | int],
+    tables: dict[str, pd.DataFrame],
+    html_path: str | None = None,
+):
+    """Write design metrics as JSON and, optionally, as an HTML page.
+
+    Args:
+        json_path: The path to the JSON file; tables are stored in pandas' 'split' layout.
+        summary: Summary from `design_metrics`.
+        tables: Tables from `design_metrics`.
+        html_path: The path to the HTML file, if one is wanted.
+    """
+    report = {
+        "summary": summary,
+        "tables": {name: json.loads(table.to_json(orient="split")) for name, table in tables.items()},
+    }
+    with open(json_path, "w") as f:
+        json.dump(report, f, separators=(",", ":"))
+
+    if html_path is None:
+        return
+    sections = [
+        "<h2>summary</h2>",
+        pd.Series(summary, name="value").to_frame().to_html(),
+    ]
+    for name, table in tables.items():
+        sections += [f"<h2>{name}</h2>", table.to_html()]
+    with open(html_path, "w") as f:
+        f.write("<html><body>\n" + "\n".join(sections) + "\n</body></html>\n")
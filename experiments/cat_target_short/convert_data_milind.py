@@ -16,8 +16,10 @@
 
 # %%
 import json
+import os
 import numpy as np
-from helpers import load_stimulus_pool, load_data, save_data
+from helpers import embam_dtype, load_stimulus_pool, load_data, save_data
+from join_design import find_design_mismatches
 
 
 # %%
@@ -415,11 +417,203 @@ def retrieve_pres_itemids(
     return word_pool_indices
 
 
+# %%
+def index_pool(pool: list[str]) -> dict[str, int]:
+    """
+    Maps each entry in a stimulus or category pool to its 1-indexed position.
+
+    Repeated entries keep their first position, matching `list.index`.
+
+    Args:
+        pool: The complete list of entries in the pool.
+
+    Returns:
+        Dictionary from pool entry to its 1-indexed position.
+    """
+    pool_index = {}
+    for index, entry in enumerate(pool):
+        pool_index.setdefault(entry, index + 1)
+    return pool_index
+
+
+# %%
+def retrieve_trial_offsets(
+    participants_data: list[list[dict]],
+) -> tuple[np.ndarray, int, int, int, int]:
+    """
+    Counts item-presentation trials and per-trial field widths in a single cheap pass.
+
+    Args:
+        participants_data: List of lists of dictionaries, where each inner list contains recorded entries for a participant and trial.
+
+    Returns:
+        tuple: A tuple containing:
+            - Row offset of each participant's first trial, with the total trial count appended.
+            - The longest study list.
+            - The most recall words entered after a study list.
+            - The most category-cue events after a study list.
+            - The largest design `subjectId` recorded with a study list (-1 if none).
+    """
+    trial_counts = np.zeros(len(participants_data), dtype=np.int64)
+    list_length = recall_width = cue_width = 0
+    max_design_subject = -1
+    for participant_index, participant_data in enumerate(participants_data):
+        recall_count = cue_count = 0
+        for entry in participant_data:
+            if entry.get("trial_type") == "item-presentation":
+                trial_counts[participant_index] += 1
+                list_length = max(list_length, len(entry.get("word_list", [])))
+                max_design_subject = max(max_design_subject, entry.get("subjectId", -1))
+                recall_count = cue_count = 0
+                continue
+            if "recall_words" in entry:
+                recall_count += len(entry.get("recall_words", []))
+                recall_width = max(recall_width, recall_count)
+            if "category_cue" in entry:
+                cue_count += 1
+                cue_width = max(cue_width, cue_count)
+    trial_offsets = np.zeros(len(participants_data) + 1, dtype=np.int64)
+    np.cumsum(trial_counts, out=trial_offsets[1:])
+    return trial_offsets, list_length, recall_width, cue_width, max_design_subject
+
+
+# %%
+def build_embam_arrays(
+    participants_data: list[list[dict]],
+    word_pool: list[str],
+    cat_pool: list[str],
+    threshold: float,
+    include_intrusions: bool = False,
+) -> dict[str, np.ndarray]:
+    """
+    Fills preallocated EMBAM arrays for every item-presentation trial across all participants.
+
+    Trial rows are counted up front with `retrieve_trial_offsets`, so each array is allocated
+    once at its compact EMBAM dtype (see `helpers.EMBAM_DTYPES`) and filled in place instead of
+    being assembled from nested lists.
+    Recall events are attributed to the most recent study list, and recall-aligned fields are
+    zero-padded to at least the list length.
+
+    Args:
+        participants_data: List of lists of dictionaries, where each inner list contains recorded entries for a participant and trial.
+        word_pool: The complete list of words in the stimulus pool.
+        cat_pool: The complete list of category cues in the stimulus pool.
+        threshold: The maximum allowed distance for a match.
+        include_intrusions: Flag indicating whether to include intrusion items in the recall list. Defaults to False.
+
+    Returns:
+        Data in EMBAM format with 'subject', 'design_subject' (the `subjectId` of the design
+        subject shown, -1 if unrecorded), 'block', 'listLength', 'pres_itemids',
+        'pres_categoryids', 'pres_itemnos', 'category_cues', 'recalls', 'rec_itemids'
+        and 'rec_categoryids' fields.
+    """
+    trial_offsets, list_length, recall_width, cue_width, max_design_subject = (
+        retrieve_trial_offsets(participants_data)
+    )
+    trial_count = trial_offsets[-1]
+    recall_width = max(list_length, recall_width, cue_width)
+    word_index = index_pool(word_pool)
+    cat_index = index_pool(cat_pool)
+
+    max_trials = int(np.diff(trial_offsets).max(initial=0))
+    subject = np.zeros(
+        (trial_count, 1), dtype=embam_dtype("subject", max_value=len(participants_data))
+    )
+    design_subject = np.full(
+        (trial_count, 1),
+        -1,
+        dtype=embam_dtype("design_subject", signed=True, max_value=max_design_subject),
+    )
+    block = np.zeros((trial_count, 1), dtype=embam_dtype("block", max_value=max_trials))
+    item_dtype = embam_dtype("pres_itemids", max_value=len(word_pool))
+    category_dtype = embam_dtype("pres_categoryids", max_value=len(cat_pool))
+    pres_itemids = np.zeros((trial_count, list_length), dtype=item_dtype)
+    pres_categoryids = np.zeros((trial_count, list_length), dtype=category_dtype)
+    category_cues = np.zeros((trial_count, recall_width), dtype=category_dtype)
+    recalls = np.zeros(
+        (trial_count, recall_width),
+        dtype=embam_dtype("recalls", include_intrusions, max_value=list_length),
+    )
+    rec_itemids = np.zeros(
+        (trial_count, recall_width),
+        dtype=embam_dtype("rec_itemids", include_intrusions, max_value=len(word_pool)),
+    )
+    rec_categoryids = np.zeros(
+        (trial_count, recall_width),
+        dtype=embam_dtype("rec_categoryids", include_intrusions, max_value=len(cat_pool)),
+    )
+
+    filled_width = list_length
+    for participant_index, participant_data in enumerate(participants_data):
+        trial_index = trial_offsets[participant_index] - 1
+        study_items: list[str] = []
+        recall_count = cue_count = 0
+        for entry in participant_data:
+            if entry.get("trial_type") == "item-presentation":
+                trial_index += 1
+                subject[trial_index] = participant_index
+                design_subject[trial_index] = entry.get("subjectId", -1)
+                block[trial_index] = trial_index - trial_offsets[participant_index] + 1
+                study_items = [w.strip() for w in entry.get("word_list", [])]
+                for position, study_word in enumerate(study_items):
+                    assert study_word in word_index, f"Word {study_word} not found in word pool"
+                    pres_itemids[trial_index, position] = word_index[study_word]
+                for position, category in enumerate(entry.get("category_list", [])):
+                    pres_categoryids[trial_index, position] = cat_index[category.strip()]
+                recall_count = cue_count = 0
+                continue
+            if trial_index < trial_offsets[participant_index]:
+                continue
+            if "category_cue" in entry:
+                cue = entry.get("category_cue", "").strip()
+                category_cues[trial_index, cue_count] = cat_index[cue] if cue else 0
+                cue_count += 1
+            for recall_word in entry.get("recall_words", []):
+                index = match_recall_word(recall_word, study_items, threshold)
+                if index == -1 and not include_intrusions:
+                    continue
+                if index == -1:
+                    recalls[trial_index, recall_count] = -1
+                    rec_itemids[trial_index, recall_count] = -1
+                    rec_categoryids[trial_index, recall_count] = -1
+                else:
+                    recalls[trial_index, recall_count] = index + 1
+                    rec_itemids[trial_index, recall_count] = pres_itemids[trial_index, index]
+                    rec_categoryids[trial_index, recall_count] = pres_categoryids[
+                        trial_index, index
+                    ]
+                recall_count += 1
+            filled_width = max(filled_width, recall_count, cue_count)
+
+    return {
+        "subject": subject,
+        "design_subject": design_subject,
+        "block": block,
+        "listLength": np.full(
+            (trial_count, 1), list_length, dtype=embam_dtype("listLength", max_value=list_length)
+        ),
+        "pres_itemids": pres_itemids,
+        "pres_categoryids": pres_categoryids,
+        "pres_itemnos": np.tile(
+            np.arange(
+                1, list_length + 1, dtype=embam_dtype("pres_itemnos", max_value=list_length)
+            ),
+            (trial_count, 1),
+        ),
+        "category_cues": category_cues[:, :filled_width],
+        "recalls": recalls[:, :filled_width],
+        "rec_itemids": rec_itemids[:, :filled_width],
+        "rec_categoryids": rec_categoryids[:, :filled_width],
+    }
+
+
 # %%
 if __name__ == "__main__":
     jatos_data_path = "experiments/cat_target_short/pooled.jsonl"
     stimulus_pool_path = "experiments/cat_target_short/assets/cuefr_pool.txt"
     category_pool_path = "experiments/cat_target_short/assets/cuefr_category_pool.txt"
+    stimulus_labels_path = "experiments/cat_target_short/assets/cuefr_labels.txt"
+    design_data_path = "experiments/cat_target_short/cuefr.h5"
     target_data_path = "experiments/cat_target_short/expt_milind_pooled.h5"
     include_intrusions = False
     distance_threshold = 2
@@ -427,116 +621,43 @@ if __name__ == "__main__":
     data = load_jsonl(jatos_data_path)
     word_pool = load_stimulus_pool(stimulus_pool_path)
     cat_pool = load_stimulus_pool(category_pool_path)
-    study_items = retrieve_study_items(data)
-    study_item_categories, study_category_ids = retrieve_study_item_categories(data, cat_pool)
-    recall_words = retrieve_recall_words(data)
-    subject_ids = np.array(generate_subject_ids(data))
-    block_indices = np.array(retrieve_block_indices(data))
-    category_cues, category_ids = retrieve_recall_cues(data, cat_pool)
-    recall_item_categories, recall_category_ids = retrieve_recall_item_categories(data, cat_pool, distance_threshold, include_intrusions)
-    category_ids = np.array(category_ids)
-
-    pres_itemids = np.array(retrieve_pres_itemids(data, word_pool))
-    assert np.sum(pres_itemids == 0) == 0, "Variable list length across study lists"
-    study_category_ids = np.array(study_category_ids)
-    list_length = max(len(lst) for lst in study_items)
-    list_lengths = np.array([list_length] * len(pres_itemids))
-
-    recalls = np.array(
-        pad_lists(
-            retrieve_recall_pres_positions(
-                data, distance_threshold, include_intrusions
-            ),
-            list_length,
-        )
+    result = build_embam_arrays(
+        data, word_pool, cat_pool, distance_threshold, include_intrusions
     )
-    rec_itemids = np.array(
-        pad_lists(
-            retrieve_recall_pres_ids(
-                data, distance_threshold, word_pool, include_intrusions
-            ),
-            list_length,
-        )
-    )
-    rec_categoryids = np.array(pad_lists(recall_category_ids, list_length))
-
-    # if category_ids second dimension length is not same as recall_category_ids second dimension length, then pad the category_ids with zeros to match
-    if category_ids.shape[1] != rec_categoryids.shape[1]:
-        reference_array = np.zeros_like(rec_categoryids)
-        reference_array[:, :category_ids.shape[1]] = category_ids
-        category_ids = reference_array
-
-
-    for (
-        participant_study_items,
-        participant_study_ids,
-        participant_study_item_categories,
-        participant_study_category_ids,
-        participant_cues,
-        participant_cue_ids,
-        participant_recall_words,
-        participant_recalls,
-        participant_recids,
-        participant_rec_cat_ids,
-        participant_recall_categorys,
-        participant_subjectids,
-        participant_blockids,
-    ) in zip(
-        study_items,
-        pres_itemids,
-        study_item_categories,
-        study_category_ids,
-        category_cues,
-        category_ids,
-        recall_words,
-        recalls,
-        rec_itemids,
-        rec_categoryids,
-        recall_item_categories,
-        subject_ids,
-        block_indices,
-    ):
-        print("Study items:", participant_study_items)
-        print("Study IDs:", participant_study_ids)
-        print("Study item categories:", participant_study_item_categories)
-        print("Study item category ids:", participant_study_category_ids)
-        print("Category cue:", participant_cues)
-        print("Category cue ID:", participant_cue_ids)
-        print("Recall words:", participant_recall_words)
-        print("Recall word categories:", participant_recall_categorys)
-        print("Recall Presentation Positions:", participant_recalls)
-        print("Recall Presentation IDs:", participant_recids)
-        print("Recall category ids:", participant_rec_cat_ids)
-        print("Subject ID:", participant_subjectids)
-        print("Block ID:", participant_blockids)
+
+    pres_itemids = result["pres_itemids"]
+    assert np.sum(pres_itemids == 0) == 0, "Variable list length across study lists"
+    list_length = pres_itemids.shape[1]
+    subject_ids = result["subject"][:, 0]
+    category_ids = result["category_cues"]
+    rec_categoryids = result["rec_categoryids"]
+
+    for trial_index in range(len(pres_itemids)):
+        print("Study items:", [word_pool[i - 1] for i in pres_itemids[trial_index]])
+        print("Study IDs:", pres_itemids[trial_index])
+        print("Study item category ids:", result["pres_categoryids"][trial_index])
+        print("Category cue ID:", category_ids[trial_index])
+        print("Recall Presentation Positions:", result["recalls"][trial_index])
+        print("Recall Presentation IDs:", result["rec_itemids"][trial_index])
+        print("Recall category ids:", rec_categoryids[trial_index])
+        print("Subject ID:", subject_ids[trial_index])
+        print("Block ID:", result["block"][trial_index, 0])
         print()
         break
 
     control_condition = category_ids == 0
     targetting_condition = category_ids != 0
     successful_targetting = np.logical_and(targetting_condition, category_ids == rec_categoryids)
-    three_conditions = targetting_condition.astype(int) + successful_targetting
+    three_conditions = targetting_condition.astype(np.uint8) + successful_targetting
     print(np.sum(successful_targetting)/np.sum(targetting_condition))
 
     # construct data dict
-    result: dict[str, np.ndarray] = {
-        "condition": three_conditions,
-        "target_success": successful_targetting,
-        "listLength": list_lengths[:, np.newaxis],
-        "category_cues": category_ids,
-        "pres_itemids": pres_itemids,
-        "pres_categoryids": study_category_ids,
-        "pres_itemnos": np.tile(np.arange(1, list_length + 1), (len(pres_itemids), 1)),
-        "subject": subject_ids[:, np.newaxis],
-        "rec_itemids": rec_itemids,
-        "rec_categoryids": rec_categoryids,
-        "recalls": recalls,
-        "block": block_indices[:, np.newaxis],
-    }
+    result["condition"] = three_conditions
+    result["target_success"] = successful_targetting
 
     print(f"Unique Subjects: {np.unique(subject_ids), len(np.unique(subject_ids))}")
 
-    save_data(result, target_data_path)
+    save_data(result, target_data_path, {"items": word_pool, "categories": cat_pool})
     loaded_result = load_data(target_data_path)
 
     assert np.min(loaded_result["pres_itemids"]) > 0
@@ -546,4 +667,14 @@ if __name__ == "__main__":
     for key, value in loaded_result.items():
         assert np.ndim(value) == 2
 
+    # check every participant against the design subject they were shown
+    if os.path.exists(design_data_path):
+        mismatches = find_design_mismatches(
+            result, load_data(design_data_path), load_stimulus_pool(stimulus_labels_path), cat_pool
+        )
+        if mismatches.empty:
+            print("Every participant saw their designed trials")
+        else:
+            print(mismatches.groupby(["subject", "design_subject", "rule"]).size().to_string())
+
 # %%
@@ -0,0 +1,182 @@
+"""Compare two EMBAM files trial by trial without loading either into memory.
+
+Each trial row is reduced to one 64-bit hash over every field the two files share, read in
+chunks of trials straight from the HDF5 datasets. Trials are then matched by (subject, trial
+number), so the diff reports which subjects and trials were added, removed or changed.
+
+Run as a script to print the diff of two files:
+
+    python experiments/<experiment>/design_diff.py old.h5 new.h5
+"""
+
+import sys
+
+import h5py
+import numpy as np
+import pandas as pd
+from helpers import read_field
+from validate_design import subject_trial_numbers
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """Scramble 64-bit values with the splitmix64 finalizer."""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def _field_salt(field: str) -> np.uint64:
+    """Derive a per-field constant so equal values in different fields hash differently."""
+    salt = np.uint64(0)
+    with np.errstate(over="ignore"):
+        for byte in field.encode("utf-8"):
+            salt = _mix(np.uint64(byte) + salt * _GOLDEN)
+    return salt
+
+
+def _value_bits(rows: np.ndarray) -> np.ndarray:
+    """Reinterpret a block of field values as 64-bit patterns, with 0 for zero/padding."""
+    if rows.dtype.kind == "f":
+        return rows.astype(np.float64).view(np.uint64)
+    return rows.astype(np.int64).view(np.uint64)
+
+
+def hash_rows(rows: np.ndarray, field: str) -> np.ndarray:
+    """Hash each row of one field's (trial, column) block.
+
+    Every nonzero entry contributes a hash of (field, column, value) and the contributions are
+    summed, so trailing zero padding does not change a row's hash and files padded to
+    different widths still compare equal.
+
+    Args:
+        rows: Values of one field, one row per trial.
+        field: The EMBAM field name.
+
+    Returns:
+        One uint64 hash per trial.
+    """
+    bits = _value_bits(rows.reshape(len(rows), -1))
+    columns = np.arange(bits.shape[1], dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        keys = _mix(bits + _mix(columns * _GOLDEN + _field_salt(field)))
+        return np.where(bits != 0, keys, np.uint64(0)).sum(axis=1, dtype=np.uint64)
+
+
+def hash_design(
+    path: str, fields: list[str], chunk_trials: int = 65536
+) -> tuple[np.ndarray, np.ndarray]:
+    """Hash every trial of an EMBAM file over the given fields, reading in chunks.
+
+    Args:
+        path: The path to the hdf5 file.
+        fields: Fields to include in the hash.
+        chunk_trials: Number of trials to read at once.
+
+    Returns:
+        A tuple containing the subject ID and the uint64 hash of each trial.
+    """
+    with h5py.File(path, "r") as f:
+        data_group = f["/data"]
+        trial_count = data_group["subject"].shape[1]
+        # bit-packed flags can only be unpacked whole; they are small, so unpack them once
+        packed = {
+            field: read_field(data_group[field], upcast=False).T
+            for field in fields
+            if "packed_shape" in data_group[field].attrs
+        }
+        subject = np.empty(trial_count, dtype=np.int64)
+        hashes = np.zeros(trial_count, dtype=np.uint64)
+        for start in range(0, trial_count, chunk_trials):
+            stop = min(start + chunk_trials, trial_count)
+            subject[start:stop] = data_group["subject"][:, start:stop].ravel()
+            with np.errstate(over="ignore"):
+                for field in fields:
+                    if field in packed:
+                        rows = packed[field][start:stop]
+                    else:
+                        rows = data_group[field][:, start:stop].T
+                    hashes[start:stop] += hash_rows(rows, field)
+    return subject, hashes
+
+
+def diff_designs(
+    old_path: str, new_path: str, chunk_trials: int = 65536
+) -> tuple[dict[str, object], pd.DataFrame]:
+    """Report which subjects and trials differ between two EMBAM files.
+
+    Trials are matched by subject ID and 1-indexed trial number within the subject, assuming
+    each subject's trials are contiguous. Only fields present in both files are compared.
+
+    Args:
+        old_path: The path to the reference hdf5 file.
+        new_path: The path to the hdf5 file to compare against it.
+        chunk_trials: Number of trials to read at once.
+
+    Returns:
+        A tuple containing:
+        - Summary with the 'added_fields' and 'removed_fields', the 'added_subjects',
+          'removed_subjects' and 'changed_subjects' (sorted ID lists), and the number of
+          'added_trials', 'removed_trials', 'changed_trials' and 'unchanged_trials'.
+        - One row per differing trial with its 'change' ('added', 'removed' or 'changed'),
+          'subject' and 'trial'.
+    """
+    with h5py.File(old_path, "r") as f:
+        old_fields = set(f["/data"].keys())
+    with h5py.File(new_path, "r") as f:
+        new_fields = set(f["/data"].keys())
+    fields = sorted((old_fields & new_fields) - {"subject"})
+
+    trials = []
+    for path in (old_path, new_path):
+        subject, hashes = hash_design(path, fields, chunk_trials)
+        trials.append(
+            pd.DataFrame(
+                {"subject": subject, "trial": subject_trial_numbers(subject), "hash": hashes}
+            )
+        )
+    merged = trials[0].merge(
+        trials[1], on=["subject", "trial"], how="outer", suffixes=("_old", "_new"), indicator=True
+    )
+    change = np.select(
+        [
+            merged["_merge"] == "right_only",
+            merged["_merge"] == "left_only",
+            merged["hash_old"] != merged["hash_new"],
+        ],
+        ["added", "removed", "changed"],
+        default="",
+    )
+    differences = pd.DataFrame(
+        {"change": change, "subject": merged["subject"], "trial": merged["trial"]}
+    )
+    differences = differences[differences["change"] != ""].reset_index(drop=True)
+
+    old_subjects = set(trials[0]["subject"].unique().tolist())
+    new_subjects = set(trials[1]["subject"].unique().tolist())
+    differing_subjects = set(differences["subject"].unique().tolist())
+    counts = differences["change"].value_counts()
+    summary = {
+        "added_fields": sorted(new_fields - old_fields),
+        "removed_fields": sorted(old_fields - new_fields),
+        "added_subjects": sorted(new_subjects - old_subjects),
+        "removed_subjects": sorted(old_subjects - new_subjects),
+        "changed_subjects": sorted(differing_subjects & old_subjects & new_subjects),
+        "added_trials": int(counts.get("added", 0)),
+        "removed_trials": int(counts.get("removed", 0)),
+        "changed_trials": int(counts.get("changed", 0)),
+        "unchanged_trials": int((merged["_merge"] == "both").sum() - counts.get("changed", 0)),
+    }
+    return summary, differences
+
+
+if __name__ == "__main__":
+    old_path, new_path = sys.argv[1:3]
+    summary, differences = diff_designs(old_path, new_path)
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+    if not differences.empty:
+        print(differences.to_string(index=False, max_rows=50))
@@ -18,11 +18,25 @@
 
 # %%
 import numpy as np
-import copy
 import itertools
 import random
 import math
-from helpers import load_stimulus_pool, load_data, save_data
+from typing import Iterator
+from capacity_planner import plan_capacity
+from design_metrics import design_metrics, write_metrics_report
+from helpers import (
+    design_is_cached,
+    design_provenance,
+    draw_least_exposed,
+    embam_dtype,
+    item_neighbors,
+    load_data,
+    load_stimulus_pool,
+    schedule_categories,
+    similarity_neighbors,
+    stream_data,
+)
+from was_store import align_similarity, file_digest, load_was_matrix
 
 
 # %%
@@ -93,6 +107,22 @@ def aggregate_stimulus_pools(
     return stimulus_pool, stimulus_labels
 
 
+# %%
+def index_stimulus_pool(aggregated_stimulus_pool: list[str]) -> dict[str, int]:
+    """Map each stimulus to its 1-indexed ID in the aggregated pool.
+
+    Args:
+        aggregated_stimulus_pool: The aggregated stimulus pool.
+
+    Returns:
+        Dictionary from stimulus to ID; a repeated stimulus keeps the ID of its first occurrence.
+    """
+    stimulus_ids: dict[str, int] = {}
+    for index, stimulus in enumerate(aggregated_stimulus_pool):
+        stimulus_ids.setdefault(stimulus, index + 1)
+    return stimulus_ids
+
+
 # %%
 def generate_alternating_recalls(
     cue_count: int, total_recalls: int, cued_indices: list[int]
@@ -315,7 +345,7 @@ def retrieve_cue_target_items(
         An array containing the stimulus IDs corresponding to the category cues.
     """
     num_trials, cue_count = cat_cue_indices.shape
-    category_targets = np.zeros_like(cat_cue_indices)  # Initialize the result array
+    category_targets = np.zeros(cat_cue_indices.shape, dtype=pres_itemids.dtype)  # Initialize the result array
 
     for i, j in itertools.product(range(num_trials), range(cue_count)):
         index = cat_cue_indices[i, j]
@@ -326,85 +356,72 @@ def retrieve_cue_target_items(
     return category_targets
 
 
-# %%
-def validate_stimulus_pool_size(
-    labels: list[str], stimulus_pools: list[list[str]], trial_count: int
-) -> None:
-    """Ensure that each stimulus pool has enough items to handle the number of trials.
-
-    Args:
-        labels: The list of category labels.
-        stimulus_pools: The list of stimulus pools corresponding to each label.
-        trial_count: The total number of trials each subject will participate in.
-
-    Raises:
-        AssertionError: If a category does not have enough stimuli to support the required number of trials.
-    """
-    for label_index, _ in enumerate(labels):
-        assert len(stimulus_pools[label_index]) >= (
-            trial_count / 2
-        ), f"Not enough stimuli in pool for label: {labels[label_index]}"
-
-
 # %%
 def sample_stimuli_for_trial(
     labels: list[str],
-    subject_stimulus_pools: list[list[str]],
-    last_trial_label_indices: np.ndarray,
+    category_item_ids: list[np.ndarray],
+    drawn: np.ndarray,
+    trial_label_indices: np.ndarray,
+    cued_positions: np.ndarray,
+    presentation_counts: np.ndarray,
+    cue_counts: np.ndarray,
     aggregated_stimulus_pool: list[str],
-    list_length: int,
+    neighbors: tuple[np.ndarray, np.ndarray] | None = None,
 ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
-    """Samples stimuli for a trial, ensuring no category from the previous trial is reused.
-    
-    If the number of available categories is insufficient, categories from the previous trial are 
-    reused, but unique stimuli are selected.
+    """Samples one stimulus from each category scheduled for a trial.
+
+    Categories come from `schedule_categories`, which keeps consecutive trials disjoint
+    whenever the pools allow it, so sampling never has to fall back on reusing categories.
+    Within a category, the stimulus presented least often across subjects so far is drawn;
+    at cued positions, the stimulus least often used as a cue target is drawn first.
+
+    With a similarity `neighbors` index, stimuli too similar to ones already in the trial
+    are rejected while any other stimulus of the category remains, and otherwise the one
+    with the fewest such neighbors in the trial is drawn.
 
     Args:
         labels: List of category labels.
-        subject_stimulus_pools: Stimulus pools for each subject, which are modified during sampling.
-        last_trial_label_indices: Indices of labels used in the previous trial to avoid reusing them.
+        category_item_ids: IDs of the stimuli in each category pool.
+        drawn: Boolean mask of stimulus IDs the subject has already studied; updated in place.
+        trial_label_indices: Indices of the labels scheduled for this trial, one per study position.
+        cued_positions: Boolean mask of study positions that will be cue targets.
+        presentation_counts: Presentations of each stimulus ID across subjects so far.
+        cue_counts: Cue-target uses of each stimulus ID across subjects so far.
         aggregated_stimulus_pool: The aggregated list of all available stimuli.
-        list_length: The number of stimuli to sample for the trial.
+        neighbors: Index from `similarity_neighbors` of the stimuli too similar to appear in
+            a trial together, or None to ignore similarity.
 
     Returns:
         A tuple containing the indices of the sampled stimuli, the strings of the sampled stimuli,
         and the indices of the category labels used in this trial.
     """
-    applicable_label_indices = np.arange(len(labels))[
-        ~np.isin(np.arange(len(labels)), last_trial_label_indices)
-    ]
-    np.random.shuffle(applicable_label_indices)
-
-    # In case not enough applicable labels, sample from all remaining labels
-    extra_label_indices = np.arange(len(labels))[
-        ~np.isin(np.arange(len(labels)), applicable_label_indices)]
-    np.random.shuffle(extra_label_indices)
-    applicable_label_indices = np.concatenate([applicable_label_indices, extra_label_indices])
-
+    list_length = len(trial_label_indices)
     trial_stimulus_indices = np.zeros(list_length, dtype=int)
     trial_stimulus_strings = np.zeros(list_length, dtype=object)
-    trial_label_indices = []
-
-    study_index = 0
-    for label_index in applicable_label_indices:
-        stimulus_pool = subject_stimulus_pools[label_index]
-        if len(stimulus_pool) == 0:
-            continue
-        
-        stimulus_string = stimulus_pool.pop(np.random.randint(len(stimulus_pool)))
-
-        trial_stimulus_indices[study_index] = (
-            aggregated_stimulus_pool.index(stimulus_string) + 1
-        )
-        trial_stimulus_strings[study_index] = stimulus_string
+    # how many stimuli already in the trial each stimulus is too similar to
+    conflicts = np.zeros(len(drawn), dtype=np.int64)
+
+    for study_index, label_index in enumerate(trial_label_indices):
+        candidate_ids = category_item_ids[label_index]
+        candidate_ids = candidate_ids[~drawn[candidate_ids]]
+        if len(candidate_ids) == 0:
+            raise ValueError(f"Stimulus pool for label {labels[label_index]} is empty.")
 
-        trial_label_indices.append(label_index)
-        study_index += 1
-        if study_index == list_length:
-            break
+        if cued_positions[study_index]:
+            exposures = (cue_counts, presentation_counts)
+        else:
+            exposures = (presentation_counts,)
+        if neighbors is not None:
+            exposures = (conflicts, *exposures)
+        stimulus_id = candidate_ids[draw_least_exposed(candidate_ids, *exposures)]
+        drawn[stimulus_id] = True
+        if neighbors is not None:
+            conflicts[item_neighbors(neighbors, stimulus_id)] += 1
+
+        trial_stimulus_indices[study_index] = stimulus_id
+        trial_stimulus_strings[study_index] = aggregated_stimulus_pool[stimulus_id - 1]
 
-    assert len(trial_label_indices) == list_length
-    return trial_stimulus_indices, trial_stimulus_strings, np.array(trial_label_indices)
+    return trial_stimulus_indices, trial_stimulus_strings, trial_label_indices
 
 
 # %%
@@ -437,6 +454,104 @@ def assign_cue_stimuli(
     return category_cues, cat_cue_positions
 
 
+# %%
+def construct_subject_lists(
+    labels: list[str],
+    stimulus_pools: list[list[str]],
+    trial_count: int,
+    list_length: int,
+    cue_count: int,
+    total_recalls: int,
+    control_proportion: float,
+    cue_region_size: int,
+    spacing: int,
+    aggregated_stimulus_pool: list[str],
+    presentation_counts: np.ndarray,
+    cue_counts: np.ndarray,
+    neighbors: tuple[np.ndarray, np.ndarray] | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Construct one subject's study lists according to design of cued / free recall experiment.
+
+    Args:
+        labels: Category labels for each stimulus in the stimulus pool.
+        stimulus_pools: The stimulus pools corresponding to each label; not modified.
+        trial_count: The number of trials per subject.
+        list_length: The number of presentations per trial.
+        cue_count: The number of category cues per trial.
+        total_recalls: The total number of recall events per trial.
+        control_proportion: The proportion of trials with no category cues.
+        cue_region_size: The number of serial positions to use for category cues.
+        spacing: The minimum spacing between cued indices.
+        aggregated_stimulus_pool: The aggregated stimulus pool.
+        presentation_counts: Presentations of each stimulus ID across subjects so far; updated
+            in place.
+        cue_counts: Cue-target uses of each stimulus ID across subjects so far; updated in place.
+        neighbors: Similarity index passed to `sample_stimuli_for_trial`, or None.
+
+    Returns:
+        A tuple containing, with one row per trial of the subject:
+        - An array of stimulus IDs for each presentation (1-indexed into the aggregated pool).
+        - An array of stimulus IDs for the category cues.
+        - An array of serial position indices for the category cues.
+    """
+    item_dtype = embam_dtype("pres_itemids", max_value=len(aggregated_stimulus_pool))
+    pres_itemids = np.zeros((trial_count, list_length), dtype=item_dtype)
+    category_cues = np.zeros((trial_count, total_recalls), dtype=item_dtype)
+    cat_cue_indices = np.zeros(
+        (trial_count, total_recalls),
+        dtype=embam_dtype("category_cue_indices", max_value=list_length),
+    )
+
+    stimulus_ids = index_stimulus_pool(aggregated_stimulus_pool)
+    category_item_ids = [np.array([stimulus_ids[stimulus] for stimulus in pool]) for pool in stimulus_pools]
+    drawn = np.zeros(len(aggregated_stimulus_pool) + 1, dtype=bool)
+
+    category_cue_indices = generate_category_cue_indices(
+        trial_count, list_length, control_proportion, cue_count, total_recalls, cue_region_size, spacing
+    )
+
+    # each study position draws one stimulus, so a category can appear in as many trials as
+    # its pool has stimuli
+    category_schedule = schedule_categories(
+        trial_count, list_length, [len(pool) for pool in stimulus_pools]
+    )
+
+    # Loop through each trial
+    for t in range(trial_count):
+        cued_positions = np.zeros(list_length, dtype=bool)
+        cued_positions[[index for index in category_cue_indices[t] if index != -1]] = True
+
+        trial_stimulus_indices, trial_stimulus_strings, trial_label_indices = (
+            sample_stimuli_for_trial(
+                labels,
+                category_item_ids,
+                drawn,
+                category_schedule[t],
+                cued_positions,
+                presentation_counts,
+                cue_counts,
+                aggregated_stimulus_pool,
+                neighbors,
+            )
+        )
+
+        # add trial to study lists
+        pres_itemids[t, :] = trial_stimulus_indices
+
+        # Assign category cues
+        trial_category_cues, trial_cat_cue_indices = assign_cue_stimuli(
+            t, category_cue_indices[t], pres_itemids, total_recalls
+        )
+        category_cues[t, :] = trial_category_cues
+        cat_cue_indices[t, :] = trial_cat_cue_indices
+
+        # record exposures so later draws favor under-used stimuli
+        presentation_counts[trial_stimulus_indices] += 1
+        cue_counts[trial_category_cues[trial_category_cues > 0]] += 1
+
+    return pres_itemids, category_cues, cat_cue_indices
+
+
 # %%
 def construct_study_lists(
     labels: list[str],
@@ -450,9 +565,12 @@ def construct_study_lists(
     cue_region_size: int,
     spacing: int,
     aggregated_stimulus_pool: list[str],
-) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    neighbors: tuple[np.ndarray, np.ndarray] | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     """Construct study lists according to design of cued / free recall experiment.
 
+    Stimulus exposure is balanced across subjects as in `generate_subject_blocks`.
+
     Args:
         labels: Category labels for each stimulus in the stimulus pool.
         stimulus_pools: The stimulus pools corresponding to each label.
@@ -465,56 +583,124 @@ def construct_study_lists(
         cue_region_size: The number of serial positions to use for category cues.
         spacing: The minimum spacing between cued indices.
         aggregated_stimulus_pool: The aggregated stimulus pool.
+        neighbors: Similarity index passed to `sample_stimuli_for_trial`, or None.
 
     Returns:
         A tuple containing:
-        - An array of stimulus IDs for each presentation (1-indexed).
-        - An array of stimulus strings for each presentation (1-indexed).
+        - An array of stimulus IDs for each presentation (1-indexed into the aggregated pool).
         - An array of stimulus IDs for the category cues.
         - An array of serial position indices for the category cues.
         - An array of stimulus IDs for the category cue targets.
     """
-    pres_itemids = np.zeros((trial_count * subject_count, list_length), dtype=int)
-    pres_itemstrs = np.zeros((trial_count * subject_count, list_length), dtype=object)
-    category_cues = np.zeros((trial_count * subject_count, total_recalls), dtype=int)
-    cat_cue_indices = np.zeros((trial_count * subject_count, total_recalls), dtype=int)
+    item_dtype = embam_dtype("pres_itemids", max_value=len(aggregated_stimulus_pool))
+    pres_itemids = np.zeros((trial_count * subject_count, list_length), dtype=item_dtype)
+    category_cues = np.zeros((trial_count * subject_count, total_recalls), dtype=item_dtype)
+    cat_cue_indices = np.zeros(
+        (trial_count * subject_count, total_recalls),
+        dtype=embam_dtype("category_cue_indices", max_value=list_length),
+    )
+
+    # Exposure counters shared across subjects, indexed by stimulus ID
+    presentation_counts = np.zeros(len(aggregated_stimulus_pool) + 1, dtype=np.int64)
+    cue_counts = np.zeros(len(aggregated_stimulus_pool) + 1, dtype=np.int64)
 
     # Loop through each subject
     for s in range(subject_count):
-        subject_stimulus_pools = copy.deepcopy(stimulus_pools)
-        last_trial_label_indices = np.array([])
-
-        category_cue_indices = generate_category_cue_indices(
-            trial_count, list_length, control_proportion, cue_count, total_recalls, cue_region_size, spacing
+        rows = slice(s * trial_count, (s + 1) * trial_count)
+        pres_itemids[rows], category_cues[rows], cat_cue_indices[rows] = construct_subject_lists(
+            labels,
+            stimulus_pools,
+            trial_count,
+            list_length,
+            cue_count,
+            total_recalls,
+            control_proportion,
+            cue_region_size,
+            spacing,
+            aggregated_stimulus_pool,
+            presentation_counts,
+            cue_counts,
+            neighbors,
         )
-        validate_stimulus_pool_size(labels, subject_stimulus_pools, trial_count)
-
-        # Loop through each trial
-        for t in range(trial_count):
-            trial_stimulus_indices, trial_stimulus_strings, last_trial_label_indices = (
-                sample_stimuli_for_trial(
-                    labels,
-                    subject_stimulus_pools,
-                    last_trial_label_indices,
-                    aggregated_stimulus_pool,
-                    list_length,
-                )
-            )
 
-            # add trial to study lists
-            trial_index = s * trial_count + t
-            pres_itemids[trial_index, :] = trial_stimulus_indices
-            pres_itemstrs[trial_index, :] = trial_stimulus_strings
+    cat_cue_itemids = retrieve_cue_target_items(cat_cue_indices, pres_itemids)
+    return pres_itemids, category_cues, cat_cue_indices, cat_cue_itemids
 
-            # Assign category cues
-            trial_category_cues, trial_cat_cue_indices = assign_cue_stimuli(
-                trial_index, category_cue_indices[t], pres_itemids, total_recalls
-            )
-            category_cues[trial_index, :] = trial_category_cues
-            cat_cue_indices[trial_index, :] = trial_cat_cue_indices
 
-    cat_cue_itemids = retrieve_cue_target_items(cat_cue_indices, pres_itemids)
-    return pres_itemids, pres_itemstrs, category_cues, cat_cue_indices, cat_cue_itemids
+# %%
+def generate_subject_blocks(
+    labels: list[str],
+    stimulus_pools: list[list[str]],
+    trial_count: int,
+    subject_count: int,
+    list_length: int,
+    cue_count: int,
+    total_recalls: int,
+    control_proportion: float,
+    cue_region_size: int,
+    spacing: int,
+    aggregated_stimulus_pool: list[str],
+    neighbors: tuple[np.ndarray, np.ndarray] | None = None,
+) -> Iterator[dict[str, np.ndarray]]:
+    """Yield the design one subject at a time in EMBAM format, for use with `stream_data`.
+
+    Presentation and cue-target counts carry over from subject to subject, so each subject's
+    draws favor the stimuli earlier subjects saw least.
+
+    Args:
+        labels: Category labels for each stimulus in the stimulus pool.
+        stimulus_pools: The stimulus pools corresponding to each label.
+        trial_count: The number of trials per subject.
+        subject_count: The number of subjects.
+        list_length: The number of presentations per trial.
+        cue_count: The number of category cues per trial.
+        total_recalls: The total number of recall events per trial.
+        control_proportion: The proportion of trials with no category cues.
+        cue_region_size: The number of serial positions to use for category cues.
+        spacing: The minimum spacing between cued indices.
+        aggregated_stimulus_pool: The aggregated stimulus pool.
+        neighbors: Similarity index passed to `sample_stimuli_for_trial`, or None.
+
+    Yields:
+        EMBAM dictionary holding the `trial_count` rows of one subject.
+    """
+    pres_itemnos = np.tile(
+        np.arange(1, list_length + 1, dtype=embam_dtype("pres_itemnos")), (trial_count, 1)
+    )
+    list_lengths = np.full(
+        (trial_count, 1), list_length, dtype=embam_dtype("listLength", max_value=list_length)
+    )
+    subject_dtype = embam_dtype("subject", max_value=subject_count)
+
+    # Exposure counters shared across subjects, indexed by stimulus ID
+    presentation_counts = np.zeros(len(aggregated_stimulus_pool) + 1, dtype=np.int64)
+    cue_counts = np.zeros(len(aggregated_stimulus_pool) + 1, dtype=np.int64)
+
+    for s in range(subject_count):
+        pres_itemids, category_cues, cat_cue_indices = construct_subject_lists(
+            labels,
+            stimulus_pools,
+            trial_count,
+            list_length,
+            cue_count,
+            total_recalls,
+            control_proportion,
+            cue_region_size,
+            spacing,
+            aggregated_stimulus_pool,
+            presentation_counts,
+            cue_counts,
+            neighbors,
+        )
+        yield {
+            "subject": np.full((trial_count, 1), s, dtype=subject_dtype),
+            "listLength": list_lengths,
+            "pres_itemnos": pres_itemnos,
+            "pres_itemids": pres_itemids,
+            "category_cues": category_cues,
+            "category_cue_indices": cat_cue_indices,
+            "category_cue_itemids": retrieve_cue_target_items(cat_cue_indices, pres_itemids),
+        }
 
 
 # %%
@@ -539,6 +725,14 @@ if __name__ == "__main__":
     total_recalls = 6
     cue_region_size = 4
     spacing = 2
+    seed = 0
+    plan_only = False  # report pool capacity and stop before generating
+    # cap on the WAS similarity between items of different categories in one list; None
+    # ignores similarity. The PEERS WAS matrix does not ship with `wasnorm_wordpool.txt`,
+    # so set `was_matrix_path` to it before setting a cap.
+    similarity_cap = None
+    was_wordpool_path = "experiments/cat_target_short/assets/wasnorm_wordpool.txt"
+    was_matrix_path = None
     target_data_path = "experiments/cat_target_short/cuefr.h5"
     target_stimulus_pool_path = "experiments/cat_target_short/assets/cuefr_pool.txt"
     target_stimulus_labels_path = (
@@ -547,9 +741,17 @@ if __name__ == "__main__":
     target_category_pool_path = (
         "experiments/cat_target_short/assets/cuefr_category_pool.txt"
     )
+    target_metrics_path = "experiments/cat_target_short/cuefr_metrics.json"
+    target_metrics_html_path = "experiments/cat_target_short/cuefr_metrics.html"
     source_pools_path = "experiments/cat_target_short/assets/asymfr"
     total_trials = trial_count * subject_count
 
+    if similarity_cap is not None and was_matrix_path is None:
+        raise ValueError(
+            "similarity_cap needs a WAS matrix: set was_matrix_path to the matrix ordered by "
+            f"{was_wordpool_path}, or set similarity_cap to None."
+        )
+
     # construct stimulus pool across specified category labels
     labels = [
         "birds",
@@ -594,72 +796,114 @@ if __name__ == "__main__":
         stimulus_pools, labels
     )
 
-    (
-        pres_itemids,
-        pres_itemstrs,
-        category_cues,
-        category_cue_indices,
-        category_cue_itemids,
-    ) = construct_study_lists(
+    # size the design against the pools once, before sampling any subject
+    capacity, pool_pressure = plan_capacity(
         labels,
-        stimulus_pools,
+        [len(pool) for pool in stimulus_pools],
+        np.arange(list_length),
         trial_count,
         subject_count,
-        list_length,
-        cue_count,
-        total_recalls,
-        control_proportion,
-        cue_region_size,
-        spacing,
-        aggregated_stimulus_pool,
+        (trial_count - int(trial_count * control_proportion)) * cue_count,
+        depleting=True,
     )
+    print(capacity)
+    if plan_only:
+        print(pool_pressure.to_string(index=False))
+        raise SystemExit(0)
+    if not capacity["feasible"]:
+        raise ValueError(
+            f"Pools support at most {capacity['max_trials']} trials per subject, not {trial_count}"
+        )
 
-    # construct data dict
-    result: dict[str, np.ndarray] = {
-        "subject": np.repeat(np.arange(subject_count), trial_count)[:, np.newaxis],
-        "listLength": np.repeat(list_length, subject_count * trial_count)[
-            :, np.newaxis
-        ],
-        "pres_itemnos": np.tile(
-            np.arange(1, list_length + 1), (subject_count * trial_count, 1)
-        ),
-        "pres_itemids": pres_itemids,
-        "category_cues": category_cues,
-        "category_cue_indices": category_cue_indices,
-        "category_cue_itemids": category_cue_itemids,
+    design_parameters = {
+        "list_length": list_length,
+        "subject_count": subject_count,
+        "trial_count": trial_count,
+        "control_proportion": control_proportion,
+        "cue_count": cue_count,
+        "total_recalls": total_recalls,
+        "cue_region_size": cue_region_size,
+        "spacing": spacing,
+        "labels": labels,
     }
 
-    save_data(result, target_data_path)
+    # index the cross-category item pairs that may not share a list
+    neighbors = None
+    if similarity_cap is not None:
+        similarity = align_similarity(
+            load_was_matrix(was_wordpool_path, was_matrix_path),
+            load_stimulus_pool(was_wordpool_path),
+            aggregated_stimulus_pool,
+        )
+        neighbors = similarity_neighbors(
+            similarity, similarity_cap, np.array([""] + aggregated_stimulus_labels)
+        )
+        design_parameters["similarity_cap"] = similarity_cap
+        design_parameters["was_matrix"] = file_digest(was_matrix_path)
+
+    # key the design on its inputs; skip regeneration if the file already matches
+    provenance = design_provenance(design_parameters, stimulus_pools, seed, __file__)
+    if design_is_cached(target_data_path, provenance):
+        print(f"{target_data_path} is up to date (design {provenance['design_hash'][:12]})")
+    else:
+        random.seed(seed)
+        np.random.seed(seed)
+
+        # generate and write the design one subject at a time
+        stream_data(
+            generate_subject_blocks(
+                labels,
+                stimulus_pools,
+                trial_count,
+                subject_count,
+                list_length,
+                cue_count,
+                total_recalls,
+                control_proportion,
+                cue_region_size,
+                spacing,
+                aggregated_stimulus_pool,
+                neighbors,
+            ),
+            target_data_path,
+            {
+                "items": aggregated_stimulus_pool,
+                "item_labels": aggregated_stimulus_labels,
+                "categories": labels,
+            },
+            dtypes={"subject": embam_dtype("subject", max_value=subject_count)},
+            attrs=provenance,
+        )
 
-    # tests:
-    # load result file
-    loaded_result = load_data(target_data_path)
+        # tests:
+        # load result file
+        loaded_result = load_data(target_data_path)
 
-    # confirm shapes
-    assert loaded_result["subject"].shape == (subject_count * trial_count, 1)
-    assert loaded_result["listLength"].shape == (subject_count * trial_count, 1)
-    assert loaded_result["pres_itemnos"].shape == (
-        subject_count * trial_count,
-        list_length,
-    )
-    assert loaded_result["pres_itemids"].shape == (
-        subject_count * trial_count,
-        list_length,
-    )
-    assert loaded_result["category_cues"].shape == (
-        subject_count * trial_count,
-        total_recalls,
-    )
-    assert loaded_result["category_cue_indices"].shape == (
-        subject_count * trial_count,
-        total_recalls,
-    )
+        # confirm shapes
+        assert loaded_result["subject"].shape == (subject_count * trial_count, 1)
+        assert loaded_result["listLength"].shape == (subject_count * trial_count, 1)
+        assert loaded_result["pres_itemnos"].shape == (
+            subject_count * trial_count,
+            list_length,
+        )
+        assert loaded_result["pres_itemids"].shape == (
+            subject_count * trial_count,
+            list_length,
+        )
+        assert loaded_result["category_cues"].shape == (
+            subject_count * trial_count,
+            total_recalls,
+        )
+        assert loaded_result["category_cue_indices"].shape == (
+            subject_count * trial_count,
+            total_recalls,
+        )
 
-    # confirm pres_itemids and pres_itemnos are 1-indexed
-    # (we reserve 0 for padding when list lengths vary)
-    assert np.min(loaded_result["pres_itemids"]) == 1
-    assert np.max(loaded_result["pres_itemids"]) > list_length
-    assert np.min(loaded_result["pres_itemnos"]) == 1
+        # confirm pres_itemids and pres_itemnos are 1-indexed
+        # (we reserve 0 for padding when list lengths vary)
+        assert np.min(loaded_result["pres_itemids"]) == 1
+        assert np.max(loaded_result["pres_itemids"]) > list_length
+        assert np.min(loaded_result["pres_itemnos"]) == 1
 
     # also save constructed stimulus pools and labels
     with open(target_stimulus_pool_path, "w") as f:
@@ -667,4 +911,13 @@ if __name__ == "__main__":
     with open(target_stimulus_labels_path, "w") as f:
         f.write("\n".join(aggregated_stimulus_labels))
     with open(target_category_pool_path, "w") as f:
-        f.write("\n".join(labels))
\ No newline at end of file
+        f.write("\n".join(labels))
+
+    # Summarize how balanced the saved design is
+    metrics_summary, metrics_tables = design_metrics(
+        load_data(target_data_path), aggregated_stimulus_labels, labels
+    )
+    print(metrics_summary)
+    write_metrics_report(
+        target_metrics_path, metrics_summary, metrics_tables, target_metrics_html_path
+    )
@@ -0,0 +1,170 @@
+"""Attach the designed trials to converted data and flag where the two disagree.
+
+Every jsPsych record carries the `subjectId` of the design subject it was shown, which the
+converters store as 'design_subject'. The design is indexed once by subject (sorted subject
+IDs with the row offset of each subject's first trial), so the design row of every converted
+trial is found with one binary search over all trials at once.
+"""
+
+import numpy as np
+import pandas as pd
+from validate_design import item_category_ids
+
+MISMATCH_COLUMNS = ["rule", "subject", "design_subject", "trial", "position", "observed", "designed"]
+
+
+def index_design_subjects(subject: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Index a design's trials by subject, assuming each subject's trials are contiguous.
+
+    Args:
+        subject: Subject ID of each design trial.
+
+    Returns:
+        A tuple containing the sorted subject IDs, the row of each subject's first trial, and
+        each subject's trial count.
+    """
+    subject = np.asarray(subject).ravel()
+    subject_ids, first_rows, trial_counts = np.unique(
+        subject, return_index=True, return_counts=True
+    )
+    return subject_ids, first_rows, trial_counts
+
+
+def locate_design_rows(
+    design_subject: np.ndarray, block: np.ndarray, design_index: tuple[np.ndarray, ...]
+) -> np.ndarray:
+    """Find the design row each converted trial was generated from.
+
+    Args:
+        design_subject: Design subject ID of each converted trial (-1 if unknown).
+        block: 1-indexed trial number of each converted trial within its participant.
+        design_index: Index from `index_design_subjects`.
+
+    Returns:
+        Design row of each converted trial, or -1 where the design has no such trial.
+    """
+    subject_ids, first_rows, trial_counts = design_index
+    design_subject = np.asarray(design_subject).ravel()
+    block = np.asarray(block).ravel().astype(np.int64)
+    if len(subject_ids) == 0:
+        return np.full(len(design_subject), -1)
+
+    slot = np.minimum(np.searchsorted(subject_ids, design_subject), len(subject_ids) - 1)
+    found = (subject_ids[slot] == design_subject) & (block >= 1) & (block <= trial_counts[slot])
+    return np.where(found, first_rows[slot] + block - 1, -1)
+
+
+def _mismatches(
+    rule: str,
+    rows: np.ndarray,
+    positions: np.ndarray,
+    observed: np.ndarray,
+    designed: np.ndarray,
+    data: dict[str, np.ndarray],
+) -> pd.DataFrame:
+    """Collect flagged (trial row, 0-indexed position) pairs into a mismatch table."""
+    return pd.DataFrame(
+        {
+            "rule": rule,
+            "subject": data["subject"].ravel()[rows],
+            "design_subject": data["design_subject"].ravel()[rows],
+            "trial": data["block"].ravel()[rows],
+            "position": positions + 1,
+            "observed": observed,
+            "designed": designed,
+        },
+        columns=MISMATCH_COLUMNS,
+    )
+
+
+def join_design(
+    data: dict[str, np.ndarray], design: dict[str, np.ndarray]
+) -> dict[str, np.ndarray]:
+    """Attach the designed fields to each converted trial.
+
+    Args:
+        data: Converted EMBAM data with 'design_subject' and 'block'.
+        design: EMBAM design, as saved by the generator.
+
+    Returns:
+        The design fields aligned row for row with `data`, prefixed with 'design_', plus
+        'design_row' (-1 and all-zero fields for trials missing from the design).
+    """
+    design_rows = locate_design_rows(
+        data["design_subject"], data["block"], index_design_subjects(design["subject"])
+    )
+    found = design_rows >= 0
+    joined = {"design_row": design_rows[:, np.newaxis]}
+    for key, value in design.items():
+        aligned = np.zeros((len(design_rows), value.shape[1]), dtype=value.dtype)
+        aligned[found] = value[design_rows[found]]
+        joined[f"design_{key}"] = aligned
+    return joined
+
+
+def find_design_mismatches(
+    data: dict[str, np.ndarray],
+    design: dict[str, np.ndarray],
+    item_labels: list[str],
+    labels: list[str],
+) -> pd.DataFrame:
+    """Compare what each participant was shown with what the design specified.
+
+    Rules:
+        - 'missing_design_trial': the trial's design subject or trial number is not in the
+          design; position, observed and designed are reported as 0.
+        - 'presented_item': the item at a study position differs from the designed item.
+        - 'cue_category': a recall event's category cue differs from the category of the
+          designed cue target.
+
+    Args:
+        data: Converted EMBAM data with 'subject', 'design_subject', 'block', 'pres_itemids'
+            and 'category_cues' (category IDs per recall event).
+        design: EMBAM design with 'subject', 'pres_itemids' and 'category_cues' (cue target
+            item IDs per recall event).
+        item_labels: Category label of each item in the aggregated pool.
+        labels: The category labels, in the order that defines category IDs.
+
+    Returns:
+        Mismatch table, one row per differing position or recall event; empty if every
+        participant saw their design.
+    """
+    joined = join_design(data, design)
+    design_rows = joined["design_row"].ravel()
+    found = design_rows >= 0
+
+    rows = np.flatnonzero(~found)
+    zeros = np.zeros(len(rows), dtype=np.int64)
+    missing = _mismatches("missing_design_trial", rows, zeros - 1, zeros, zeros, data)
+
+    # compare over the columns both sides have; padding beyond them is zero on both sides
+    observed_items = data["pres_itemids"].astype(np.int64)
+    designed_items = joined["design_pres_itemids"].astype(np.int64)
+    width = min(observed_items.shape[1], designed_items.shape[1])
+    differs = observed_items[:, :width] != designed_items[:, :width]
+    rows, positions = np.nonzero(differs & found[:, np.newaxis])
+    items = _mismatches(
+        "presented_item",
+        rows,
+        positions,
+        observed_items[rows, positions],
+        designed_items[rows, positions],
+        data,
+    )
+
+    observed_cues = data["category_cues"].astype(np.int64)
+    designed_cues = item_category_ids(
+        joined["design_category_cues"].astype(np.int64), item_labels, labels
+    )
+    width = min(observed_cues.shape[1], designed_cues.shape[1])
+    differs = observed_cues[:, :width] != designed_cues[:, :width]
+    rows, events = np.nonzero(differs & found[:, np.newaxis])
+    cues = _mismatches(
+        "cue_category",
+        rows,
+        events,
+        observed_cues[rows, events],
+        designed_cues[rows, events],
+        data,
+    )
+    return pd.concat([missing, items, cues], ignore_index=True)
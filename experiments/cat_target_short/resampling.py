@@ -0,0 +1,316 @@
+"""Subject-level bootstrap confidence intervals and permutation tests on EMBAM data.
+
+Each measure is first reduced to per-subject totals: a count of events ('actual') out of
+the opportunities for them ('possible'), e.g. successful cues out of cued recall events.
+The group estimate is the ratio of summed totals. Resamples only reweight subjects, so a
+block of resamples becomes one (resample, subject) weight matrix multiplied against the
+(subject, group) totals. Blocks run in a process pool, each seeded from its own child of one
+`np.random.SeedSequence`, so results depend on the seed and block size but not on how many
+processes run them.
+
+Run as a script to report the targeting, recall and clustering effects of the pooled data:
+
+    python experiments/<experiment>/resampling.py
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+from helpers import load_data
+from recall_analysis import category_crp, group_trials, valid_recalls
+
+
+def _trial_totals(
+    data: dict[str, np.ndarray], by: tuple[str, ...], actual: np.ndarray, possible: np.ndarray
+) -> pd.DataFrame:
+    """Sum per-trial counts into one row per subject and group."""
+    codes, group_keys = group_trials(data, ("subject", *by))
+    totals = group_keys.copy()
+    totals["actual"] = np.bincount(codes, weights=actual, minlength=len(group_keys))
+    totals["possible"] = np.bincount(codes, weights=possible, minlength=len(group_keys))
+    return totals
+
+
+def target_success_totals(
+    data: dict[str, np.ndarray], by: tuple[str, ...] = ()
+) -> pd.DataFrame:
+    """Count successful category cues out of all cued recall events, per subject.
+
+    Args:
+        data: Converted EMBAM data with 'subject', 'category_cues' and 'target_success'.
+        by: Trial-level fields to split each subject's totals by.
+
+    Returns:
+        One row per subject and group with the 'actual' and 'possible' counts.
+    """
+    actual = np.asarray(data["target_success"]).sum(axis=1)
+    possible = (np.asarray(data["category_cues"]) != 0).sum(axis=1)
+    return _trial_totals(data, by, actual, possible)
+
+
+def recall_totals(
+    data: dict[str, np.ndarray], by: tuple[str, ...] = ("condition",)
+) -> pd.DataFrame:
+    """Count items recalled out of items studied, per subject.
+
+    Args:
+        data: EMBAM data with 'subject', 'recalls' and 'pres_itemids'.
+        by: Trial-level fields to split each subject's totals by.
+
+    Returns:
+        One row per subject and group with the 'actual' and 'possible' counts.
+    """
+    list_length = data["pres_itemids"].shape[1]
+    actual = valid_recalls(data["recalls"], list_length).sum(axis=1)
+    possible = (np.asarray(data["pres_itemids"]) != 0).sum(axis=1)
+    return _trial_totals(data, by, actual, possible)
+
+
+def clustering_totals(
+    data: dict[str, np.ndarray], by: tuple[str, ...] = ("condition",)
+) -> pd.DataFrame:
+    """Count same-category transitions out of transitions where one was available.
+
+    Args:
+        data: EMBAM data with 'subject', 'recalls', 'pres_itemids' and 'pres_categoryids'.
+        by: Trial-level fields to split each subject's totals by.
+
+    Returns:
+        One row per subject and group with the 'actual' and 'possible' counts.
+    """
+    return category_crp(data, ("subject", *by)).drop(columns="prob")
+
+
+def subject_matrices(
+    totals: pd.DataFrame, by: tuple[str, ...]
+) -> tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+    """Lay out per-subject totals as (subject, group) matrices.
+
+    Args:
+        totals: One row per subject and group with 'subject', the `by` fields, 'actual' and
+            'possible'.
+        by: The fields that define groups.
+
+    Returns:
+        A tuple containing the field values of each group and the 'actual' and 'possible'
+        matrices, with zeros where a subject has no trials in a group.
+    """
+    _, subject_codes = np.unique(totals["subject"].to_numpy(), return_inverse=True)
+    if by:
+        keys, group_codes = np.unique(
+            totals[list(by)].to_numpy(), axis=0, return_inverse=True
+        )
+        group_keys = pd.DataFrame(keys, columns=by)
+    else:
+        group_codes = np.zeros(len(totals), dtype=np.int64)
+        group_keys = pd.DataFrame(index=[0])
+
+    shape = (subject_codes.max(initial=-1) + 1, len(group_keys))
+    actual = np.zeros(shape)
+    possible = np.zeros(shape)
+    np.add.at(actual, (subject_codes, group_codes.ravel()), totals["actual"].to_numpy())
+    np.add.at(possible, (subject_codes, group_codes.ravel()), totals["possible"].to_numpy())
+    return group_keys, actual, possible
+
+
+def _ratio(actual: np.ndarray, possible: np.ndarray) -> np.ndarray:
+    """Divide summed counts, leaving NaN where nothing was possible."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return actual / possible
+
+
+def _bootstrap_block(
+    seed_sequence: np.random.SeedSequence,
+    resamples: int,
+    actual: np.ndarray,
+    possible: np.ndarray,
+) -> np.ndarray:
+    """Draw subjects with replacement and return the (resample, group) ratios."""
+    rng = np.random.default_rng(seed_sequence)
+    subject_count = len(actual)
+    draws = rng.integers(subject_count, size=(resamples, subject_count))
+    # how often each subject was drawn in each resample
+    flat = (np.arange(resamples)[:, np.newaxis] * subject_count + draws).ravel()
+    weights = np.bincount(flat, minlength=resamples * subject_count).reshape(
+        resamples, subject_count
+    )
+    return _ratio(weights @ actual, weights @ possible)
+
+
+def _permutation_block(
+    seed_sequence: np.random.SeedSequence,
+    resamples: int,
+    actual: np.ndarray,
+    possible: np.ndarray,
+) -> np.ndarray:
+    """Swap each subject's two group labels at random and return the ratio differences."""
+    rng = np.random.default_rng(seed_sequence)
+    swap = rng.random((resamples, len(actual))) < 0.5
+    first_actual = np.where(swap, actual[:, 1], actual[:, 0]).sum(axis=1)
+    first_possible = np.where(swap, possible[:, 1], possible[:, 0]).sum(axis=1)
+    second_actual = actual.sum() - first_actual
+    second_possible = possible.sum() - first_possible
+    return _ratio(first_actual, first_possible) - _ratio(second_actual, second_possible)
+
+
+def _run_blocks(
+    block: Callable[..., np.ndarray],
+    actual: np.ndarray,
+    possible: np.ndarray,
+    resamples: int,
+    seed: int,
+    processes: int | None,
+    block_size: int,
+) -> np.ndarray:
+    """Split resamples into seeded blocks, run them in a process pool and stack the results."""
+    sizes = [min(block_size, resamples - start) for start in range(0, resamples, block_size)]
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(sizes))
+    run = partial(block, actual=actual, possible=possible)
+    if processes == 1:
+        results = list(map(run, seed_sequences, sizes))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(run, seed_sequences, sizes))
+    return np.concatenate(results)
+
+
+def bootstrap_ci(
+    totals: pd.DataFrame,
+    by: tuple[str, ...] = (),
+    resamples: int = 10000,
+    confidence: float = 0.95,
+    seed: int = 0,
+    processes: int | None = None,
+    block_size: int = 1000,
+) -> pd.DataFrame:
+    """Estimate each group's ratio with a subject-level percentile bootstrap interval.
+
+    Args:
+        totals: Per-subject totals, e.g. from `recall_totals`.
+        by: The fields that define groups in `totals`.
+        resamples: Number of bootstrap resamples.
+        confidence: Coverage of the interval.
+        seed: Seed for the resampling.
+        processes: Worker processes; defaults to the CPU count, and 1 runs in this process.
+        block_size: Resamples drawn per block.
+
+    Returns:
+        One row per group with the 'estimate', the interval bounds 'ci_low' and 'ci_high',
+        and the number of 'subjects' with any possible events in the group.
+    """
+    group_keys, actual, possible = subject_matrices(totals, by)
+    ratios = _run_blocks(
+        _bootstrap_block, actual, possible, resamples, seed, processes, block_size
+    )
+    tail = (1 - confidence) / 2
+    # groups with nothing possible have no estimate in any resample
+    estimable = possible.sum(axis=0) > 0
+    ci_low, ci_high = np.full((2, len(group_keys)), np.nan)
+    ci_low[estimable], ci_high[estimable] = np.quantile(
+        ratios[:, estimable], [tail, 1 - tail], axis=0
+    )
+
+    table = group_keys.copy()
+    table["estimate"] = _ratio(actual.sum(axis=0), possible.sum(axis=0))
+    table["ci_low"], table["ci_high"] = ci_low, ci_high
+    table["subjects"] = (possible > 0).sum(axis=0)
+    return table
+
+
+def permutation_test(
+    totals: pd.DataFrame,
+    by: tuple[str, ...],
+    first: tuple,
+    second: tuple,
+    resamples: int = 10000,
+    seed: int = 0,
+    processes: int | None = None,
+    block_size: int = 1000,
+) -> dict[str, float]:
+    """Test whether two groups' ratios differ by swapping group labels within subjects.
+
+    Args:
+        totals: Per-subject totals, e.g. from `clustering_totals`.
+        by: The fields that define groups in `totals`.
+        first: Values of the `by` fields for the first group, e.g. `(2,)`.
+        second: Values of the `by` fields for the second group.
+        resamples: Number of permutations.
+        seed: Seed for the permutations.
+        processes: Worker processes; defaults to the CPU count, and 1 runs in this process.
+        block_size: Permutations drawn per block.
+
+    Returns:
+        The observed 'difference' (first minus second), its two-sided 'p_value', and the
+        number of 'subjects' contributing to either group.
+
+    Raises:
+        ValueError: If either group does not occur in `totals`.
+    """
+    group_keys, actual, possible = subject_matrices(totals, by)
+    columns = []
+    for values in (first, second):
+        matches = np.flatnonzero((group_keys.to_numpy() == np.asarray(values)).all(axis=1))
+        if len(matches) == 0:
+            raise ValueError(f"No group with {dict(zip(by, values))} in the totals.")
+        columns.append(matches[0])
+    actual, possible = actual[:, columns], possible[:, columns]
+    contributing = possible.sum(axis=1) > 0
+    actual, possible = actual[contributing], possible[contributing]
+
+    totals_ratio = _ratio(actual.sum(axis=0), possible.sum(axis=0))
+    difference = totals_ratio[0] - totals_ratio[1]
+    null = _run_blocks(
+        _permutation_block, actual, possible, resamples, seed, processes, block_size
+    )
+    null = null[np.isfinite(null)]
+    if len(null) == 0:
+        return {
+            "difference": float(difference),
+            "p_value": np.nan,
+            "subjects": int(contributing.sum()),
+        }
+    # a small tolerance so permutations equal to the observed split count as extreme
+    extreme = np.abs(null) >= np.abs(difference) - 1e-12
+    return {
+        "difference": float(difference),
+        "p_value": float((1 + extreme.sum()) / (1 + len(null))),
+        "subjects": int(contributing.sum()),
+    }
+
+
+if __name__ == "__main__":
+    data_path = "experiments/cat_target_short/expt_milind_pooled.h5"
+    resamples = 10000
+    seed = 0
+    processes = None  # one worker per CPU
+    # trial conditions: 0 = control, 1 = cued without success, 2 = successfully cued
+    conditions = {0: "control", 1: "cue missed", 2: "cue hit"}
+
+    data = load_data(data_path)
+    start = time.perf_counter()
+    print("Targeting success")
+    print(
+        bootstrap_ci(target_success_totals(data), (), resamples, seed=seed, processes=processes)
+        .to_string(index=False)
+    )
+    for name, totals in [
+        ("Recall probability", recall_totals(data)),
+        ("Same-category transitions", clustering_totals(data)),
+    ]:
+        print(f"\n{name} by condition")
+        table = bootstrap_ci(totals, ("condition",), resamples, seed=seed, processes=processes)
+        table["condition"] = table["condition"].map(conditions)
+        print(table.to_string(index=False))
+        for cued in (1, 2):
+            result = permutation_test(
+                totals, ("condition",), (cued,), (0,), resamples, seed, processes
+            )
+            print(
+                f"{conditions[cued]} - control: {result['difference']:+.3f}, "
+                f"p = {result['p_value']:.4f} ({result['subjects']} subjects)"
+            )
+    print(f"\nResampled in {time.perf_counter() - start:.1f} s")
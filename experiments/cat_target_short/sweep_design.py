@@ -0,0 +1,311 @@
+# ---
+# jupyter:
+#   jupytext:
+#     cell_metadata_filter: -all
+#     custom_cell_magics: kql
+#     text_representation:
+#       extension: .py
+#       format_name: percent
+#       format_version: '1.3'
+#       jupytext_version: 1.11.2
+#   kernelspec:
+#     display_name: online_experiments
+#     language: python
+#     name: python3
+# ---
+
+# %% [markdown]
+# Sweep the cueing parameters of `generate_design.py` over a grid, generating one design per
+# configuration in a process pool and ranking them by feasibility and balance. Designs are
+# built in memory and only written to disk when `keep_dir` is set.
+
+# %%
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import generate_design
+import numpy as np
+import pandas as pd
+from capacity_planner import plan_capacity
+from design_metrics import design_metrics
+from generate_design import (
+    aggregate_stimulus_pools,
+    generate_subject_blocks,
+    generate_valid_combinations,
+    middle_indices,
+)
+from helpers import (
+    design_provenance,
+    embam_dtype,
+    load_data,
+    load_stimulus_pool,
+    stream_data,
+)
+
+# balance metrics combined into the score feasible designs are ranked by; lower is better.
+# They are relative to the mean count, so designs that cue or present more are not
+# penalized for their size; the raw spreads are still reported alongside.
+RANKING_METRICS = [
+    "category_exposure_relative_spread",
+    "cue_position_relative_spread",
+    "trial_type_position_relative_spread",
+    "item_cue_target_ratio",
+]
+
+
+# %%
+def evaluate_design(
+    parameters: dict[str, int | float],
+    labels: list[str],
+    stimulus_pools: list[list[str]],
+    seed: int = 0,
+    keep_dir: str | None = None,
+) -> dict[str, object]:
+    """Generate one design configuration and score it.
+
+    Args:
+        parameters: Design parameters, named as in `generate_subject_blocks` ('list_length',
+            'subject_count', 'trial_count', 'control_proportion', 'cue_count',
+            'total_recalls', 'cue_region_size', 'spacing').
+        labels: Category labels, in pool order.
+        stimulus_pools: The stimulus pools corresponding to each label.
+        seed: Seed for both random and np.random.
+        keep_dir: Directory to save the design in, or None to discard it.
+
+    Returns:
+        The parameters with 'feasible', an 'error' message for infeasible configurations,
+        the `design_metrics` summary, 'seconds' spent, and the saved 'path' if kept.
+    """
+    start = time.perf_counter()
+    row: dict[str, object] = dict(parameters, feasible=False, error="")
+    list_length = parameters["list_length"]
+    trial_count = parameters["trial_count"]
+    cued_trials = trial_count - int(trial_count * parameters["control_proportion"])
+
+    capacity, _ = plan_capacity(
+        labels,
+        [len(pool) for pool in stimulus_pools],
+        np.arange(list_length),
+        trial_count,
+        parameters["subject_count"],
+        cued_trials * parameters["cue_count"],
+        depleting=True,
+    )
+    if parameters["cue_region_size"] > list_length:
+        row["error"] = "cue region longer than the list"
+    elif not generate_valid_combinations(
+        middle_indices(list_length, parameters["cue_region_size"]),
+        parameters["cue_count"],
+        parameters["spacing"],
+    ):
+        row["error"] = "no cue combination satisfies the spacing"
+    elif parameters["cue_count"] > (parameters["total_recalls"] + 1) // 2:
+        row["error"] = "too few recall events to alternate cues with free recall"
+    elif not capacity["feasible"]:
+        row["error"] = f"pools support at most {capacity['max_trials']} trials"
+    if row["error"]:
+        row["seconds"] = time.perf_counter() - start
+        return row
+
+    aggregated_stimulus_pool, aggregated_stimulus_labels = aggregate_stimulus_pools(
+        stimulus_pools, labels
+    )
+    random.seed(seed)
+    np.random.seed(seed)
+    blocks = generate_subject_blocks(
+        labels,
+        stimulus_pools,
+        trial_count,
+        parameters["subject_count"],
+        list_length,
+        parameters["cue_count"],
+        parameters["total_recalls"],
+        parameters["control_proportion"],
+        parameters["cue_region_size"],
+        parameters["spacing"],
+        aggregated_stimulus_pool,
+    )
+
+    if keep_dir is None:
+        subject_blocks = list(blocks)
+        data = {
+            key: np.concatenate([block[key] for block in subject_blocks])
+            for key in subject_blocks[0]
+        }
+    else:
+        provenance = design_provenance(
+            dict(parameters, labels=labels), stimulus_pools, seed, generate_design.__file__
+        )
+        row["path"] = os.path.join(keep_dir, f"cuefr_{provenance['design_hash'][:12]}.h5")
+        stream_data(
+            blocks,
+            row["path"],
+            {
+                "items": aggregated_stimulus_pool,
+                "item_labels": aggregated_stimulus_labels,
+                "categories": labels,
+            },
+            dtypes={"subject": embam_dtype("subject", max_value=parameters["subject_count"])},
+            attrs=provenance,
+        )
+        data = load_data(row["path"])
+
+    summary, _ = design_metrics(data, aggregated_stimulus_labels, labels)
+    row.update(summary, feasible=True, seconds=time.perf_counter() - start)
+    return row
+
+
+# %%
+def run_sweep(
+    grid: dict[str, list[int | float]],
+    base_parameters: dict[str, int | float],
+    labels: list[str],
+    stimulus_pools: list[list[str]],
+    seed: int = 0,
+    processes: int | None = None,
+    keep_dir: str | None = None,
+) -> pd.DataFrame:
+    """Evaluate every combination of grid values in a process pool and rank the designs.
+
+    Args:
+        grid: Values to try for each swept parameter.
+        base_parameters: Values of the parameters that are not swept.
+        labels: Category labels, in pool order.
+        stimulus_pools: The stimulus pools corresponding to each label.
+        seed: Seed used for every configuration, so differences come from the parameters.
+        processes: Worker processes; defaults to the CPU count.
+        keep_dir: Directory to save every feasible design in, or None to discard them.
+
+    Returns:
+        The configurations ranked by `rank_results`.
+    """
+    names = list(grid)
+    configurations = [
+        dict(base_parameters, **dict(zip(names, values)))
+        for values in itertools.product(*grid.values())
+    ]
+    if keep_dir is not None:
+        os.makedirs(keep_dir, exist_ok=True)
+
+    evaluate = partial(
+        evaluate_design, labels=labels, stimulus_pools=stimulus_pools, seed=seed, keep_dir=keep_dir
+    )
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        rows = list(pool.map(evaluate, configurations))
+
+    return rank_results(pd.DataFrame(rows))
+
+
+def rank_results(results: pd.DataFrame) -> pd.DataFrame:
+    """Rank feasible configurations by a composite balance score.
+
+    Each of the `RANKING_METRICS` is divided by its mean over the feasible configurations,
+    and the 'balance_score' is the mean of these ratios. A metric then moves the score in
+    proportion to how much it varies across the sweep, so one that barely varies cannot
+    decide the order alone as it would in a lexicographic sort.
+
+    Args:
+        results: One row per configuration with 'feasible' and, for feasible ones, the
+            ranking metrics.
+
+    Returns:
+        The configurations, feasible designs first in order of increasing 'balance_score',
+        with a 1-indexed 'rank' column (missing for infeasible configurations).
+    """
+    results = results.copy()
+    feasible = results["feasible"].to_numpy(dtype=bool)
+    ranking = [metric for metric in RANKING_METRICS if metric in results]
+    scaled = results.loc[feasible, ranking].astype(np.float64)
+    # metrics that are 0 for every configuration do not contribute
+    scaled = (scaled / scaled.mean().replace(0, np.nan)).fillna(0.0)
+    results["balance_score"] = np.nan
+    results.loc[feasible, "balance_score"] = scaled.mean(axis=1) if ranking else 0.0
+    results = results.sort_values(
+        ["feasible", "balance_score"], ascending=[False, True], kind="stable"
+    ).reset_index(drop=True)
+    results["rank"] = (
+        pd.Series(np.arange(1, len(results) + 1)).where(results["feasible"]).astype("Int64")
+    )
+    return results
+
+
+def check_size_invariance(
+    data: dict[str, np.ndarray], item_labels: list[str], labels: list[str], copies: int = 2
+) -> None:
+    """Check that repeating every subject of a design leaves its ranking metrics unchanged.
+
+    The repeated design is exactly as balanced but `copies` times larger, so it must rank
+    the same as the original.
+
+    Args:
+        data: EMBAM design with 'subject', 'pres_itemids' and 'category_cue_indices'.
+        item_labels: Category label of each item in the aggregated pool.
+        labels: The category labels.
+        copies: How many times to repeat the subjects.
+
+    Raises:
+        ValueError: If any ranking metric differs between the two designs.
+    """
+    # give each copy subject IDs past those of the previous one
+    offset = int(data["subject"].max()) + 1
+    repeated = {key: np.concatenate([value] * copies) for key, value in data.items()}
+    repeated["subject"] = np.concatenate(
+        [data["subject"] + copy * offset for copy in range(copies)]
+    )
+    original, _ = design_metrics(data, item_labels, labels)
+    larger, _ = design_metrics(repeated, item_labels, labels)
+    changed = [
+        metric for metric in RANKING_METRICS if not np.isclose(original[metric], larger[metric])
+    ]
+    if changed:
+        raise ValueError(f"Ranking metrics depend on design size: {', '.join(changed)}")
+
+
+# %%
+if __name__ == "__main__":
+    # parameters held fixed across the sweep (see generate_design.py)
+    base_parameters = {
+        "list_length": 6,
+        "subject_count": 300,
+        "trial_count": 20,
+        "control_proportion": 4 / 10,
+        "cue_count": 1,
+        "total_recalls": 6,
+        "cue_region_size": 4,
+        "spacing": 2,
+    }
+    grid = {
+        "cue_region_size": [2, 3, 4, 5, 6],
+        "spacing": [0, 1, 2],
+        "control_proportion": [0.2, 0.3, 0.4, 0.5],
+        "cue_count": [1, 2],
+    }
+    seed = 0
+    processes = None  # one worker per CPU
+    keep_dir = None  # e.g. "experiments/cat_target_short/sweep" to save every design
+    target_results_path = "experiments/cat_target_short/sweep_results.csv"
+
+    # the sweep draws from the pools of the last generated design
+    stimulus_pool = load_stimulus_pool("experiments/cat_target_short/assets/cuefr_pool.txt")
+    stimulus_labels = load_stimulus_pool("experiments/cat_target_short/assets/cuefr_labels.txt")
+    labels = load_stimulus_pool("experiments/cat_target_short/assets/cuefr_category_pool.txt")
+    stimulus_pools = [
+        [stimulus for stimulus, label in zip(stimulus_pool, stimulus_labels) if label == category]
+        for category in labels
+    ]
+
+    # a design repeated to twice its size must rank the same
+    check_size_invariance(
+        load_data("experiments/cat_target_short/cuefr.h5"), stimulus_labels, labels
+    )
+
+    start = time.perf_counter()
+    results = run_sweep(grid, base_parameters, labels, stimulus_pools, seed, processes, keep_dir)
+    print(f"Evaluated {len(results)} configurations in {time.perf_counter() - start:.1f} s")
+    columns = ["rank", *grid, "feasible", "balance_score", *RANKING_METRICS, "error"]
+    print(results[columns].to_string(index=False))
+    results.to_csv(target_results_path, index=False)
@@ -0,0 +1,34 @@
+""" Purpose: Check how rank_results orders sweep configurations:
+        -A later balance metric changes the order when the first metric only differs by noise
+        -Infeasible configurations come last, without a rank
+
+    Run with pytest, or as a script from the repository root.
+"""
+import numpy as np
+import pandas as pd
+
+from sweep_design import RANKING_METRICS, rank_results
+
+
+def test_later_metric_changes_order():
+    # configuration "a" is marginally better on the first metric, but far less balanced in
+    # cue positions; a lexicographic sort would rank it first
+    results = pd.DataFrame(
+        {
+            "name": ["a", "b", "c"],
+            "feasible": [True, True, False],
+            RANKING_METRICS[0]: [0.02150, 0.02170, np.nan],
+            RANKING_METRICS[1]: [0.50, 0.01, np.nan],
+            RANKING_METRICS[2]: [0.40, 0.40, np.nan],
+            RANKING_METRICS[3]: [1.50, 1.50, np.nan],
+        }
+    )
+    ranked = rank_results(results)
+    assert ranked["name"].tolist() == ["b", "a", "c"]
+    assert ranked["rank"].tolist()[:2] == [1, 2]
+    assert pd.isna(ranked["rank"].iloc[2])
+
+
+if __name__ == "__main__":
+    test_later_metric_changes_order()
+    print("ok")
@@ -0,0 +1,236 @@
+"""Vectorized checks of generated designs against their category and cueing rules.
+
+Each check works on whole EMBAM arrays at once and returns a DataFrame of violations with one
+row per offending study position, so an empty frame means the rule holds. Subjects are
+reported as stored in the design; trials and positions are 1-indexed.
+"""
+
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+VIOLATION_COLUMNS = ["rule", "subject", "trial", "position", "itemid", "category"]
+
+
+def subject_trial_numbers(subject: np.ndarray) -> np.ndarray:
+    """Number each trial within its subject, assuming a subject's trials are contiguous.
+
+    Args:
+        subject: Subject ID of each trial.
+
+    Returns:
+        1-indexed trial number of each trial within its subject.
+    """
+    subject = np.asarray(subject).ravel()
+    starts = np.flatnonzero(np.r_[True, subject[1:] != subject[:-1]])
+    lengths = np.diff(np.r_[starts, len(subject)])
+    return np.arange(len(subject)) - np.repeat(starts, lengths) + 1
+
+
+def item_category_ids(
+    pres_itemids: np.ndarray, item_labels: list[str], labels: list[str]
+) -> np.ndarray:
+    """Map each presented item to the category it was drawn from.
+
+    Args:
+        pres_itemids: Presented stimulus IDs (1-indexed into the aggregated pool).
+        item_labels: Category label of each item in the aggregated pool.
+        labels: The category labels, in the order that defines category IDs.
+
+    Returns:
+        Array shaped like `pres_itemids` of 1-indexed category IDs; padding stays 0.
+    """
+    label_index = {label: i + 1 for i, label in enumerate(labels)}
+    lookup = np.array([0] + [label_index[label] for label in item_labels])
+    return lookup[pres_itemids]
+
+
+def _violations(
+    rule: str,
+    rows: np.ndarray,
+    positions: np.ndarray,
+    subject: np.ndarray,
+    pres_itemids: np.ndarray,
+    categories: np.ndarray,
+) -> pd.DataFrame:
+    """Collect flagged (trial row, 0-indexed position) pairs into a violation table."""
+    return pd.DataFrame(
+        {
+            "rule": rule,
+            "subject": subject[rows],
+            "trial": subject_trial_numbers(subject)[rows],
+            "position": positions + 1,
+            "itemid": pres_itemids[rows, positions],
+            "category": categories[rows, positions],
+        },
+        columns=VIOLATION_COLUMNS,
+    )
+
+
+def find_template_violations(
+    categories: np.ndarray,
+    subject: np.ndarray,
+    pres_itemids: np.ndarray,
+    template: np.ndarray | None = None,
+    rule: str = "within_trial_repeat",
+) -> pd.DataFrame:
+    """Flag study positions whose category pattern departs from the list template.
+
+    Two positions must share a category exactly when they share a template slot. The default
+    template gives every position its own slot, i.e. no category repeats within a trial.
+
+    Args:
+        categories: Category ID of each presentation.
+        subject: Subject ID of each trial.
+        pres_itemids: Presented stimulus IDs.
+        template: Slot of each serial position (e.g., `list("ABCDDDEFGDDDHIJ")`).
+        rule: Name to report violations under.
+
+    Returns:
+        Violation table, one row per position that shares a category it should not (or does
+        not share one it should).
+    """
+    subject = np.asarray(subject).ravel()
+    list_length = categories.shape[1]
+    template = np.arange(list_length) if template is None else np.asarray(template)
+
+    expected = template[:, np.newaxis] == template[np.newaxis, :]
+    observed = categories[:, :, np.newaxis] == categories[:, np.newaxis, :]
+    rows, positions = np.nonzero((observed != expected).any(axis=2))
+    return _violations(rule, rows, positions, subject, pres_itemids, categories)
+
+
+def find_consecutive_trial_repeats(
+    categories: np.ndarray, subject: np.ndarray, pres_itemids: np.ndarray
+) -> pd.DataFrame:
+    """Flag categories presented again in a subject's next trial.
+
+    Args:
+        categories: 1-indexed category ID of each presentation.
+        subject: Subject ID of each trial.
+        pres_itemids: Presented stimulus IDs.
+
+    Returns:
+        Violation table, one row per position of the later trial reusing a category.
+    """
+    subject = np.asarray(subject).ravel()
+    trial_count = len(categories)
+
+    present = np.zeros((trial_count, categories.max() + 1), dtype=bool)
+    present[np.arange(trial_count)[:, np.newaxis], categories] = True
+    present[:, 0] = False  # padding is not a category
+
+    same_subject = subject[1:] == subject[:-1]
+    repeated = np.take_along_axis(present[:-1], categories[1:], axis=1)
+    rows, positions = np.nonzero(repeated & same_subject[:, np.newaxis])
+    return _violations(
+        "consecutive_trial_repeat", rows + 1, positions, subject, pres_itemids, categories
+    )
+
+
+def find_repeated_cues(
+    category_cue_indices: np.ndarray,
+    categories: np.ndarray,
+    subject: np.ndarray,
+    pres_itemids: np.ndarray,
+) -> pd.DataFrame:
+    """Flag cued items that a subject was already cued with on an earlier trial.
+
+    Repeating a cued category is allowed; only the cued word itself must be new.
+
+    Args:
+        category_cue_indices: 1-indexed serial positions cued in each trial; 0 for none.
+        categories: Category ID of each presentation.
+        subject: Subject ID of each trial.
+        pres_itemids: Presented stimulus IDs.
+
+    Returns:
+        Violation table, one row per repeated cue after its first occurrence.
+    """
+    subject = np.asarray(subject).ravel()
+    rows, cue_slots = np.nonzero(category_cue_indices > 0)
+    positions = category_cue_indices[rows, cue_slots].astype(np.int64) - 1
+    cued_items = np.stack([subject[rows], pres_itemids[rows, positions]], axis=1)
+
+    _, first_index, inverse = np.unique(
+        cued_items, axis=0, return_index=True, return_inverse=True
+    )
+    repeat = first_index[inverse.ravel()] != np.arange(len(rows))
+    return _violations(
+        "repeated_cue", rows[repeat], positions[repeat], subject, pres_itemids, categories
+    )
+
+
+def validate_design(
+    data: dict[str, np.ndarray],
+    item_labels: list[str],
+    labels: list[str],
+    template: np.ndarray | None = None,
+) -> pd.DataFrame:
+    """Check a design against every rule at once.
+
+    Args:
+        data: EMBAM design with 'subject', 'pres_itemids' and 'category_cue_indices'.
+        item_labels: Category label of each item in the aggregated pool.
+        labels: The category labels.
+        template: Slot of each serial position; defaults to all positions distinct. When
+            given, violations are reported under 'block_template'.
+
+    Returns:
+        Violation table across all rules; empty if the design is valid.
+    """
+    subject = data["subject"].ravel()
+    pres_itemids = data["pres_itemids"]
+    categories = item_category_ids(pres_itemids, item_labels, labels)
+
+    return pd.concat(
+        [
+            find_template_violations(
+                categories,
+                subject,
+                pres_itemids,
+                template,
+                rule="within_trial_repeat" if template is None else "block_template",
+            ),
+            find_consecutive_trial_repeats(categories, subject, pres_itemids),
+            find_repeated_cues(data["category_cue_indices"], categories, subject, pres_itemids),
+        ],
+        ignore_index=True,
+    )
+
+
+def write_trial_summary(
+    target_path: str,
+    data: dict[str, np.ndarray],
+    stimulus_pool: list[str],
+    item_labels: list[str],
+    subjects: Iterable[int],
+):
+    """Write a human-readable listing of every trial of the selected subjects.
+
+    Lines are written trial by trial, so only the selected rows are ever formatted.
+
+    Args:
+        target_path: The path to the text file.
+        data: EMBAM design with 'subject', 'pres_itemids' and 'category_cue_indices'.
+        stimulus_pool: The aggregated stimulus pool.
+        item_labels: Category label of each item in the aggregated pool.
+        subjects: Subject IDs to include.
+    """
+    subject = data["subject"].ravel()
+    trial_numbers = subject_trial_numbers(subject)
+    selected_rows = np.flatnonzero(np.isin(subject, list(subjects)))
+
+    with open(target_path, "w") as f:
+        for row in selected_rows:
+            f.write(f"TRIAL {trial_numbers[row]} / SUBJECT {subject[row]}:\n")
+            for pos, stim_id in enumerate(data["pres_itemids"][row]):
+                f.write(f"  {pos + 1:2}) {item_labels[stim_id - 1]} : {stimulus_pool[stim_id - 1]}\n")
+
+            cued_positions = [str(idx) for idx in data["category_cue_indices"][row] if idx > 0]
+            if cued_positions:
+                f.write(f"  Cued position(s): {', '.join(cued_positions)}\n")
+            else:
+                f.write("  Cued position(s): Control\n")
+            f.write("\n")
@@ -0,0 +1,171 @@
+"""Word association space (WAS) similarities, parsed once and cached as memory-mapped arrays.
+
+A WAS matrix ships as a whitespace-separated text file whose rows and columns follow a word
+pool file, e.g. `assets/asymfr/toronto_was.txt` over `assets/asymfr/toronto.txt`. Parsing it
+takes seconds, so the parsed matrix is saved as a `.npy` named after the SHA-256 of the text
+file and later opened with `mmap_mode="r"`. Editing the text file changes the hash, so a
+stale cache is never read.
+
+The similarities of a stimulus pool are cached the same way, laid out by item ID: entry
+[i, j] is the similarity of items i and j of the pool (1-indexed, as in 'pres_itemids'),
+row and column 0 are padding, and items missing from the WAS pool are NaN. Any list
+construction or analysis code can then index it directly with EMBAM item IDs.
+
+Run as a script with a WAS word pool and matrix to build the caches and report the coverage
+of the cuefr pool:
+
+    python experiments/cat_target_short/was_store.py was_wordpool was_matrix
+"""
+
+import hashlib
+import os
+import sys
+
+import numpy as np
+from helpers import load_stimulus_pool
+
+WAS_DTYPE = np.float32
+
+
+def file_digest(path: str) -> str:
+    """Compute the SHA-256 hex digest of a file, reading it in blocks.
+
+    Args:
+        path: The path to the file.
+
+    Returns:
+        The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_path(cache_dir: str, stem: str, paths: list[str]) -> str:
+    """Name a cache file after the combined digest of the files it was built from."""
+    digest = hashlib.sha256("".join(file_digest(path) for path in paths).encode("utf-8"))
+    return os.path.join(cache_dir, f"{stem}_{digest.hexdigest()[:16]}.npy")
+
+
+def _save_and_map(path: str, array: np.ndarray) -> np.ndarray:
+    """Write an array atomically, then reopen it memory-mapped."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial_path = f"{path}.{os.getpid()}.partial.npy"
+    np.save(partial_path, array)
+    os.replace(partial_path, path)
+    return np.load(path, mmap_mode="r")
+
+
+def load_was_matrix(
+    wordpool_path: str, matrix_path: str, cache_dir: str | None = None
+) -> np.ndarray:
+    """Load a WAS similarity matrix, parsing the text file only if it is not cached.
+
+    Args:
+        wordpool_path: The path to the word pool that orders the matrix rows and columns.
+        matrix_path: The path to the whitespace-separated similarity matrix.
+        cache_dir: Directory for cached arrays; defaults to a `was_cache` directory beside
+            the matrix.
+
+    Returns:
+        The read-only, memory-mapped (word, word) similarity matrix.
+
+    Raises:
+        ValueError: If the matrix is not square with one row per word of the pool.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(matrix_path), "was_cache")
+    stem = os.path.splitext(os.path.basename(matrix_path))[0]
+    cache_path = _cache_path(cache_dir, stem, [matrix_path])
+    if os.path.exists(cache_path):
+        return np.load(cache_path, mmap_mode="r")
+
+    word_count = len(load_stimulus_pool(wordpool_path))
+    with open(matrix_path, "r") as f:
+        values = np.array(f.read().split(), dtype=WAS_DTYPE)
+    if values.size != word_count * word_count:
+        raise ValueError(
+            f"{matrix_path} has {values.size} values; expected {word_count}x{word_count} "
+            f"for the {word_count} words of {wordpool_path}."
+        )
+    return _save_and_map(cache_path, values.reshape(word_count, word_count))
+
+
+def align_similarity(
+    matrix: np.ndarray, was_words: list[str], items: list[str]
+) -> np.ndarray:
+    """Lay out WAS similarities by item ID of a stimulus pool.
+
+    Words are matched case-insensitively.
+
+    Args:
+        matrix: The (word, word) WAS similarity matrix.
+        was_words: The WAS word pool ordering the matrix.
+        items: The stimulus pool; item ID i is `items[i - 1]`.
+
+    Returns:
+        The (item ID, item ID) similarity matrix, with padding row and column 0 and NaN for
+        items not in the WAS pool.
+    """
+    rows = {word.upper(): row for row, word in enumerate(was_words)}
+    # WAS row of each item ID; -1 for padding and items without a WAS entry
+    item_rows = np.array([-1] + [rows.get(item.upper(), -1) for item in items])
+    found = item_rows >= 0
+    similarity = np.full((len(item_rows), len(item_rows)), np.nan, dtype=WAS_DTYPE)
+    similarity[np.ix_(found, found)] = matrix[np.ix_(item_rows[found], item_rows[found])]
+    return similarity
+
+
+def pool_similarity(
+    pool_path: str,
+    wordpool_path: str,
+    matrix_path: str,
+    cache_dir: str | None = None,
+) -> np.ndarray:
+    """Look up the WAS similarity of every pair of items in a stimulus pool file.
+
+    Args:
+        pool_path: The path to the stimulus pool that defines item IDs, e.g. `cuefr_pool.txt`.
+        wordpool_path: The path to the WAS word pool.
+        matrix_path: The path to the WAS similarity matrix.
+        cache_dir: Directory for cached arrays; defaults to a `was_cache` directory beside
+            the matrix.
+
+    Returns:
+        The read-only, memory-mapped similarity matrix from `align_similarity`.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(matrix_path), "was_cache")
+    stem = os.path.splitext(os.path.basename(pool_path))[0]
+    cache_path = _cache_path(cache_dir, f"{stem}_was", [pool_path, wordpool_path, matrix_path])
+    if os.path.exists(cache_path):
+        return np.load(cache_path, mmap_mode="r")
+
+    similarity = align_similarity(
+        load_was_matrix(wordpool_path, matrix_path, cache_dir),
+        load_stimulus_pool(wordpool_path),
+        load_stimulus_pool(pool_path),
+    )
+    return _save_and_map(cache_path, similarity)
+
+
+if __name__ == "__main__":
+    # the PEERS WAS pool (`peers4-WAS.txt` and `wasnorm_wordpool.txt`) ships without its
+    # matrix, and the Toronto matrix of the asymfr assets covers none of the cuefr pool, so
+    # there is no default to fall back on
+    if len(sys.argv) != 3:
+        sys.exit(f"usage: python {sys.argv[0]} was_wordpool was_matrix")
+    was_wordpool_path, was_matrix_path = sys.argv[1:3]
+    pool_path = "experiments/cat_target_short/assets/cuefr_pool.txt"
+
+    similarity = pool_similarity(pool_path, was_wordpool_path, was_matrix_path)
+    covered = ~np.isnan(similarity[1:, 1:].diagonal())
+    if not covered.any():
+        sys.exit(
+            f"None of the {len(covered)} items of {pool_path} are in {was_wordpool_path}; "
+            "use a WAS matrix whose word pool covers the stimulus pool."
+        )
+    print(f"{covered.sum()} of {len(covered)} items of {pool_path} have WAS similarities")
+    print(f"Cached in {os.path.dirname(similarity.filename)}")
@@ -1,5 +1,13 @@
 import random
 
+from helpers import compile_layout, fill_layout
+
+# Study-list layout of each trial type; positions sharing a letter share a category
+TRIAL_LAYOUTS = {
+    "block": "ABC DDD EFG DDD HIJ",  # two blocks of the same category
+    "unique": "ABCDE FGHIJ KLMNO",  # each word from a different category
+}
+
 def load_category_data(category_file, word_file, label_file):
     """
     Loads categories and words from the provided text files and maps words to their categories.
@@ -38,6 +46,7 @@ def generate_trial_data(num_trials, list_length, categories, words, block_trial_
     Generates trial data with specified proportions for two trial types:
     1. Block trials: Includes two blocks of the same category within the list.
     2. Unique category trials: Each word comes from a different category.
+    The category layout of each trial type is declared in TRIAL_LAYOUTS.
 
     Arguments:
         num_trials (int): Number of trials in the session.
@@ -58,45 +67,29 @@ def generate_trial_data(num_trials, list_length, categories, words, block_trial_
     trial_types = ["block"] * num_block_trials + ["unique"] * num_unique_trials
     random.shuffle(trial_types)
 
+    # Compile each layout once; every trial type then shares the same fill
+    layouts = {trial_type: compile_layout(template) for trial_type, template in TRIAL_LAYOUTS.items()}
+    for trial_type in set(trial_types):
+        assert len(layouts[trial_type]) == list_length, f"{trial_type} layout must have {list_length} positions"
+
     trial_categories = []
     trial_words = []
     previous_trial_categories = set()  # Track categories used in the previous trial
 
     for trial_type in trial_types:
-        if trial_type == "block":
-            # Block Trial: Two blocks of the same category
-            usable_categories = [cat for cat in categories if words.get(cat) and cat not in previous_trial_categories]
-
-            # Ensure there are enough categories to fill the list
-            if len(usable_categories) < list_length:
-                usable_categories = [cat for cat in categories if words.get(cat)]  # Reset usable categories
-
-            # Shuffle and pick a block category
-            random.shuffle(usable_categories)
-            block_cat = random.choice(usable_categories)
-            remaining_categories = [cat for cat in usable_categories if cat != block_cat]
-
-            # Assign categories
-            trial_category_list = [None] * list_length
-            trial_category_list[3:6] = [block_cat] * 3  # Block 1
-            trial_category_list[9:12] = [block_cat] * 3  # Block 2
-
-            # Fill remaining positions with unique categories
-            unique_positions = [i for i in range(list_length) if i not in range(3, 6) and i not in range(9, 12)]
-            for i, pos in enumerate(unique_positions):
-                trial_category_list[pos] = remaining_categories[i % len(remaining_categories)]
-
-        elif trial_type == "unique":
-            # Unique Category Trial: Each word from a different category
-            usable_categories = [cat for cat in categories if words.get(cat) and cat not in previous_trial_categories]
-
-            # Ensure enough unique categories for the trial
-            if len(usable_categories) < list_length:
-                usable_categories = [cat for cat in categories if words.get(cat)]  # Reset usable categories
-
-            # Shuffle and pick categories
-            random.shuffle(usable_categories)
-            trial_category_list = usable_categories[:list_length]  # Use only the first `list_length` categories
+        layout = layouts[trial_type]
+        slot_count = layout.max() + 1
+
+        usable_categories = [cat for cat in categories if words.get(cat) and cat not in previous_trial_categories]
+
+        # Ensure there are enough categories to fill the list
+        if len(usable_categories) < list_length:
+            usable_categories = [cat for cat in categories if words.get(cat)]  # Reset usable categories
+
+        # Shuffle and give each slot of the layout its own category (wrapping if too few)
+        random.shuffle(usable_categories)
+        slot_categories = [usable_categories[i % len(usable_categories)] for i in range(slot_count)]
+        trial_category_list = fill_layout(slot_categories, layout).tolist()
 
         # Assign words to the categories
         trial_word_list = []
@@ -1,3 +1,9 @@
+import ast
+import hashlib
+import json
+import os
+from typing import Iterable
+
 import h5py
 import numpy as np
 import pandas as pd
@@ -16,33 +22,737 @@ def load_stimulus_pool(stimulus_pool_path: str) -> list[str]:
         return [line.strip() for line in f.readlines()]
 
 
-def load_data(data_path: str) -> dict[str, np.ndarray]:
+def compile_layout(template: str) -> np.ndarray:
+    """Compile a study-list template into the slot index of each serial position.
+
+    Each character of the template names a slot, and positions sharing a character are filled
+    from the same category. Whitespace is ignored, so "ABC DDD EFG DDD HIJ" describes a
+    15-item list whose 4th-6th and 10th-12th items share one category.
+
+    Args:
+        template: One character per serial position.
+
+    Returns:
+        Slot index of each serial position, with slots numbered by first appearance.
+    """
+    symbols = [symbol for symbol in template if not symbol.isspace()]
+    _, first_positions, slots = np.unique(symbols, return_index=True, return_inverse=True)
+    slot_order = np.argsort(np.argsort(first_positions))
+    return slot_order[slots]
+
+
+def fill_layout(slot_values: np.ndarray, slots: np.ndarray) -> np.ndarray:
+    """Expand per-slot values (e.g., category indices) to per-position values.
+
+    Args:
+        slot_values: Values for each slot in the last axis; leading axes (e.g., trials) are
+            filled in the same assignment.
+        slots: Compiled layout from `compile_layout`.
+
+    Returns:
+        Array with the last axis replaced by one value per serial position.
+    """
+    return np.asarray(slot_values)[..., slots]
+
+
+def _greedy_category_set(
+    set_size: int, capacities: np.ndarray, previous: np.ndarray, trials_left: int
+) -> np.ndarray | None:
+    """Pick the categories with the most usable capacity, or None if too few are available."""
+    available = np.flatnonzero((capacities > 0) & ~previous)
+    if len(available) < set_size:
+        return None
+    # a category can fill at most every other one of the remaining trials
+    usable = np.minimum(capacities[available], (trials_left + 1) // 2)
+    return available[np.argsort(-usable, kind="stable")[:set_size]]
+
+
+def schedule_is_feasible(
+    trial_count: int,
+    set_size: int,
+    capacities: np.ndarray,
+    previous: np.ndarray | None = None,
+) -> bool:
+    """Check whether trials can each get distinct categories disjoint from the previous trial.
+
+    Choosing, trial by trial, the categories with the most usable capacity left succeeds
+    whenever any schedule exists, so one greedy pass decides feasibility exactly.
+
+    Args:
+        trial_count: Number of trials to schedule.
+        set_size: Number of distinct categories each trial needs.
+        capacities: Number of trials each category can still be used in.
+        previous: Boolean mask of categories used in the trial before the first one.
+
+    Returns:
+        True if a schedule exists.
+    """
+    capacities = np.array(capacities, dtype=np.int64)
+    previous = np.zeros(len(capacities), dtype=bool) if previous is None else previous.copy()
+    for trial in range(trial_count):
+        chosen = _greedy_category_set(set_size, capacities, previous, trial_count - trial)
+        if chosen is None:
+            return False
+        capacities[chosen] -= 1
+        previous[:] = False
+        previous[chosen] = True
+    return True
+
+
+def schedule_categories(
+    trial_count: int, set_size: int, capacities: np.ndarray
+) -> np.ndarray:
+    """Assign each trial a set of distinct categories sharing none with the previous trial.
+
+    Each trial's set is drawn uniformly from the categories not used in the previous trial,
+    and replaced by the greedy choice of `schedule_is_feasible` only when the draw would leave
+    the remaining trials unschedulable. Infeasible designs are reported before any trial is
+    sampled.
+
+    Args:
+        trial_count: Number of trials to schedule.
+        set_size: Number of distinct categories each trial needs.
+        capacities: Number of trials each category can be used in (e.g., its pool size when
+            every use draws one stimulus without replacement).
+
+    Returns:
+        Array of shape (trial_count, set_size) of category indices, in random order per trial.
+
+    Raises:
+        ValueError: If no schedule keeps consecutive trials disjoint within the capacities.
+    """
+    capacities = np.array(capacities, dtype=np.int64)
+    if not schedule_is_feasible(trial_count, set_size, capacities):
+        raise ValueError(
+            f"Cannot give {trial_count} trials {set_size} distinct categories each, disjoint "
+            f"from the previous trial, with category capacities {capacities.tolist()}"
+        )
+
+    schedule = np.zeros((trial_count, set_size), dtype=np.int64)
+    previous = np.zeros(len(capacities), dtype=bool)
+    for trial in range(trial_count):
+        available = np.flatnonzero((capacities > 0) & ~previous)
+        chosen = np.random.choice(available, set_size, replace=False)
+
+        remaining = capacities.copy()
+        remaining[chosen] -= 1
+        chosen_mask = np.zeros(len(capacities), dtype=bool)
+        chosen_mask[chosen] = True
+        if not schedule_is_feasible(trial_count - trial - 1, set_size, remaining, chosen_mask):
+            chosen = np.random.permutation(
+                _greedy_category_set(set_size, capacities, previous, trial_count - trial)
+            )
+
+        schedule[trial] = chosen
+        capacities[chosen] -= 1
+        previous[:] = False
+        previous[chosen] = True
+    return schedule
+
+
+def draw_least_exposed(candidate_ids: np.ndarray, *exposures: np.ndarray) -> int:
+    """Pick the candidate item used least so far, breaking ties at random.
+
+    Args:
+        candidate_ids: IDs of the items that may be drawn.
+        exposures: Counters indexed by item ID (e.g., presentations or cue-target uses),
+            compared in order, so later counters only break ties left by earlier ones.
+
+    Returns:
+        Index into `candidate_ids` of the chosen item.
+    """
+    least = np.arange(len(candidate_ids))
+    for exposure in exposures:
+        counts = exposure[candidate_ids[least]]
+        least = least[counts == counts.min()]
+    return int(least[np.random.randint(len(least))])
+
+
+def similarity_neighbors(
+    similarity: np.ndarray, cap: float, item_labels: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Index, for every item, the other items more similar to it than a cap.
+
+    The index is stored like a CSR sparse matrix, so the neighbors of one item are a slice
+    and marking them costs O(degree) rather than a pass over the pool.
+
+    Args:
+        similarity: Similarity of each pair of item IDs, with row and column 0 as padding;
+            NaN pairs never count as neighbors.
+        cap: Similarity above which two items are neighbors.
+        item_labels: Category of each item ID; if given, items of the same category are not
+            neighbors.
+
+    Returns:
+        A tuple containing the offset of each item ID's neighbors (one more entry than there
+        are rows) and the concatenated neighbor IDs.
+    """
+    with np.errstate(invalid="ignore"):
+        linked = np.asarray(similarity) > cap
+    np.fill_diagonal(linked, False)
+    if item_labels is not None:
+        item_labels = np.asarray(item_labels)
+        linked &= item_labels[:, np.newaxis] != item_labels[np.newaxis, :]
+    items, neighbor_ids = np.nonzero(linked)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(items, minlength=len(linked)))])
+    return offsets, neighbor_ids
+
+
+def item_neighbors(neighbors: tuple[np.ndarray, np.ndarray], item_id: int) -> np.ndarray:
+    """Look up the neighbor IDs of one item in an index from `similarity_neighbors`."""
+    offsets, neighbor_ids = neighbors
+    return neighbor_ids[offsets[item_id] : offsets[item_id + 1]]
+
+
+def williams_design(condition_count: int) -> np.ndarray:
+    """Build a Williams design: a Latin square balanced for first-order carryover.
+
+    Every condition appears equally often in every serial position, and every ordered
+    pair of distinct conditions appears as neighbours equally often. An odd number of
+    conditions needs the mirrored square as well, so the design then has twice as many rows.
+
+    Args:
+        condition_count: Number of conditions to order.
+
+    Returns:
+        Array of shape (rows, condition_count) of condition indices, one ordering per row.
+    """
+    # first row interleaves from both ends: 0, 1, n-1, 2, n-2, ...
+    steps = np.arange(condition_count)
+    first_row = np.where(
+        steps % 2 == 1, (steps + 1) // 2, (condition_count - steps // 2) % condition_count
+    )
+    square = (first_row[np.newaxis, :] + steps[:, np.newaxis]) % condition_count
+    if condition_count % 2 == 1:
+        square = np.concatenate([square, square[:, ::-1]])
+    return square
+
+
+def counterbalance_orders(condition_count: int, method: str = "williams") -> np.ndarray:
+    """Precompute the table of balanced trial orders that subjects cycle through.
+
+    Conditions are relabeled at random and the rows shuffled, which keeps the balance of the
+    design while leaving which subject gets which order unpredictable. Subject `s` takes row
+    `s % len(table)`, so position (and, for Williams designs, carryover) is exactly balanced
+    over every complete cycle of subjects.
+
+    Args:
+        condition_count: Number of trials to order; repeated trial types count separately.
+        method: 'williams' for a carryover-balanced design, 'latin' for a cyclic Latin square.
+
+    Returns:
+        Array of shape (rows, condition_count) of trial indices.
+
+    Raises:
+        ValueError: If the method is unknown.
+    """
+    if method == "williams":
+        square = williams_design(condition_count)
+    elif method == "latin":
+        steps = np.arange(condition_count)
+        square = (steps[np.newaxis, :] + steps[:, np.newaxis]) % condition_count
+    else:
+        raise ValueError(f"Unknown counterbalancing method: {method}")
+
+    relabel = np.random.permutation(condition_count)
+    return relabel[square][np.random.permutation(len(square))]
+
+
+# EMBAM dtype policy: ids are 1-indexed with 0 reserved for padding, so uint16 covers every
+# item and category pool; serial positions and small counts fit in uint8; flags are
+# bit-packed on disk. Fields not listed here keep their in-memory dtype.
+EMBAM_DTYPES: dict[str, type] = {
+    "subject": np.uint16,
+    "design_subject": np.uint16,
+    "pres_itemids": np.uint16,
+    "rec_itemids": np.uint16,
+    "pres_categoryids": np.uint16,
+    "rec_categoryids": np.uint16,
+    "category_cues": np.uint16,
+    "category_cue_itemids": np.uint16,
+    "listLength": np.uint8,
+    "block": np.uint8,
+    "condition": np.uint8,
+    "pres_itemnos": np.uint8,
+    "recalls": np.uint8,
+    "category_cue_indices": np.uint8,
+    "target_success": np.bool_,
+}
+# Value marking an unrecorded entry where 0 is a valid value (e.g., design row 0); fields not
+# listed here are padded with 0.
+EMBAM_PAD_VALUES: dict[str, int] = {
+    "design_subject": -1,
+}
+
+
+def embam_dtype(field: str, signed: bool = False, max_value: int = 0) -> np.dtype:
+    """Return the compact dtype to allocate an EMBAM field with.
+
+    Args:
+        field: The EMBAM field name.
+        signed: Whether the field may hold -1 (e.g., intrusions), in which case the signed
+            integer of the same width is returned.
+        max_value: The largest value the field must hold; the dtype is widened if needed.
+
+    Returns:
+        The dtype for the field. Fields outside the policy default to int64.
+    """
+    dtype = np.dtype(EMBAM_DTYPES.get(field, np.int64))
+    if signed and dtype.kind == "u":
+        dtype = np.dtype(f"i{dtype.itemsize}")
+    if dtype.kind != "b" and max_value > np.iinfo(dtype).max:
+        dtype = np.result_type(dtype, np.min_scalar_type(max_value))
+    return dtype
+
+
+def compact_data(data: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """Cast EMBAM fields to the compact dtypes in `EMBAM_DTYPES`.
+
+    Integer fields are widened past their policy dtype only when their values do not fit, so
+    negative codes or large subject counts are never truncated.
+
+    Args:
+        data: Data in EMBAM format.
+
+    Returns:
+        The same fields, cast to their compact dtypes.
+    """
+    compacted = {}
+    for key, value in data.items():
+        value = np.asarray(value)
+        if key not in EMBAM_DTYPES or value.dtype.kind not in "biu":
+            compacted[key] = value
+            continue
+        dtype = embam_dtype(key)
+        if dtype.kind != "b" and value.size > 0:
+            dtype = np.result_type(
+                dtype, np.min_scalar_type(value.min()), np.min_scalar_type(value.max())
+            )
+        compacted[key] = value.astype(dtype, copy=False)
+    return compacted
+
+
+def read_field(dataset: h5py.Dataset, upcast: bool = True) -> np.ndarray:
+    """Read one EMBAM field as stored on disk, unpacking bit-packed flags.
+
+    Args:
+        dataset: A dataset under the '/data' group.
+        upcast: Whether to widen integer fields to int64.
+
+    Returns:
+        The field in its stored (transposed) orientation.
+    """
+    if "packed_shape" in dataset.attrs:
+        shape = tuple(dataset.attrs["packed_shape"])
+        bits = np.unpackbits(dataset[()], count=int(np.prod(shape)))
+        return bits.reshape(shape).astype(bool)
+    value = dataset[()]
+    if upcast and value.dtype.kind in "iu":
+        return value.astype(np.int64)
+    return value
+
+
+def load_data(data_path: str, upcast: bool = True) -> dict[str, np.ndarray]:
     """Load data from hdf5 file.
 
     Args:
         data_path: The path to the hdf5 file.
+        upcast: Whether to widen compact integer fields to int64. Defaults to True so that
+            existing analysis code keeps the dtypes it was written against.
 
     Returns:
         The loaded data as a dictionary.
     """
     with h5py.File(data_path, "r") as f:
-        return {key: f["/data"][key][()].T for key in f["/data"].keys()}  # type: ignore
+        return {key: read_field(f["/data"][key], upcast).T for key in f["/data"].keys()}  # type: ignore
+
+
+def load_string_tables(data_path: str) -> dict[str, list[str]]:
+    """Load the string tables saved alongside EMBAM data.
+
+    Args:
+        data_path: The path to the hdf5 file.
+
+    Returns:
+        Dictionary from table name to its strings; a 1-indexed id `i` names entry `i - 1`.
+        Empty for files saved without string tables.
+    """
+    with h5py.File(data_path, "r") as f:
+        if "/pools" not in f:
+            return {}
+        return {
+            key: [entry.decode("utf-8") for entry in f["/pools"][key][()]]
+            for key in f["/pools"].keys()
+        }
 
 
-def save_data(data: dict[str, np.ndarray], target_data_path: str):
+def save_data(
+    data: dict[str, np.ndarray],
+    target_data_path: str,
+    string_tables: dict[str, list[str]] | None = None,
+    attrs: dict[str, str | int] | None = None,
+):
     """Save EMBAM-formatted data to hdf5 file.
 
+    Fields are cast with `compact_data` and boolean fields are bit-packed. Each string table
+    (e.g., the item or category pool) is stored once under '/pools' rather than as per-trial
+    object arrays.
+
     Args:
         data: The data to save.
         target_data_path: The path to the hdf5 file.
+        string_tables: Optional pools of strings to store with the data, keyed by name.
+        attrs: Optional file attributes (e.g., from `design_provenance`), written last.
     """
     with h5py.File(target_data_path, "w") as hdf:
         # Create a group named 'data'
         data_group = hdf.create_group("/data")
 
         # Loop through keys in result file and save them under the 'data' group
-        for key, value in data.items():
-            data_group.create_dataset(key, data=value.T)
+        for key, value in compact_data(data).items():
+            if value.dtype == np.bool_:
+                dataset = data_group.create_dataset(key, data=np.packbits(value.T))
+                dataset.attrs["packed_shape"] = value.T.shape
+            else:
+                data_group.create_dataset(key, data=value.T)
+
+        # Store each string table once, alongside the ids that index into it
+        save_string_tables(hdf, string_tables)
+        hdf.attrs.update(attrs or {})
+
+
+def save_string_tables(hdf: h5py.File, string_tables: dict[str, list[str]] | None):
+    """Write string tables under the '/pools' group of an open hdf5 file.
+
+    Args:
+        hdf: The open, writable hdf5 file.
+        string_tables: Pools of strings keyed by name. Nothing is written if empty.
+    """
+    if not string_tables:
+        return
+    pools_group = hdf.create_group("/pools")
+    for key, pool in string_tables.items():
+        pools_group.create_dataset(key, data=list(pool), dtype=h5py.string_dtype("utf-8"))
+
+
+def append_data(
+    data_group: h5py.Group,
+    data: dict[str, np.ndarray],
+    dtypes: dict[str, np.dtype] | None = None,
+    chunk_trials: int = 4096,
+) -> int:
+    """Append EMBAM rows to resizable datasets, creating them on first use.
+
+    Datasets are stored transposed like `save_data`, so each one grows along its trial axis.
+    A dataset's dtype is fixed when it is created: by `dtypes` if given, otherwise by the
+    compact policy widened to fit the first rows appended.
+
+    Args:
+        data_group: The '/data' group of an open, writable hdf5 file.
+        data: EMBAM rows to append; every field must have the same number of rows.
+        dtypes: Optional dtypes for fields whose later values may exceed the first rows.
+        chunk_trials: Number of trials per hdf5 chunk.
+
+    Returns:
+        The number of trials stored after appending.
+
+    Raises:
+        ValueError: If appended values do not fit the dtype a dataset was created with.
+    """
+    dtypes = dtypes or {}
+    trial_count = 0
+    for key, value in compact_data(data).items():
+        value = value.T
+        if key not in data_group:
+            data_group.create_dataset(
+                key,
+                shape=(value.shape[0], 0),
+                maxshape=(value.shape[0], None),
+                chunks=(value.shape[0], chunk_trials),
+                dtype=dtypes.get(key, value.dtype),
+            )
+        dataset = data_group[key]
+        if dataset.dtype.kind in "iu" and value.size > 0:
+            info = np.iinfo(dataset.dtype)
+            if value.min() < info.min or value.max() > info.max:
+                raise ValueError(f"Values for {key} do not fit stored dtype {dataset.dtype}")
+        start = dataset.shape[1]
+        dataset.resize(start + value.shape[1], axis=1)
+        dataset[:, start:] = value
+        trial_count = dataset.shape[1]
+    return trial_count
+
+
+def stream_data(
+    blocks: Iterable[dict[str, np.ndarray]],
+    target_data_path: str,
+    string_tables: dict[str, list[str]] | None = None,
+    dtypes: dict[str, np.dtype] | None = None,
+    chunk_trials: int = 4096,
+    attrs: dict[str, str | int] | None = None,
+) -> int:
+    """Save EMBAM-formatted data to hdf5 file block by block as it is generated.
+
+    Blocks (e.g., one subject's trials) are buffered up to `chunk_trials` rows and then
+    appended with `append_data`, so memory use stays flat however many blocks are written.
+    Boolean fields are stored unpacked.
+
+    Args:
+        blocks: Iterable of EMBAM dictionaries with the same fields and column counts.
+        target_data_path: The path to the hdf5 file.
+        string_tables: Optional pools of strings to store with the data, keyed by name.
+        dtypes: Optional dtypes for fields whose values grow across blocks (e.g., 'subject').
+        chunk_trials: Number of trials buffered per write and stored per hdf5 chunk.
+        attrs: Optional file attributes (e.g., from `design_provenance`), written only once
+            every block has been stored so an interrupted run never looks complete.
+
+    Returns:
+        The number of trials written.
+    """
+    trial_count = 0
+    with h5py.File(target_data_path, "w") as hdf:
+        data_group = hdf.create_group("/data")
+
+        pending: list[dict[str, np.ndarray]] = []
+        pending_trials = 0
+        for block in blocks:
+            pending.append(block)
+            pending_trials += len(next(iter(block.values())))
+            if pending_trials >= chunk_trials:
+                merged = {key: np.concatenate([b[key] for b in pending]) for key in block}
+                trial_count = append_data(data_group, merged, dtypes, chunk_trials)
+                pending, pending_trials = [], 0
+        if pending:
+            merged = {key: np.concatenate([b[key] for b in pending]) for key in pending[0]}
+            trial_count = append_data(data_group, merged, dtypes, chunk_trials)
+
+        save_string_tables(hdf, string_tables)
+        hdf.attrs.update(attrs or {})
+    return trial_count
+
+
+def concat_data(
+    source_paths: list[str], target_data_path: str, chunk_trials: int = 65536
+) -> pd.DataFrame:
+    """Pool EMBAM files into one without loading any of them whole.
+
+    Subjects are renumbered consecutively, file by file in order of first appearance, so
+    ids that restart at 0 in every file never collide. Fields narrower than the widest file
+    (e.g., 'recalls' when subjects recalled fewer items) are padded, as are fields a file
+    lacks, with the field's `EMBAM_PAD_VALUES` entry or 0. Trials are copied in chunks into resizable datasets, so `append_data` can keep
+    growing the pooled file. Boolean fields are stored unpacked.
+
+    Args:
+        source_paths: The paths to the hdf5 files, in pooling order.
+        target_data_path: The path to the pooled hdf5 file.
+        chunk_trials: Number of trials copied at once and stored per hdf5 chunk.
+
+    Returns:
+        One row per subject with its 'source' path, original 'subject' ID, and
+        'pooled_subject' ID in the pooled file.
+
+    Raises:
+        ValueError: If the files store different string tables, so their ids do not agree.
+    """
+    widths: dict[str, int] = {}
+    dtypes: dict[str, np.dtype] = {}
+    source_subjects = []
+    string_tables: dict[str, list[str]] = {}
+    for path in source_paths:
+        with h5py.File(path, "r") as f:
+            for key, dataset in f["/data"].items():
+                packed = "packed_shape" in dataset.attrs
+                width = int(dataset.attrs["packed_shape"][0]) if packed else dataset.shape[0]
+                dtype = np.dtype(bool) if packed else dataset.dtype
+                widths[key] = max(widths.get(key, 0), width)
+                dtypes[key] = np.result_type(dtypes.get(key, dtype), dtype)
+            source_subjects.append(read_field(f["/data"]["subject"]).ravel())
+        tables = load_string_tables(path)
+        if tables and string_tables and tables != string_tables:
+            raise ValueError(f"{path} stores different string tables than the files before it")
+        string_tables = string_tables or tables
+
+    # each file's subjects, in order of first appearance, follow the previous file's
+    subject_maps = []
+    offset = 0
+    for path, subject in zip(source_paths, source_subjects):
+        _, first_index = np.unique(subject, return_index=True)
+        original = subject[np.sort(first_index)]
+        subject_maps.append(
+            pd.DataFrame(
+                {
+                    "source": path,
+                    "subject": original,
+                    "pooled_subject": np.arange(offset, offset + len(original)),
+                }
+            )
+        )
+        offset += len(original)
+    subject_map = pd.concat(subject_maps, ignore_index=True)
+    dtypes["subject"] = embam_dtype("subject", max_value=max(offset - 1, 0))
+
+    pad_values = {key: EMBAM_PAD_VALUES.get(key, 0) for key in widths}
+    for key, pad_value in pad_values.items():
+        if pad_value < 0 and dtypes[key].kind == "u":
+            dtypes[key] = np.result_type(dtypes[key], np.int8)
+
+    total_trials = sum(len(subject) for subject in source_subjects)
+    with h5py.File(target_data_path, "w") as hdf:
+        data_group = hdf.create_group("/data")
+        for key, width in widths.items():
+            data_group.create_dataset(
+                key,
+                shape=(width, total_trials),
+                maxshape=(width, None),
+                chunks=(width, max(min(chunk_trials, total_trials), 1)),
+                dtype=dtypes[key],
+                fillvalue=pad_values[key],
+            )
+
+        start = 0
+        for path, subject, subject_rows in zip(source_paths, source_subjects, subject_maps):
+            pooled_ids = pd.Series(
+                subject_rows["pooled_subject"].to_numpy(), index=subject_rows["subject"]
+            )
+            data_group["subject"][:, start : start + len(subject)] = pooled_ids[subject].to_numpy()
+            with h5py.File(path, "r") as f:
+                for key, dataset in f["/data"].items():
+                    if key == "subject":
+                        continue
+                    target = data_group[key]
+                    if "packed_shape" in dataset.attrs:
+                        # packed flags are small and can only be unpacked whole
+                        value = read_field(dataset, upcast=False)
+                        target[: value.shape[0], start : start + value.shape[1]] = value
+                        continue
+                    for chunk in range(0, dataset.shape[1], chunk_trials):
+                        stop = min(chunk + chunk_trials, dataset.shape[1])
+                        target[: dataset.shape[0], start + chunk : start + stop] = dataset[
+                            :, chunk:stop
+                        ]
+            start += len(subject)
+
+        save_string_tables(hdf, string_tables)
+        hdf.attrs["sources"] = json.dumps(list(source_paths))
+    return subject_map
+
+
+def local_imports(source_path: str) -> list[str]:
+    """Find the modules beside a script that it imports, directly or through each other.
+
+    Args:
+        source_path: Path to the script.
+
+    Returns:
+        Paths of the imported `.py` files in the script's directory, sorted, excluding the
+        script itself.
+    """
+    directory = os.path.dirname(os.path.abspath(source_path))
+    found: set[str] = set()
+    pending = [os.path.abspath(source_path)]
+    while pending:
+        with open(pending.pop(), "r") as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                path = os.path.join(directory, f"{name.split('.')[0]}.py")
+                if os.path.exists(path) and path not in found:
+                    found.add(path)
+                    pending.append(path)
+    found.discard(os.path.abspath(source_path))
+    return sorted(found)
+
+
+def design_provenance(
+    parameters: dict,
+    stimulus_pools: list[list[str]],
+    seed: int,
+    generator_path: str,
+) -> dict[str, str | int]:
+    """Describe the inputs a design is generated from, keyed by a hash of all of them.
+
+    The generator version is the digest of the generator's source file together with every
+    local module it imports (see `local_imports`), so an edit to the script or to the
+    sampling helpers it calls invalidates designs produced earlier.
+
+    Args:
+        parameters: JSON-serializable design parameters (e.g., counts and category labels).
+        stimulus_pools: The stimulus pools the design samples from.
+        seed: The seed both `random` and `np.random` are seeded with.
+        generator_path: Path to the script generating the design (usually `__file__`).
+
+    Returns:
+        File attributes for `save_data`/`stream_data`, including 'design_hash' and the
+        'module_digests' of the imported modules (a JSON object keyed by file name).
+    """
+    source_digests = {}
+    for path in [generator_path, *local_imports(generator_path)]:
+        with open(path, "rb") as f:
+            source_digests[os.path.basename(path)] = hashlib.sha256(f.read()).hexdigest()
+    generator_digest = hashlib.sha256(
+        json.dumps(source_digests, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    pool_digest = hashlib.sha256(json.dumps(stimulus_pools).encode("utf-8")).hexdigest()
+    provenance: dict[str, str | int] = {
+        "parameters": json.dumps(parameters, sort_keys=True),
+        "pool_digest": pool_digest,
+        "seed": seed,
+        "generator": os.path.basename(generator_path),
+        "generator_digest": generator_digest,
+        "module_digests": json.dumps(
+            {
+                name: digest
+                for name, digest in source_digests.items()
+                if name != os.path.basename(generator_path)
+            },
+            sort_keys=True,
+        ),
+    }
+    provenance["design_hash"] = hashlib.sha256(
+        json.dumps(provenance, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return provenance
+
+
+def load_provenance(data_path: str) -> dict[str, str | int]:
+    """Load the attributes recording how a data file was generated.
+
+    Args:
+        data_path: The path to the hdf5 file.
+
+    Returns:
+        The file attributes; empty for files saved without provenance.
+    """
+    with h5py.File(data_path, "r") as f:
+        return {
+            key: value.item() if isinstance(value, np.generic) else value
+            for key, value in f.attrs.items()
+        }
+
+
+def design_is_cached(data_path: str, provenance: dict[str, str | int]) -> bool:
+    """Check whether a data file was already generated from exactly these inputs.
+
+    Args:
+        data_path: The path to the hdf5 file.
+        provenance: Attributes from `design_provenance` for the design about to be generated.
+
+    Returns:
+        True if the file exists and carries the same 'design_hash'.
+    """
+    if not os.path.exists(data_path):
+        return False
+    try:
+        stored = load_provenance(data_path)
+    except OSError:  # unreadable or partially written file
+        return False
+    return stored.get("design_hash") == provenance["design_hash"]
 
 
 def export_to_psifr_long_table(data: dict[str, np.ndarray]) -> pd.DataFrame:
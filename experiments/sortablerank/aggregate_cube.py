@@ -0,0 +1,127 @@
+"""
+Counts and sums of the converted team-building data, aggregated once and cached.
+
+Every pivot table of the analysis is a mean of 'chosen' or 'shared_features' over a few
+grouping columns. Those means can all be derived from one cube holding, for each
+combination of the `CUBE_KEYS` that occurs, the number of rows and the sums of the
+`CUBE_VALUES`, so the table is scanned once by a single groupby and each pivot only
+regroups the much smaller cube. The cube is pickled under a name derived from a hash of
+the table contents, so re-running the analysis on unchanged data skips the groupby.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+CUBE_KEYS = [
+    "condition",
+    "output",
+    "shared_features",
+    "subject_race",
+    "subject_gender",
+    "subject_age",
+    "character_race",
+    "character_gender",
+    "character_age",
+]
+CUBE_VALUES = ["chosen", "shared_features"]
+
+
+def table_digest(data: pd.DataFrame) -> str:
+    """
+    Hash the contents of a table, including its column names and order.
+
+    Args:
+        data: The converted table.
+
+    Returns:
+        The SHA-256 hex digest.
+    """
+    digest = hashlib.sha256("\0".join(data.columns).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def build_cube(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Count rows and sum the values of every combination of cube keys in one groupby.
+
+    Args:
+        data: The converted table, with the `CUBE_KEYS` and `CUBE_VALUES` columns.
+
+    Returns:
+        One row per occurring key combination (missing keys included) with the keys,
+        'count' and a '<value>_sum' column per value.
+    """
+    values = pd.DataFrame(
+        {f"{value}_sum": data[value].to_numpy(dtype=np.float64) for value in CUBE_VALUES}
+    )
+    values["count"] = 1
+    grouped = values.groupby(
+        [data[key].rename(key) for key in CUBE_KEYS], dropna=False, observed=True, sort=True
+    )
+    cube = grouped.sum().reset_index()
+    return cube[[*CUBE_KEYS, "count", *(f"{value}_sum" for value in CUBE_VALUES)]]
+
+
+def load_cube(data: pd.DataFrame, cache_dir: str) -> pd.DataFrame:
+    """
+    Read the cube of a table from the cache, building and saving it if it is missing.
+
+    Args:
+        data: The converted table.
+        cache_dir: Directory of cached cubes.
+
+    Returns:
+        The cube from `build_cube`.
+    """
+    cache_path = os.path.join(cache_dir, f"cube_{table_digest(data)[:16]}.pkl")
+    if os.path.exists(cache_path):
+        return pd.read_pickle(cache_path)
+
+    cube = build_cube(data)
+    os.makedirs(cache_dir, exist_ok=True)
+    partial_path = f"{cache_path}.{os.getpid()}.partial"
+    cube.to_pickle(partial_path)
+    os.replace(partial_path, cache_path)
+    return cube
+
+
+def cube_counts(cube: pd.DataFrame, keys: list[str]) -> pd.Series:
+    """
+    Count the rows of each combination of keys, like `DataFrame.value_counts`.
+
+    Args:
+        cube: The cube from `load_cube`.
+        keys: Cube keys to count by.
+
+    Returns:
+        The 'count' of each combination without missing keys, most frequent first.
+    """
+    counts = cube.groupby(keys, observed=True)["count"].sum()
+    return counts[counts > 0].sort_values(ascending=False, kind="stable")
+
+
+def cube_pivot(
+    cube: pd.DataFrame, index: str, values: str, columns: str | None = None
+) -> pd.DataFrame:
+    """
+    Average a value over one or two keys, like `pd.pivot_table(..., aggfunc='mean')`.
+
+    Args:
+        cube: The cube from `load_cube`.
+        index: Cube key of the rows.
+        values: One of `CUBE_VALUES` to average.
+        columns: Cube key of the columns, if any.
+
+    Returns:
+        The mean of `values` for every combination of keys without missing keys.
+    """
+    keys = [index] if columns is None else [index, columns]
+    totals = cube.groupby(keys, observed=True)[["count", f"{values}_sum"]].sum()
+    means = (totals[f"{values}_sum"] / totals["count"]).rename(values)
+    if columns is None:
+        return means.to_frame()
+    return means.unstack(columns)
@@ -0,0 +1,490 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+
+def load_jsonl(file_path: str) -> list[list[dict]]:
+    """
+    Load and parse a file where each line is a JSON-encoded string representing
+    a participant's response data across trials.
+
+    Args:
+        file_path: Path to the file containing the data.
+
+    Returns:
+        participants_data: Inner lists contain recorded entries for a participant and trial.
+    """
+    participants_data = []
+    with open(file_path, "r") as file:
+        for line in file:
+            try:
+                participant_data = json.loads(line.strip())
+                participants_data.append(participant_data)
+            except json.JSONDecodeError as e:
+                print(f"Error parsing line: {e}")
+    return participants_data
+
+
+def retrieve_conditions(participants_data: list[list[dict]]) -> list[str]:
+    """
+    Retrieve the condition of each participant from the data.
+
+    Args:
+        participants_data: List of lists of dictionaries, where each inner list contains recorded entries for a participant and trial.
+
+    Returns:
+        conditions: Contains the condition of each participant.
+    """
+    conditions = []
+    for participant_data in participants_data:
+        condition = next(
+            (
+                ["Casual", "Competitive"][entry["condition"]]
+                for entry in participant_data
+                if entry.get("condition", None) is not None
+            ),
+            None,
+        )
+        assert condition is not None, "Condition not found for participant"
+        conditions.append(condition)
+    return conditions
+
+
+def retrieve_subj_demographics(participants_data: list[list[dict]]) -> list[tuple]:
+    """
+    Returns the self-reported demographics of each participant.
+
+    Args:
+        participants_data: List of lists of dictionaries, where each inner list contains recorded entries for a participant and trial.
+    """
+
+    full_demographics = []
+    for participant_data in participants_data:
+        demographics = [
+            (
+                entry["response"]["race"],
+                entry["response"]["gender"],
+                int(entry["response"]["age"]),
+                entry["response"]["college"],
+            )
+            for entry in participant_data
+            if type(entry.get("response")) is dict
+            and entry["response"].get("race") is not None
+        ]
+        full_demographics.append(demographics[0])
+    return full_demographics
+
+
+def retrieve_deception(participants_data: list[list[dict]]) -> list[str]:
+    final_rankings = []
+    for participant_data in participants_data:
+        final_ranking = [
+            entry["response"]["deception"]
+            for entry in participant_data
+            if type(entry.get("response")) is dict
+            and entry["response"].get("deception") is not None
+        ]
+        final_rankings.append(final_ranking[0])
+    return final_rankings
+
+
+def retrieve_confidence(participants_data: list[list[dict]]) -> list[int]:
+    """
+    Retrieve participant self rating of their competitive confidence.
+
+    Args:
+        participants_data: List of lists of dictionaries, where each inner list contains recorded entries for a participant and trial.
+
+    Returns:
+        confidence: Inner lists self-rating for each participant
+    """
+    final_rankings = []
+    for participant_data in participants_data:
+        final_ranking = [
+            int(entry["response"])
+            for entry in participant_data
+            if entry.get("stimulus")
+            == "<h2>Rating</h2><p>On a scale from 1–10, how typically successful are you in competitive environments?</p>"
+        ]
+        final_rankings.append(final_ranking)
+    return final_rankings
+
+
+def retrieve_full_ranking(participants_data: list[list[dict]]) -> list[list[dict]]:
+    """
+    Retrieve the final ranking of items from the data.
+
+    Handles both the `sortable-rank` trial, whose teams are listed separately (with locked
+    slots to skip), and the earlier `two-team-sortable-rank` trial, whose `ranked_order`
+    includes the participant's own card, which is dropped along with its rank.
+
+    Args:
+        participants_data: List of lists of dictionaries, where each inner list contains recorded entries for a participant and trial.
+
+    Returns:
+        final_rankings: Inner lists contain the final ranking of items for a participant.
+    """
+    final_rankings = []
+    for participant_data in participants_data:
+        final_ranking = []
+        for entry in participant_data:
+            if entry.get("trial_type") == "two-team-sortable-rank":
+                after_self = False
+                for character in entry["ranked_order"]:
+                    if "user.png" in character["label"]:
+                        after_self = True
+                        continue
+                    if after_self:
+                        character["rank"] = character["rank"] - 1
+                    final_ranking.append(character)
+                break
+            if entry.get("trial_type") == "sortable-rank":
+                rank = 1
+                for character in entry["team_left_items"]:
+                    if character["label"] == "locked":
+                        continue
+                    final_ranking.append(
+                        {
+                            "label": character["label"],
+                            "content": character["content"],
+                            "team": "Your Team",
+                            "rank": rank,
+                            "index": character["index"],
+                        }
+                    )
+                    rank += 1
+
+                for character in entry["team_right_items"]:
+                    final_ranking.append(
+                        {
+                            "label": character["label"],
+                            "content": character["content"],
+                            "team": "Other Team",
+                            "rank": rank,
+                            "index": character["index"],
+                        }
+                    )
+                    rank += 1
+                break
+        final_rankings.append(final_ranking)
+    return final_rankings
+
+
+def retrieve_copeland_ranks(participants_data: list[list[dict]]) -> list[list[int]]:
+    """
+    Tabulate the Copeland score for each item based on forced-choice trials.
+
+    Args:
+        participants_data: List of lists of dictionaries, where each inner list contains recorded entries for a participant and trial.
+
+    Returns:
+        all_scores: Inner lists contain the Copeland score of items for a participant.
+    """
+    all_rankings = []
+    for participant_data in participants_data:
+        counts = {}
+        for entry in participant_data:
+            if entry.get("winner") is not None:
+                winner = entry["winner"]
+                loser = entry["loser"]
+                if winner not in counts:
+                    counts[winner] = [1, 0]
+                else:
+                    counts[winner] = [counts[winner][0] + 1, counts[winner][1]]
+                if loser not in counts:
+                    counts[loser] = [0, 1]
+                else:
+                    counts[loser] = [counts[loser][0], counts[loser][1] + 1]
+        scores = [counts[i][0] - counts[i][1] for i in range(len(counts))]
+        ranking = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        all_rankings.append([each + 1 for each in ranking])
+    return all_rankings
+
+
+def retrieve_choice_ranking(participants_data: list[list[dict]]) -> list[list[dict]]:
+    """Retrieve a copeland ranking of rated characters based on forced-choice trials.
+
+    Args:
+        participants_data: List of lists of dictionaries, where each inner list contains recorded entries for a participant and trial.
+
+    Returns:
+        choice_rankings: Inner lists contain the copeland ranking of items for a participant.
+    """
+    rankings = retrieve_copeland_ranks(participants_data)
+    all_characters = []
+    for participant_index, participant_data in enumerate(participants_data):
+        characters = {}
+        for entry in participant_data:
+            if entry.get("winner") is None:
+                continue
+            left = entry["left_index"]
+            right = entry["right_index"]
+            if left not in characters:
+                characters[left] = {"rank": rankings[participant_index][left], "index": left, "label": entry["left_image"]}
+            if right not in characters:
+                characters[right] = {"rank": rankings[participant_index][right], "index": right, "label": entry["right_image"]}
+        all_characters.append(sorted(characters.values(), key=lambda x: x["rank"]))
+    return all_characters
+
+
+def retrieve_task_ordering(participants_data: list[list[dict]]) -> list[int]:
+    """
+    Retrieve ordering of choice and ranking tasks for each participant.
+    0 = choice task first, 1 = ranking task first.
+    """
+    orderings = []
+    for participant_data in participants_data:
+        for sortable_rank_index, entry in enumerate(participant_data):
+            if entry.get("trial_type") in ("sortable-rank", "two-team-sortable-rank"):
+                break
+        for choice_index, entry in enumerate(participant_data):
+            if entry.get("winner") is not None:
+                break
+        orderings.append(0 if choice_index < sortable_rank_index else 1)
+    return orderings
+
+
+def generate_subject_ids(participants_data: list[list[dict]]) -> list[int]:
+    """
+    Selects unique subject id from item-presentation trials across all participants.
+
+    Args:
+        participants_data: List of lists of dictionaries, where each inner list contains recorded entries for a participant and trial.
+
+    Returns:
+        Contains subject id for a participant and trial combination.
+    """
+    subject_ids = []
+    for subject_id, participant_data in enumerate(participants_data):
+        subject_ids.extend(
+            subject_id
+            for entry in participant_data
+            if entry.get("trial_type") == "item-presentation"
+        )
+    return subject_ids
+
+
+# Lookup tables shared by subject survey answers and character file names, compiled once
+RACES = ["South Asian", "East/Southeast Asian", "Black", "White", "Latino", "Indigenous", "Multiracial", "Other"]
+RACE_CODES = {
+    "South Asian": 0,
+    "south-asian": 0,
+    "East/Southeast Asian": 1,
+    "east-asian": 1,
+    "Black": 2,
+    "black": 2,
+    "White": 3,
+    "white": 3,
+    "Hispanic/Latine/Latinx": 4,
+    "latino": 4,
+    "Indigenous": 5,
+    "Multiracial": 6,
+    "Other": 7,
+}
+GENDERS = ["Man", "Woman", "Non-binary", "Other"]
+GENDER_CODES = {
+    "Man": 0,
+    "male": 0,
+    "man": 0,
+    "Woman": 1,
+    "woman": 1,
+    "female": 1,
+    "Non-binary": 2,
+    "Other": 3,
+}
+AGE_GROUPS = ["18-24", "25-31", "32-38", "39-45", "45+"]
+# first age of every group after the first
+AGE_EDGES = np.array([25, 32, 39, 46])
+
+
+def lookup_codes(values: pd.Series, codes: dict[str, int]) -> np.ndarray:
+    """
+    Map strings to integer codes through a lookup table.
+
+    Args:
+        values: Strings to code.
+        codes: Code of each known string.
+
+    Returns:
+        The code of each value, -1 where the value is not in the table.
+    """
+    return pd.Series(values).map(codes).fillna(-1).to_numpy(dtype=np.int64)
+
+
+def age_codes(ages: np.ndarray) -> np.ndarray:
+    """
+    Bin ages into the indices of `AGE_GROUPS`.
+
+    Args:
+        ages: Ages in years.
+
+    Returns:
+        The age group index of each age.
+    """
+    return np.digitize(np.asarray(ages, dtype=np.int64), AGE_EDGES)
+
+
+def code_labels(codes: np.ndarray, labels: list[str]) -> np.ndarray:
+    """
+    Name codes by their labels, with NaN for unknown (-1) codes.
+
+    Args:
+        codes: Codes indexing `labels`.
+        labels: Label of each code.
+
+    Returns:
+        Object array of labels.
+    """
+    return np.array(labels + [np.nan], dtype=object)[codes]
+
+
+def parse_character_labels(labels: pd.Series) -> pd.DataFrame:
+    """
+    Code the race, gender and age encoded in character image URLs.
+
+    A character's file name reads `<set>_<id>_<race>_<gender>_<age>`. Each distinct URL is
+    parsed once and the codes are spread back to every row.
+
+    Args:
+        labels: Image URL of each ranked character.
+
+    Returns:
+        One row per label with the 'race', 'gender' and 'age' group codes and whether the
+        label names a character ('valid'); codes are -1 where it does not.
+    """
+    row_labels, unique_labels = pd.factorize(pd.Series(labels), sort=False)
+    file_names = pd.Series(unique_labels).str.split("/").str[-1].str.split(".").str[0].str.lower()
+    parts = file_names.str.split("_")
+    valid = (parts.str.len() == 5).to_numpy()
+    ages = pd.to_numeric(parts.str[4].where(valid), errors="coerce").fillna(0)
+    characters = pd.DataFrame(
+        {
+            "race": np.where(valid, lookup_codes(parts.str[2], RACE_CODES), -1),
+            "gender": np.where(valid, lookup_codes(parts.str[3], GENDER_CODES), -1),
+            "age": np.where(valid, age_codes(ages), -1),
+            "valid": valid,
+        }
+    )
+    return characters.iloc[row_labels].reset_index(drop=True)
+
+
+def count_shared_features(subject_codes: pd.DataFrame, character_codes: pd.DataFrame) -> np.ndarray:
+    """
+    Count the demographic features each character shares with its subject.
+
+    Args:
+        subject_codes: 'race', 'gender' and 'age' codes of each row's subject.
+        character_codes: 'race', 'gender' and 'age' codes of each row's character.
+
+    Returns:
+        The number of matching known features (0-3) of each row.
+    """
+    shared = np.zeros(len(subject_codes), dtype=np.int64)
+    for feature in ["race", "gender", "age"]:
+        subject_feature = subject_codes[feature].to_numpy()
+        shared += (subject_feature == character_codes[feature].to_numpy()) & (subject_feature >= 0)
+    return shared
+
+
+def ranking_table(participants_data: list[list[dict]]) -> pd.DataFrame:
+    """
+    List every ranked character of every participant, full rankings before choice rankings.
+
+    Args:
+        participants_data: List of lists of dictionaries, where each inner list contains recorded entries for a participant and trial.
+
+    Returns:
+        One row per ranked character with the 1-indexed 'subject', 'task_type', 'output'
+        (rank), 'chosen' (ranked in the top half of the choice ranking's length) and 'label'.
+    """
+    full_rankings = retrieve_full_ranking(participants_data)
+    choice_rankings = retrieve_choice_ranking(participants_data)
+    rows = []
+    for subject_index, (full_ranking, choice_ranking) in enumerate(zip(full_rankings, choice_rankings)):
+        chosen_threshold = int((len(choice_ranking) - 1) / 2)
+        for task_type, ranking in [("full_ranking", full_ranking), ("choice_ranking", choice_ranking)]:
+            rows.extend(
+                (subject_index + 1, task_type, character["rank"], character["rank"] <= chosen_threshold, character["label"])
+                for character in ranking
+            )
+    return pd.DataFrame(rows, columns=["subject", "task_type", "output", "chosen", "label"])
+
+
+def subject_table(participants_data: list[list[dict]]) -> pd.DataFrame:
+    """
+    Collect one row of condition, task ordering and survey answers per participant.
+
+    Args:
+        participants_data: List of lists of dictionaries, where each inner list contains recorded entries for a participant and trial.
+
+    Returns:
+        One row per 1-indexed 'subject' with 'ordering', 'condition', raw 'race', 'gender'
+        and 'age' answers, 'subj_college', 'self_ability' and 'awareness'.
+    """
+    races, genders, ages, colleges = zip(*retrieve_subj_demographics(participants_data))
+    return pd.DataFrame(
+        {
+            "subject": np.arange(1, len(participants_data) + 1),
+            "ordering": retrieve_task_ordering(participants_data),
+            "condition": retrieve_conditions(participants_data),
+            "race": races,
+            "gender": genders,
+            "age": ages,
+            "subj_college": colleges,
+            "self_ability": [ratings[0] for ratings in retrieve_confidence(participants_data)],
+            "awareness": retrieve_deception(participants_data),
+        }
+    )
+
+
+def convert_pass(participants_data: list[list[dict]]) -> pd.DataFrame:
+    """
+    Convert one pass of the team-building study into one row per ranked character.
+
+    Subject and character demographics are coded once through the lookup tables, and
+    `shared_features` is computed by comparing the code arrays.
+
+    Args:
+        participants_data: List of lists of dictionaries, where each inner list contains recorded entries for a participant and trial.
+
+    Returns:
+        The converted table, with the columns of the `*_pass_data.csv` files.
+    """
+    subjects = subject_table(participants_data)
+    subject_codes = pd.DataFrame(
+        {
+            "race": lookup_codes(subjects["race"], RACE_CODES),
+            "gender": lookup_codes(subjects["gender"], GENDER_CODES),
+            "age": age_codes(subjects["age"]),
+        }
+    )
+
+    rankings = ranking_table(participants_data)
+    character_codes = parse_character_labels(rankings["label"])
+    named = character_codes["valid"].to_numpy()
+    rankings = rankings[named].reset_index(drop=True)
+    character_codes = character_codes[named].reset_index(drop=True)
+    row_subjects = rankings["subject"].to_numpy() - 1
+    row_subject_codes = subject_codes.iloc[row_subjects].reset_index(drop=True)
+
+    return pd.DataFrame(
+        {
+            "subject": rankings["subject"],
+            "task_type": rankings["task_type"],
+            "ordering": subjects["ordering"].to_numpy()[row_subjects],
+            "output": rankings["output"],
+            "chosen": rankings["chosen"],
+            "condition": subjects["condition"].to_numpy()[row_subjects],
+            "subject_race": code_labels(row_subject_codes["race"].to_numpy(), RACES),
+            "subject_age": code_labels(row_subject_codes["age"].to_numpy(), AGE_GROUPS),
+            "subject_gender": code_labels(row_subject_codes["gender"].to_numpy(), GENDERS),
+            "character_race": code_labels(character_codes["race"].to_numpy(), RACES),
+            "character_age": code_labels(character_codes["age"].to_numpy(), AGE_GROUPS),
+            "character_gender": code_labels(character_codes["gender"].to_numpy(), GENDERS),
+            "subj_college": subjects["subj_college"].to_numpy()[row_subjects],
+            "self_ability": subjects["self_ability"].to_numpy()[row_subjects],
+            "awareness": subjects["awareness"].to_numpy()[row_subjects],
+            "shared_features": count_shared_features(row_subject_codes, character_codes),
+        }
+    )
@@ -0,0 +1,213 @@
+# ---
+# jupyter:
+#   jupytext:
+#     cell_metadata_filter: -all
+#     custom_cell_magics: kql
+#     text_representation:
+#       extension: .py
+#       format_name: percent
+#       format_version: '1.3'
+#       jupytext_version: 1.11.2
+#   kernelspec:
+#     display_name: online_experiments
+#     language: python
+#     name: python3
+# ---
+
+# %% [markdown]
+# Ingest every JATOS export of the team-building study in one run. Passes are parsed and
+# converted concurrently in a process pool, tagged with their pass, and participants exported
+# in more than one pass are kept only from the earliest. The combined table is written with
+# categorical columns, as Parquet or as a CSV that `load_passes` reads back with its types.
+
+# %%
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from helpers import AGE_GROUPS, GENDERS, RACES, convert_pass, load_jsonl
+
+# categories of the typed columns; 'pass' takes its categories from the ingested passes
+CATEGORIES = {
+    "task_type": ["full_ranking", "choice_ranking"],
+    "condition": ["Casual", "Competitive"],
+    "subject_race": RACES,
+    "subject_age": AGE_GROUPS,
+    "subject_gender": GENDERS,
+    "character_race": RACES,
+    "character_age": AGE_GROUPS,
+    "character_gender": GENDERS,
+}
+# survey answers whose categories are whatever was answered
+ANSWER_COLUMNS = ["subj_college", "awareness"]
+ORDERED_COLUMNS = {"subject_age", "character_age"}
+INTEGER_COLUMNS = [
+    "subject", "pass_subject", "ordering", "output", "self_ability", "shared_features"
+]
+
+
+def participant_fingerprint(participant_data: list[dict]) -> str:
+    """
+    Identify a participant's session by the SHA-256 of its recorded entries.
+
+    Exports carry no participant ID, so a session exported in several passes is recognized
+    by its content, serialized with sorted keys so key order does not matter.
+
+    Args:
+        participant_data: The recorded entries of one participant.
+
+    Returns:
+        The hex digest.
+    """
+    serialized = json.dumps(participant_data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def ingest_pass(jatos_data_path: str) -> tuple[pd.DataFrame, list[str]]:
+    """
+    Parse and convert one JATOS export.
+
+    Args:
+        jatos_data_path: The path to the JSONL export of a pass.
+
+    Returns:
+        A tuple containing the table from `convert_pass` and the fingerprint of each
+        participant, in the order of the 'subject' numbers of the table.
+    """
+    participants_data = load_jsonl(jatos_data_path)
+    fingerprints = [
+        participant_fingerprint(participant_data) for participant_data in participants_data
+    ]
+    return convert_pass(participants_data), fingerprints
+
+
+def type_columns(table: pd.DataFrame, pass_names: list[str]) -> pd.DataFrame:
+    """
+    Give the combined table its categorical, boolean and integer column types.
+
+    Args:
+        table: Combined table from `ingest_passes`, typed or not (e.g. as read from CSV).
+        pass_names: Pass names in ingestion order, the categories of 'pass'.
+
+    Returns:
+        The typed table.
+    """
+    table = table.copy()
+    categories = dict(CATEGORIES, **{"pass": pass_names})
+    for column, values in categories.items():
+        table[column] = pd.Categorical(
+            table[column], categories=values, ordered=column in ORDERED_COLUMNS
+        )
+    table[ANSWER_COLUMNS] = table[ANSWER_COLUMNS].astype("category")
+    table["chosen"] = table["chosen"].astype(bool)
+    table[INTEGER_COLUMNS] = table[INTEGER_COLUMNS].astype("int64")
+    return table
+
+
+def ingest_passes(pass_paths: dict[str, str], processes: int | None = None) -> pd.DataFrame:
+    """
+    Convert every pass in a process pool and combine them, dropping repeated participants.
+
+    Args:
+        pass_paths: JSONL export of each pass, keyed by pass name in the order they were run.
+        processes: Worker processes; defaults to the CPU count, and 1 runs in this process.
+
+    Returns:
+        The rows of every pass with the `convert_pass` columns, where 'subject' numbers
+        participants across all passes, plus the 'pass' and the participant's 1-indexed
+        'pass_subject' number within it. A participant whose session already appeared in an
+        earlier pass is dropped.
+    """
+    paths = list(pass_paths.values())
+    if processes == 1:
+        results = list(map(ingest_pass, paths))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(ingest_pass, paths))
+
+    seen = set()
+    tables = []
+    subject_count = 0
+    for pass_name, (table, fingerprints) in zip(pass_paths, results):
+        new_subjects = []
+        for pass_subject, fingerprint in enumerate(fingerprints, start=1):
+            if fingerprint not in seen:
+                seen.add(fingerprint)
+                new_subjects.append(pass_subject)
+        table = table[table["subject"].isin(new_subjects)]
+        # number the new participants after those of earlier passes
+        subjects = {
+            pass_subject: subject_count + number
+            for number, pass_subject in enumerate(new_subjects, start=1)
+        }
+        subject_count += len(new_subjects)
+        tables.append(
+            table.assign(
+                **{
+                    "pass": pass_name,
+                    "pass_subject": table["subject"],
+                    "subject": table["subject"].map(subjects),
+                }
+            )
+        )
+
+    combined = pd.concat(tables, ignore_index=True)
+    leading = ["pass", "pass_subject", "subject"]
+    combined = combined[leading + [column for column in combined if column not in leading]]
+    return type_columns(combined, list(pass_paths))
+
+
+def save_passes(table: pd.DataFrame, target_data_path: str) -> None:
+    """
+    Write the combined table as Parquet (for a `.parquet` path) or CSV.
+
+    Parquet keeps the column types itself and needs pyarrow or fastparquet; CSV types are
+    restored by `load_passes`.
+
+    Args:
+        table: Combined table from `ingest_passes`.
+        target_data_path: The path to write.
+    """
+    if os.path.splitext(target_data_path)[1] == ".parquet":
+        table.to_parquet(target_data_path, index=False)
+    else:
+        table.to_csv(target_data_path, index=False)
+
+
+def load_passes(data_path: str) -> pd.DataFrame:
+    """
+    Read a combined table written by `save_passes`, with its column types.
+
+    Args:
+        data_path: The path to a `.parquet` or CSV file.
+
+    Returns:
+        The typed table.
+    """
+    if os.path.splitext(data_path)[1] == ".parquet":
+        return pd.read_parquet(data_path)
+    table = pd.read_csv(data_path)
+    return type_columns(table, list(pd.unique(table["pass"])))
+
+
+# %%
+if __name__ == "__main__":
+    pass_paths = {
+        "first": "experiments/sortablerank/first_pass.jsonl",
+        "second": "experiments/sortablerank/second_pass.jsonl",
+        "third": "experiments/sortablerank/third_pass.jsonl",
+        "fourth": "experiments/sortablerank/fourth_pass.jsonl",
+        "fifth": "experiments/sortablerank/fifth_pass.jsonl",
+    }
+    processes = None  # one worker per CPU
+    target_data_path = "experiments/sortablerank/all_passes_data.csv"
+
+    start = time.perf_counter()
+    data = ingest_passes(pass_paths, processes)
+    save_passes(data, target_data_path)
+    elapsed = time.perf_counter() - start
+    print(f"Ingested {data['subject'].nunique()} participants in {elapsed:.1f} s")
+    print(data.groupby("pass", observed=True)["subject"].nunique().to_string())